@@ -1,24 +1,299 @@
-import google.generativeai as genai
 import os
 import json
 import re
+import time
+import hashlib
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
+from config import Config
+from rate_limiter import RateGovernor, RunStopped, estimate_tokens, sleep_unless_stopped, stop_on
+from retry_policy import (
+    FATAL, RETRYABLE, THROTTLED, LLMCallError, RetryBudget, RetryBudgetExhausted,
+    backoff_delay, classify_error
+)
+from circuit_breaker import CLOSED, CircuitBreaker, CircuitOpenError
+from grade_cache import GradeCache, make_cache_key
+from fingerprint import group_submissions
+from context_cache import PromptContext
+from llm_providers import get_provider
+from grade_parser import GradeParseError, parse_grade, parse_json_lenient
+from token_budget import plan_submission, trim_source
+from pregrade import PregradeDecision, parse_policy, pregrade_file
+from single_flight import SingleFlight
+import call_metrics
+import progress_events
+from sandbox import SandboxLimits, available as sandbox_available, normalize_output, run_submission, run_submissions
 
 # Load .env file from the parent directory (project root)
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
 
-# Configuration flag to force mock responses (set to True when API quota is exceeded)
-FORCE_MOCK_RESPONSES = False  # Set to True to use mock responses instead of API calls
+# Every model call goes through this provider (Config.LLM_PROVIDER: 'gemini' or 'offline')
+if Config.LLM_PROVIDER == 'offline':
+    llm_provider = get_provider(
+        'offline',
+        latency_seconds=Config.OFFLINE_LLM_LATENCY_SECONDS,
+        error_rate=Config.OFFLINE_LLM_ERROR_RATE,
+        error_kind=Config.OFFLINE_LLM_ERROR_KIND,
+        seed=Config.OFFLINE_LLM_SEED
+    )
+else:
+    llm_provider = get_provider(Config.LLM_PROVIDER, api_key=os.getenv('GEMINI_API_KEY'), model_name=Config.GEMINI_MODEL)
+
+# Bump whenever the grading prompt changes so cached grades are not reused
+GRADING_PROMPT_VERSION = "grade-v2"
+HYBRID_GRADING_PROMPT_VERSION = "hybrid-v1"
+BATCH_GRADING_PROMPT_VERSION = "batch-v1"
+
+grade_cache = GradeCache(Config.GRADE_CACHE_PATH) if Config.GRADE_CACHE_ENABLED else None
+
+# Uploads static prompt prefixes as provider-side cached context
+context_cache_client = llm_provider
+
+# Shared by every generate_content call in this process
+rate_governor = RateGovernor(
+    requests_per_minute=Config.GEMINI_REQUESTS_PER_MINUTE,
+    tokens_per_minute=Config.GEMINI_TOKENS_PER_MINUTE,
+    initial_concurrency=Config.GEMINI_INITIAL_CONCURRENCY,
+    max_concurrency=Config.GEMINI_MAX_CONCURRENCY
+)
+
+# Coalesces identical concurrent grading and solution requests (Config.SINGLE_FLIGHT_*)
+single_flight = None
+if Config.SINGLE_FLIGHT_ENABLED:
+    single_flight = SingleFlight(
+        Config.SINGLE_FLIGHT_LOCK_DIR if Config.SINGLE_FLIGHT_CROSS_PROCESS else None,
+        lock_timeout=Config.SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS
+    )
+
+# Fails calls fast while the provider is down
+circuit_breaker = CircuitBreaker(
+    failure_threshold=Config.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout_seconds=Config.CIRCUIT_BREAKER_RESET_SECONDS,
+    name=llm_provider.name
+)
+
+class ThrottledError(LLMCallError):
+    """Raised when the provider keeps throttling after all throttle retries"""
+    pass
+
+def _usage_tokens(response):
+    """Total tokens reported by Gemini for a response, if available"""
+    usage = getattr(response, 'usage_metadata', None)
+    return getattr(usage, 'total_token_count', None) if usage else None
+
+def generate_content(model, prompt, expected_output_tokens=500, generation_config=None,
+                     timeout=None, retry_budget=None, purpose="grade"):
+    """
+    Call model.generate_content with a deadline, through the shared rate governor.
+    
+    Errors are classified (retry_policy.classify_error). Fatal errors are raised
+    immediately as LLMCallError. Timeouts and 5xx responses are retried up to
+    Config.LLM_MAX_RETRIES times and throttled calls (429 / quota) up to
+    Config.GEMINI_MAX_THROTTLE_RETRIES times, each after a capped exponential
+    backoff with full jitter. Every retry is charged to retry_budget when one
+    is given, so a bad run cannot amplify an outage.
+    
+    Timeouts and 5xx responses also count towards the shared circuit breaker;
+    while it is open, calls raise CircuitOpenError without reaching the API.
+    
+    Every call, successful or not, is reported to call_metrics with its queue
+    wait, latency, tokens and retries.
+    
+    Args:
+        model: Gemini model (or stand-in) to call
+        prompt (str): Prompt text
+        expected_output_tokens (int): Output estimate for the TPM budget
+        generation_config (dict): Passed through to generate_content
+        timeout (float): Per-call deadline in seconds
+            (defaults to Config.LLM_CALL_TIMEOUT_SECONDS)
+        retry_budget (RetryBudget): Retries shared by the whole run (optional)
+        purpose (str): Label for call_metrics ('grade', 'batch', 'chunk', ...)
+    """
+    timing = {"queue_wait": 0.0, "latency": 0.0, "retries": 0}
+    started = time.perf_counter()
+    try:
+        response = _generate_content_with_retries(
+            model, prompt, expected_output_tokens, generation_config, timeout, retry_budget, timing
+        )
+    except Exception as e:
+        call_metrics.record(
+            purpose, llm_provider.model_name, status="error",
+            queue_wait_seconds=timing["queue_wait"], latency_seconds=timing["latency"],
+            total_seconds=time.perf_counter() - started, retries=timing["retries"],
+            error=type(e).__name__
+        )
+        raise
+    usage = getattr(response, 'usage_metadata', None)
+    cached_tokens = getattr(usage, 'cached_content_token_count', None) or 0
+    call_metrics.record(
+        purpose, llm_provider.model_name,
+        queue_wait_seconds=timing["queue_wait"], latency_seconds=timing["latency"],
+        total_seconds=time.perf_counter() - started,
+        prompt_tokens=getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt),
+        output_tokens=getattr(usage, 'candidates_token_count', None) or estimate_tokens(_response_text(response)),
+        cached_tokens=cached_tokens, retries=timing["retries"], context_cached=cached_tokens > 0
+    )
+    return response
+
+def _generate_content_with_retries(model, prompt, expected_output_tokens, generation_config, timeout,
+                                   retry_budget, timing):
+    """generate_content() without the instrumentation; fills timing as it goes"""
+    kwargs = {"generation_config": generation_config} if generation_config else {}
+    kwargs["request_options"] = {"timeout": timeout or Config.LLM_CALL_TIMEOUT_SECONDS}
+    estimated_tokens = estimate_tokens(prompt) + expected_output_tokens
+    retries = {THROTTLED: 0, RETRYABLE: 0}
+    max_retries = {THROTTLED: Config.GEMINI_MAX_THROTTLE_RETRIES, RETRYABLE: Config.LLM_MAX_RETRIES}
+    while True:
+        if not circuit_breaker.allow_request():
+            raise CircuitOpenError("AI provider unavailable (circuit open)")
+        try:
+            with rate_governor.slot(estimated_tokens) as reservation:
+                timing["queue_wait"] += reservation.wait_seconds
+                request_started = time.perf_counter()
+                try:
+                    response = model.generate_content(prompt, **kwargs)
+                finally:
+                    timing["latency"] = time.perf_counter() - request_started
+                reservation.record_usage(_usage_tokens(response))
+            circuit_breaker.record_success()
+            return response
+        except Exception as e:
+            kind = classify_error(e)
+            attempts = sum(retries.values()) + 1
+            if kind == RETRYABLE:
+                circuit_breaker.record_failure()
+            else:
+                # Throttles and client errors still mean the provider is up
+                circuit_breaker.record_success()
+            if kind == FATAL:
+                raise LLMCallError(f"LLM call failed: {e}", kind=FATAL, attempts=attempts) from e
+            if circuit_breaker.state != CLOSED:
+                raise CircuitOpenError(f"AI provider unavailable (circuit open): {e}") from e
+            
+            retries[kind] += 1
+            timing["retries"] = sum(retries.values())
+            if retries[kind] > max_retries[kind]:
+                error_class = ThrottledError if kind == THROTTLED else LLMCallError
+                raise error_class(f"LLM call still failing after {attempts} attempts: {e}", kind=kind, attempts=attempts) from e
+            if retry_budget is not None and not retry_budget.try_spend():
+                raise RetryBudgetExhausted(f"Run retry budget of {retry_budget.max_retries} exhausted: {e}") from e
+            
+            delay = backoff_delay(retries[kind], Config.LLM_BACKOFF_BASE_SECONDS, Config.LLM_BACKOFF_MAX_SECONDS)
+            print(f"🔁 DEBUG: {kind} error ({e}); retry {retries[kind]}/{max_retries[kind]} in {delay:.1f}s", flush=True)
+            sleep_unless_stopped(delay)
+
+def _response_text(response):
+    return response.candidates[0].content.parts[0].text.strip()
 
-# Only configure API if not forcing mock responses
-if not FORCE_MOCK_RESPONSES:
-    genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+# Prompt/output tokens per grading mode, so batch and single modes can be compared
+_token_stats_lock = threading.Lock()
+_token_stats = {
+    mode: {"calls": 0, "submissions": 0, "prompt_tokens": 0, "output_tokens": 0}
+    for mode in ("single", "batch", "hybrid")
+}
+
+def _record_token_usage(mode, response, prompt):
+    """Count the tokens of one LLM call, including calls whose output is discarded"""
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt)
+    output_tokens = getattr(usage, 'candidates_token_count', None) or estimate_tokens(_response_text(response))
+    with _token_stats_lock:
+        stats = _token_stats[mode]
+        stats["calls"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["output_tokens"] += output_tokens
+
+def _record_graded(mode, submissions):
+    with _token_stats_lock:
+        _token_stats[mode]["submissions"] += submissions
+
+# Structured-output response schemas for grading calls
+GRADE_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "number"},
+        "feedback": {"type": "string"}
+    },
+    "required": ["score", "feedback"]
+}
+
+BATCH_GRADE_RESPONSE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "student": {"type": "string"},
+            "score": {"type": "number"},
+            "feedback": {"type": "string"}
+        },
+        "required": ["student", "score", "feedback"]
+    }
+}
+
+def _json_generation_config(schema):
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+# How often the old regex + json.loads parsing would have failed (each
+# failure used to trigger a re-call) versus how often we still re-call
+_parse_stats_lock = threading.Lock()
+_parse_stats = {"responses": 0, "submissions": 0, "legacy_failures": 0, "repaired": 0, "recalls": 0}
+
+def _legacy_parse_ok(text, expect='object'):
+    """Whether the pre-structured-output parser would have accepted a response"""
+    pattern = r'\{[^{}]*"score"[^{}]*"feedback"[^{}]*\}' if expect == 'object' else r'\[.*\]'
+    match = re.search(pattern, text, re.DOTALL)
+    try:
+        json.loads(match.group(0) if match else text)
+        return True
+    except ValueError:
+        return False
+
+def _record_parse(field, count=1):
+    with _parse_stats_lock:
+        _parse_stats[field] += count
+
+def get_parse_stats():
+    """Response parsing counters, with re-call rates per 100 submissions"""
+    with _parse_stats_lock:
+        stats = dict(_parse_stats)
+    submissions = stats["submissions"]
+    stats["legacy_recalls_per_100"] = round(100 * stats["legacy_failures"] / submissions, 2) if submissions else None
+    stats["recalls_per_100"] = round(100 * stats["recalls"] / submissions, 2) if submissions else None
+    return stats
+
+def token_stats_since(before):
+    """Per-mode usage between an earlier get_token_stats() snapshot and now"""
+    after = get_token_stats()
+    usage = {}
+    for mode, stats in after.items():
+        delta = {
+            field: stats[field] - before.get(mode, {}).get(field, 0)
+            for field in ("calls", "submissions", "prompt_tokens", "output_tokens")
+        }
+        total = delta["prompt_tokens"] + delta["output_tokens"]
+        delta["tokens_per_submission"] = round(total / delta["submissions"], 1) if delta["submissions"] else None
+        usage[mode] = delta
+    return usage
+
+def get_token_stats():
+    """Token usage per grading mode, including tokens per graded submission"""
+    with _token_stats_lock:
+        summary = {}
+        for mode, stats in _token_stats.items():
+            total = stats["prompt_tokens"] + stats["output_tokens"]
+            summary[mode] = {
+                **stats,
+                "tokens_per_submission": round(total / stats["submissions"], 1) if stats["submissions"] else None
+            }
+        return summary
 
 def test_gemini():
     """Test if Gemini API key is working correctly"""
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content("Which company created the iphone?")
+        model = llm_provider.model()
+        response = generate_content(model, "Which company created the iphone?")
         
         print("✅ Gemini API is working!")
         print(f"Response: {response.candidates[0].content.parts[0].text}")
@@ -170,39 +445,8 @@ def main():
 if __name__ == "__main__":
     main()"""
 
-def generate_solution(assignment_description, rubric, max_points):
-    """
-    Generate a reference solution for a coding assignment.
-    
-    Args:
-        assignment_description (str): Description of the assignment
-        rubric (str): Grading rubric/criteria
-        max_points (int): Maximum points for the assignment
-    
-    Returns:
-        str: Python code as a string
-    """
-    # Check if we should force mock responses
-    if FORCE_MOCK_RESPONSES:
-        print("🔄 DEBUG: Using mock response for demonstration (FORCE_MOCK_RESPONSES=True)...")
-        return generate_mock_solution(assignment_description, rubric, max_points)
-    
-    # Check if API quota is exceeded - use mock response
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        # Debug: Print the assignment content being sent to AI
-        print(f"🔍 DEBUG: Assignment content being sent to AI:")
-        print(f"Content: {assignment_description[:500]}...")
-        print(f"Content length: {len(assignment_description)}")
-    except Exception as e:
-        print(f"⚠️ DEBUG: API quota exceeded or error: {e}")
-        print("🔄 DEBUG: Using mock response for demonstration...")
-        return generate_mock_solution(assignment_description, rubric, max_points)
-    
-    # If we get here, API is working, proceed with normal generation
-    try:
-        prompt = f"""You are an expert programming instructor. Generate a SIMPLE, DIRECT solution based on the ACTUAL ASSIGNMENT CONTENT provided below.
+def _solution_prompt(assignment_description, rubric, max_points):
+    return f"""You are an expert programming instructor. Generate a SIMPLE, DIRECT solution based on the ACTUAL ASSIGNMENT CONTENT provided below.
 
 CRITICAL INSTRUCTIONS:
 - Focus on the ASSIGNMENT CONTENT FROM UPLOADED FILE (if present) - this is the primary source
@@ -235,15 +479,53 @@ IMPORTANT:
 - The assignment title is just for reference - focus on the actual content and requirements
 
 Generate the Python solution:"""
+
+def _clean_solution(code):
+    """Strip the markdown code fence the model sometimes wraps the solution in"""
+    code = code.strip()
+    if code.startswith('```python'):
+        code = code.split('```python')[1].split('```')[0].strip()
+    elif code.startswith('```'):
+        code = code.split('```')[1].split('```')[0].strip()
+    return code
+
+def generate_solution(assignment_description, rubric, max_points, fallback_to_mock=True):
+    """
+    Generate a reference solution for a coding assignment.
+    
+    Args:
+        assignment_description (str): Description of the assignment
+        rubric (str): Grading rubric/criteria
+        max_points (int): Maximum points for the assignment
+        fallback_to_mock (bool): Return a mock solution instead of raising
+            when the API call fails
+    
+    Returns:
+        str: Python code as a string
+    """
+    try:
+        model = llm_provider.model()
         
-        response = model.generate_content(prompt)
-        code = response.candidates[0].content.parts[0].text.strip()
+        # Debug: Print the assignment content being sent to AI
+        print(f"🔍 DEBUG: Assignment content being sent to AI:")
+        print(f"Content: {assignment_description[:500]}...")
+        print(f"Content length: {len(assignment_description)}")
+    except Exception as e:
+        print(f"⚠️ DEBUG: API quota exceeded or error: {e}")
+        print("🔄 DEBUG: Using mock response for demonstration...")
+        return generate_mock_solution(assignment_description, rubric, max_points)
+    
+    # If we get here, API is working, proceed with normal generation
+    try:
+        prompt = _solution_prompt(assignment_description, rubric, max_points)
         
-        # Clean up markdown code blocks if present
-        if code.startswith('```python'):
-            code = code.split('```python')[1].split('```')[0].strip()
-        elif code.startswith('```'):
-            code = code.split('```')[1].split('```')[0].strip()
+        response = generate_content(
+            model, prompt,
+            expected_output_tokens=2000,
+            timeout=Config.LLM_SOLUTION_TIMEOUT_SECONDS,
+            purpose="solution"
+        )
+        code = _clean_solution(response.candidates[0].content.parts[0].text)
         
         # Debug: Print the generated solution
         print(f"🤖 DEBUG: Generated solution preview:")
@@ -253,88 +535,281 @@ Generate the Python solution:"""
         return code
     except Exception as e:
         print(f"⚠️ DEBUG: API call failed: {e}")
+        if not fallback_to_mock:
+            raise
         print("🔄 DEBUG: Falling back to mock solution...")
         return generate_mock_solution(assignment_description, rubric, max_points)
 
-def grade_submission_mock(student_code, assignment_description, rubric, reference_solution, max_points):
-    """
-    Mock grading function for demonstration when API quota is exceeded.
+def _sha256(text):
+    return hashlib.sha256((text or "").encode('utf-8')).hexdigest()
+
+def load_assignment_content(assignment):
     """
-    print("🤖 DEBUG: Using mock grading for demonstration...")
-    
-    # Simple mock grading logic
-    import random
+    Assignment text shared by solution generation and grading.
     
-    # Check for basic Python syntax
-    if "def " in student_code and "main()" in student_code:
-        base_score = 60
-    elif "print(" in student_code:
-        base_score = 40
-    else:
-        base_score = 20
-    
-    # Add some randomness for demonstration
-    score = base_score + random.randint(-10, 20)
-    score = max(0, min(score, max_points))
-    
-    # Generate mock feedback
-    if score >= 80:
-        feedback = "Excellent work! Code is well-structured and meets requirements."
-    elif score >= 60:
-        feedback = "Good work! Code runs but could use some improvements."
-    elif score >= 40:
-        feedback = "Needs improvement. Code has some issues but shows understanding."
-    else:
-        feedback = "Requires significant work. Please review the requirements and try again."
-    
-    return {
-        "score": score,
-        "feedback": feedback,
-        "status": "graded"
-    }
+    Uses the uploaded question file when there is one, so the solution the
+    professor reviews and the one used for grading come from the same input.
+    """
+    if assignment.question_file_path:
+        # Import here to avoid circular imports
+        from routes import extract_assignment_content_from_file
+        return extract_assignment_content_from_file(
+            assignment.question_file_path,
+            assignment.title,
+            assignment.description
+        )
+    return assignment.description or "Code assignment"
 
-def grade_submission(student_code, assignment_description, rubric, reference_solution, max_points):
+def get_reference_solution(assignment, rubric, max_points, assignment_content=None, regenerate=False):
     """
-    Grade a single student submission.
+    Return the stored reference solution for an assignment.
+    
+    A new version is generated and persisted only when the question content,
+    rubric, max points or model changed (or regenerate=True). Mock fallback
+    solutions are returned but never persisted. Concurrent requests for the
+    same solution, in this or another worker process, wait for the first
+    one and share its result.
     
     Args:
-        student_code (str): The student's code
-        assignment_description (str): Description of the assignment
+        assignment (Assignment): The assignment being graded
         rubric (str): Grading rubric/criteria
-        reference_solution (str): Reference solution code
         max_points (int): Maximum points for the assignment
+        assignment_content (str): Pre-extracted question content (optional)
+        regenerate (bool): Ignore any stored solution
     
     Returns:
-        dict: {"score": float, "feedback": str, "status": str}
+        tuple: (solution text, ReferenceSolution or None, reused flag)
     """
-    # Check if we should force mock responses
-    if FORCE_MOCK_RESPONSES:
-        print("🔄 DEBUG: Using mock grading for demonstration (FORCE_MOCK_RESPONSES=True)...")
-        return grade_submission_mock(student_code, assignment_description, rubric, reference_solution, max_points)
+    from models import ReferenceSolution
     
-    # Check if API quota is exceeded - use mock grading
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-    except Exception as e:
-        print(f"⚠️ DEBUG: API quota exceeded for grading: {e}")
-        print("🔄 DEBUG: Using mock grading for demonstration...")
-        return grade_submission_mock(student_code, assignment_description, rubric, reference_solution, max_points)
+    if assignment_content is None:
+        assignment_content = load_assignment_content(assignment)
+    
+    existing = find_reference_solution(assignment, assignment_content, rubric, max_points)
+    if existing and not regenerate:
+        print(f"♻️ DEBUG: Reusing reference solution v{existing.version} for assignment {assignment.id}")
+        return existing.solution, existing, True
+    known_version = existing.version if existing else 0
+    
+    def stored_meanwhile():
+        # A version another worker process stored while this one waited
+        latest = find_reference_solution(assignment, assignment_content, rubric, max_points)
+        if latest and latest.version > known_version:
+            return latest.solution, latest.id
+        return None
+    
+    def generate():
+        # Returns the ReferenceSolution id: ORM objects stay in the session of the thread that loaded them
+        try:
+            solution = generate_solution(assignment_content, rubric, max_points, fallback_to_mock=False)
+        except Exception as e:
+            print(f"🔄 DEBUG: Using unsaved mock solution after error: {e}")
+            return generate_mock_solution(assignment_content, rubric, max_points), None
+        return solution, store_reference_solution(assignment, solution, assignment_content, rubric, max_points).id
+    
+    if single_flight is None:
+        (solution, reference_id), shared = generate(), False
+    else:
+        key = _solution_flight_key(assignment, assignment_content, rubric, max_points, known_version)
+        (solution, reference_id), shared = single_flight.do(key, generate, recheck=stored_meanwhile)
+        if shared:
+            print(f"🤝 DEBUG: Shared a concurrent reference solution request for assignment {assignment.id}")
+            call_metrics.record("solution", llm_provider.model_name, status="coalesced")
     
-    prompt = f"""You are a fair programming grader. Grade this student submission.
+    reference = ReferenceSolution.query.get(reference_id) if reference_id else None
+    return solution, reference, shared
 
-Assignment:
-{assignment_description}
+def _solution_flight_key(assignment, assignment_content, rubric, max_points, known_version):
+    """single_flight key shared by streamed and non-streamed generation of the same solution"""
+    return "solution:" + _sha256(json.dumps([
+        assignment.id, _sha256(assignment_content), (rubric or "").strip(), max_points,
+        llm_provider.model_name, known_version
+    ]))
 
-Grading Rubric:
-{rubric}
+def find_reference_solution(assignment, assignment_content, rubric, max_points):
+    """Latest stored ReferenceSolution for these inputs and the current model, or None"""
+    from models import ReferenceSolution
+    
+    return ReferenceSolution.query.filter_by(
+        assignment_id=assignment.id,
+        content_hash=_sha256(assignment_content),
+        rubric_hash=_sha256(f"{(rubric or '').strip()}\n{max_points}"),
+        model_name=llm_provider.model_name
+    ).order_by(ReferenceSolution.version.desc()).first()
 
-Reference Solution:
-{reference_solution}
+def store_reference_solution(assignment, solution, assignment_content, rubric, max_points):
+    """Persist solution as the next ReferenceSolution version of the assignment"""
+    from models import db, ReferenceSolution
+    
+    latest_version = db.session.query(db.func.max(ReferenceSolution.version)).filter_by(
+        assignment_id=assignment.id
+    ).scalar() or 0
+    reference = ReferenceSolution(
+        assignment_id=assignment.id,
+        version=latest_version + 1,
+        content_hash=_sha256(assignment_content),
+        rubric_hash=_sha256(f"{(rubric or '').strip()}\n{max_points}"),
+        solution=solution,
+        model_name=llm_provider.model_name
+    )
+    db.session.add(reference)
+    db.session.commit()
+    print(f"💾 DEBUG: Stored reference solution v{reference.version} for assignment {assignment.id}")
+    return reference
 
-Student Submission:
-{student_code}
+def stream_solution(assignment_description, rubric, max_points):
+    """
+    Generate a reference solution, yielding text as the model produces it.
+    
+    Goes through the rate governor and circuit breaker like generate_content,
+    and is reported to call_metrics the same way, but is not retried: once
+    text has been relayed a retry would repeat it.
+    
+    Yields:
+        str: Text deltas; join them and pass to _clean_solution for the code
+    """
+    prompt = _solution_prompt(assignment_description, rubric, max_points)
+    model = llm_provider.model()
+    timing = {"queue_wait": 0.0, "latency": 0.0}
+    started = time.perf_counter()
+    parts = []
+    usage = None
+    try:
+        if not circuit_breaker.allow_request():
+            raise CircuitOpenError("AI provider unavailable (circuit open)")
+        with rate_governor.slot(estimate_tokens(prompt) + 2000) as reservation:
+            timing["queue_wait"] = reservation.wait_seconds
+            request_started = time.perf_counter()
+            received = False
+            try:
+                stream = model.generate_content(
+                    prompt,
+                    stream=True,
+                    request_options={"timeout": Config.LLM_SOLUTION_TIMEOUT_SECONDS}
+                )
+                for chunk in stream:
+                    if not received:
+                        received = True
+                        circuit_breaker.record_success()
+                    # The last chunk carries the usage of the whole response
+                    usage = getattr(chunk, 'usage_metadata', None) or usage
+                    text = chunk.text
+                    if text:
+                        parts.append(text)
+                        yield text
+            except Exception as e:
+                if classify_error(e) == RETRYABLE:
+                    circuit_breaker.record_failure()
+                elif not received:
+                    circuit_breaker.record_success()
+                raise
+            finally:
+                timing["latency"] = time.perf_counter() - request_started
+            reservation.record_usage(getattr(usage, 'total_token_count', None))
+            if not received:
+                circuit_breaker.record_success()
+    except Exception as e:
+        call_metrics.record(
+            "solution", llm_provider.model_name, status="error",
+            queue_wait_seconds=timing["queue_wait"], latency_seconds=timing["latency"],
+            total_seconds=time.perf_counter() - started, error=type(e).__name__
+        )
+        raise
+    call_metrics.record(
+        "solution", llm_provider.model_name,
+        queue_wait_seconds=timing["queue_wait"], latency_seconds=timing["latency"],
+        total_seconds=time.perf_counter() - started,
+        prompt_tokens=getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt),
+        output_tokens=getattr(usage, 'candidates_token_count', None) or estimate_tokens("".join(parts))
+    )
 
-Maximum Points: {max_points}
+def stream_reference_solution(assignment, rubric, max_points, assignment_content=None, regenerate=False):
+    """
+    Streaming counterpart of get_reference_solution.
+    
+    Yields ("delta", text) events while the solution is generated, then one
+    ("done", info) event once the final text has been persisted. A stored
+    solution for the same inputs is sent whole as a single delta, and so is
+    one generated by a concurrent request for the same solution (streamed or
+    not), which this request waits for instead of generating its own.
+    
+    Yields:
+        tuple: (event name, str or dict)
+    """
+    from flask import current_app
+    from models import db, Assignment, ReferenceSolution
+    
+    if assignment_content is None:
+        assignment_content = load_assignment_content(assignment)
+    
+    existing = find_reference_solution(assignment, assignment_content, rubric, max_points)
+    if existing and not regenerate:
+        yield "delta", existing.solution
+        yield "done", {"solution": existing.solution, "solution_version": existing.version, "reused": True}
+        return
+    known_version = existing.version if existing else 0
+    key = _solution_flight_key(assignment, assignment_content, rubric, max_points, known_version)
+    
+    # The generation runs on its own thread, inside single_flight, and hands
+    # its text over as it arrives; the request thread only relays it
+    app = current_app._get_current_object()
+    assignment_id = assignment.id
+    events = queue.Queue()
+    
+    def generate(run_assignment):
+        parts = []
+        for text in stream_solution(assignment_content, rubric, max_points):
+            parts.append(text)
+            events.put(("delta", text))
+        solution = _clean_solution("".join(parts))
+        return solution, store_reference_solution(run_assignment, solution, assignment_content, rubric, max_points).id
+    
+    def run():
+        with app.app_context(), call_metrics.collect() as calls:
+            try:
+                run_assignment = db.session.get(Assignment, assignment_id)
+                
+                def stored_meanwhile():
+                    latest = find_reference_solution(run_assignment, assignment_content, rubric, max_points)
+                    if latest and latest.version > known_version:
+                        return latest.solution, latest.id
+                    return None
+                
+                if single_flight is None:
+                    outcome = generate(run_assignment), False
+                else:
+                    outcome = single_flight.do(key, lambda: generate(run_assignment), recheck=stored_meanwhile)
+                events.put(("result", (outcome, calls)))
+            except BaseException as e:
+                events.put(("error", (e, calls)))
+    
+    threading.Thread(target=run, daemon=True).start()
+    streamed = False
+    while True:
+        event, data = events.get()
+        if event != "delta":
+            break
+        streamed = True
+        yield "delta", data
+    # Report the generation's calls to this thread's collector, as get_reference_solution would
+    outcome, calls = data
+    for record in calls:
+        call_metrics.record(**record)
+    if event == "error":
+        raise outcome
+    
+    (solution, reference_id), shared = outcome
+    if shared:
+        print(f"🤝 DEBUG: Shared a concurrent reference solution request for assignment {assignment_id}")
+        call_metrics.record("solution", llm_provider.model_name, status="coalesced")
+    if not streamed:
+        yield "delta", solution
+    reference = ReferenceSolution.query.get(reference_id) if reference_id else None
+    yield "done", {"solution": solution, "solution_version": reference.version if reference else None, "reused": shared}
+
+def _grading_prompt_prefix(assignment_description, rubric, reference_solution, max_points):
+    """Everything in the grading prompt that is the same for every student"""
+    return f"""You are a fair programming grader. You will be given one student submission at the end of this prompt. Grade it.
 
 Grade the submission and return ONLY a JSON object with this EXACT format:
 {{
@@ -349,34 +824,312 @@ Grading Guidelines:
 - Keep feedback under 100 words
 - If code has syntax errors, score should be low but not zero unless completely empty
 
+Maximum Points: {max_points}
+
+Assignment:
+{assignment_description}
+
+Grading Rubric:
+{rubric}
+
+Reference Solution:
+{trim_source(reference_solution)}
+"""
+
+def _hybrid_prompt_prefix(assignment_description, rubric, max_points):
+    """Shorter prefix for hybrid mode: test results replace the reference solution"""
+    return f"""You are a fair programming grader. The student submission at the end of this prompt was already run against test cases; its results are listed with it.
+Do not re-check correctness the tests cover. Award partial credit for failed tests from how close the code is, and judge what the tests cannot: rubric items, structure and style.
+Return ONLY a JSON object: {{"score": <number between 0 and {max_points}>, "feedback": "<under 80 words, mention failed tests>"}}
+
+Maximum Points: {max_points}
+
+Assignment:
+{assignment_description}
+
+Grading Rubric:
+{rubric}
+"""
+
+def _hybrid_prompt_suffix(test_summary, student_code):
+    """The per-student part of the hybrid prompt"""
+    return f"""
+Test Results:
+{test_summary}
+""" + _grading_prompt_suffix(student_code)
+
+def _first_difference(expected, actual):
+    """(line number, expected line, actual line) of the first line where two outputs differ"""
+    expected_lines = normalize_output(expected).split("\n")
+    actual_lines = normalize_output(actual).split("\n")
+    for number in range(max(len(expected_lines), len(actual_lines))):
+        want = expected_lines[number] if number < len(expected_lines) else "<end of output>"
+        got = actual_lines[number] if number < len(actual_lines) else "<end of output>"
+        if want != got:
+            return number + 1, want, got
+    return None
+
+def summarize_test_run(test_run, max_chars=60):
+    """
+    Compact test results for the hybrid grading prompt and templated
+    feedback: a count, then one short line per failed case
+    """
+    def clip(text):
+        text = (text or "").strip()
+        return text if len(text) <= max_chars else text[:max_chars] + "..."
+    
+    lines = [f"Passed {test_run['passed']} of {test_run['total']} test cases."]
+    for case in test_run["cases"]:
+        if case["passed"]:
+            continue
+        if case["timed_out"]:
+            lines.append(f"- {case['name']}: timed out")
+        elif case["exit_code"] != 0:
+            error = (case["stderr"] or "").strip().splitlines()
+            lines.append(f"- {case['name']}: crashed (exit {case['exit_code']}) {clip(error[-1] if error else '')}".rstrip())
+        else:
+            difference = _first_difference(case.get("expected_stdout"), case["stdout"])
+            if difference:
+                number, want, got = difference
+                lines.append(f"- {case['name']}: line {number} expected \"{clip(want)}\", got \"{clip(got)}\"")
+            else:
+                lines.append(f"- {case['name']}: wrong output")
+    return "\n".join(lines)
+
+def classify_test_run(test_run):
+    """
+    Sort a submission by its test results for hybrid grading.
+    
+    Returns:
+        str: 'passed' (every case passed), 'failed' (every case crashed or
+            timed out) or 'ambiguous' (anything in between, for the LLM)
+    """
+    if test_run["total"] and test_run["passed"] == test_run["total"]:
+        return 'passed'
+    if all(case["timed_out"] or case["exit_code"] != 0 for case in test_run["cases"]):
+        return 'failed'
+    return 'ambiguous'
+
+def _grading_prompt_suffix(student_code):
+    """The per-student part of the grading prompt"""
+    return f"""
+Student Submission:
+{student_code}
+
+JSON Output:"""
+
+def _chunk_notes_suffix(index, total, chunk):
+    """Map step for a submission too large for one prompt: review one part"""
+    return f"""
+This student submission is too large for one prompt and is sent in {total} parts. Do NOT grade yet.
+Review ONLY part {index} of {total} below and return ONLY a JSON object:
+{{"notes": "<what this part implements, bugs and rubric-relevant problems, under 150 words>"}}
+
+Student Submission (part {index} of {total}):
+{chunk}
+
+JSON Output:"""
+
+def _chunk_grade_suffix(notes):
+    """Reduce step: grade the whole submission from the per-part notes"""
+    parts = "\n".join(f"Part {i + 1}: {note}" for i, note in enumerate(notes))
+    return f"""
+The student submission was too large for one prompt. These are review notes on each of its {len(notes)} parts, in order:
+{parts}
+
+Grade the whole submission from these notes, using the JSON format above.
+
 JSON Output:"""
 
+CHUNK_NOTES_SCHEMA = {
+    "type": "object",
+    "properties": {"notes": {"type": "string"}},
+    "required": ["notes"]
+}
+
+def _grade_in_chunks(model, context, chunks, retry_budget=None, mode="single"):
+    """Map-reduce grading for an oversized submission; returns the final response text"""
+    notes = []
+    for index, chunk in enumerate(chunks, start=1):
+        prompt = context.prompt_for(_chunk_notes_suffix(index, len(chunks), chunk))
+        response = generate_content(
+            model, prompt,
+            expected_output_tokens=300,
+            generation_config=_json_generation_config(CHUNK_NOTES_SCHEMA),
+            retry_budget=retry_budget,
+            purpose="chunk"
+        )
+        _record_token_usage(mode, response, prompt)
+        text = _response_text(response)
+        try:
+            value, _ = parse_json_lenient(text)
+            notes.append(str(value.get("notes", text)) if isinstance(value, dict) else text)
+        except GradeParseError:
+            notes.append(text)
+    
+    prompt = context.prompt_for(_chunk_grade_suffix(notes))
+    response = generate_content(
+        model, prompt,
+        generation_config=_json_generation_config(GRADE_RESPONSE_SCHEMA),
+        retry_budget=retry_budget,
+        purpose="chunk"
+    )
+    _record_token_usage(mode, response, prompt)
+    return _response_text(response)
+
+def create_grading_context(assignment_description, rubric, reference_solution, max_points, use_cache=True, client=None,
+                           hybrid=False):
+    """
+    Build the static grading prompt prefix for one run.
+    
+    With use_cache, the prefix is uploaded once as provider cached context
+    (Config.PROMPT_CACHE_ENABLED) and every grade_submission call sharing the
+    context sends only the student's code. Call close() when the run ends.
+    With hybrid, the prefix is the shorter one used with test results.
+    """
+    if hybrid:
+        prefix = _hybrid_prompt_prefix(assignment_description, rubric, max_points)
+    else:
+        prefix = _grading_prompt_prefix(assignment_description, rubric, reference_solution, max_points)
+    return PromptContext(
+        prefix,
+        llm_provider.model_name,
+        client or context_cache_client,
+        enabled=use_cache and Config.PROMPT_CACHE_ENABLED,
+        min_tokens=Config.PROMPT_CACHE_MIN_TOKENS,
+        ttl_seconds=Config.PROMPT_CACHE_TTL_SECONDS,
+        estimate_tokens=estimate_tokens
+    )
+
+def _pending_result(reason="AI provider unavailable"):
+    """Placeholder for a submission that could not be graded yet; never a guessed score"""
+    return {
+        "score": 0,
+        "feedback": f"Grading pending: {reason}",
+        "status": "pending"
+    }
+
+def grade_submission(student_code, assignment_description, rubric, reference_solution, max_points,
+                     context=None, retry_budget=None, test_summary=None):
+    """
+    Grade a single student submission.
+    
+    The submission is trimmed to the token budget first (token_budget);
+    files still over Config.GRADING_MAX_SUBMISSION_TOKENS are reviewed in
+    chunks and graded from the combined notes.
+    
+    Args:
+        student_code (str): The student's code
+        assignment_description (str): Description of the assignment
+        rubric (str): Grading rubric/criteria
+        reference_solution (str): Reference solution code
+        max_points (int): Maximum points for the assignment
+        context (PromptContext): Shared prompt prefix from
+            create_grading_context() for the same inputs (optional)
+        retry_budget (RetryBudget): Retry budget shared by the run (optional)
+        test_summary (str): Sandbox results from summarize_test_run(); grades
+            with the shorter hybrid prompt, which replaces the reference
+            solution with these results (context must then be a hybrid one)
+    
+    Returns:
+        dict: {"score": float, "feedback": str, "status": str}; status is
+            "pending" when the provider is unavailable and the submission
+            should be graded later
+    """
+    hybrid = test_summary is not None
+    prompt_version = f"{HYBRID_GRADING_PROMPT_VERSION}:{_sha256(test_summary)}" if hybrid else GRADING_PROMPT_VERSION
+    cache_key = make_cache_key(
+        student_code, assignment_description, rubric, reference_solution,
+        max_points, prompt_version, llm_provider.model_name
+    )
+    
+    # Reuse an earlier grade for identical inputs
+    def cached_grade():
+        cached = grade_cache.get(cache_key) if grade_cache is not None else None
+        if cached is None:
+            return None
+        return {
+            "score": cached["score"],
+            "feedback": cached["feedback"],
+            "status": "graded",
+            "cached": True
+        }
+    
+    purpose = "hybrid" if hybrid else "grade"
+    cached = cached_grade()
+    if cached is not None:
+        call_metrics.record(purpose, llm_provider.model_name, status="grade_cache_hit")
+        return cached
+    
+    def grade():
+        return _grade_submission_uncached(
+            student_code, assignment_description, rubric, reference_solution, max_points,
+            context, retry_budget, test_summary, cache_key, prompt_version
+        )
+    
+    if single_flight is None:
+        return grade()
+    # Identical requests already in flight (e.g. a double-clicked grade button) share one call
+    result, shared = single_flight.do(
+        f"grade:{cache_key}", grade, recheck=cached_grade if grade_cache is not None else None
+    )
+    if not shared:
+        return result
+    call_metrics.record(purpose, llm_provider.model_name, status="coalesced")
+    return dict(result, coalesced=True)
+
+def _grade_submission_uncached(student_code, assignment_description, rubric, reference_solution, max_points,
+                               context, retry_budget, test_summary, cache_key, prompt_version):
+    """The LLM part of grade_submission(), after the grade cache missed"""
+    hybrid = test_summary is not None
+    mode = "hybrid" if hybrid else "single"
+    
+    if context is None:
+        context = create_grading_context(
+            assignment_description, rubric, reference_solution, max_points, use_cache=False, hybrid=hybrid
+        )
+    
+    try:
+        model = context.model()
+    except Exception as e:
+        print(f"⚠️ DEBUG: Could not create grading model: {e}")
+        return _pending_result()
+    
+    budget = plan_submission(student_code, Config.GRADING_MAX_SUBMISSION_TOKENS, Config.GRADING_CHUNK_TOKENS)
+    if budget.chunked:
+        print(f"✂️ DEBUG: Submission of {budget.original_tokens} tokens graded in {len(budget.chunks)} chunks", flush=True)
+    if hybrid:
+        prompt = context.prompt_for(_hybrid_prompt_suffix(test_summary, budget.text))
+    else:
+        prompt = context.prompt_for(_grading_prompt_suffix(budget.text))
+
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            response = model.generate_content(prompt)
-            result_text = response.candidates[0].content.parts[0].text.strip()
-            
-            # Try to extract JSON from response
-            json_match = re.search(r'\{[^{}]*"score"[^{}]*"feedback"[^{}]*\}', 
-                                   result_text, re.DOTALL)
-            
-            if json_match:
-                result_text = json_match.group(0)
+            if budget.chunked:
+                result_text = _grade_in_chunks(model, context, budget.chunks, retry_budget=retry_budget, mode=mode)
+            else:
+                response = generate_content(
+                    model, prompt,
+                    generation_config=_json_generation_config(GRADE_RESPONSE_SCHEMA),
+                    retry_budget=retry_budget,
+                    purpose="hybrid" if hybrid else "grade"
+                )
+                _record_token_usage(mode, response, prompt)
+                result_text = _response_text(response)
+            _record_parse("responses")
+            if not _legacy_parse_ok(result_text):
+                _record_parse("legacy_failures")
             
-            # Parse JSON
-            result = json.loads(result_text)
+            # Schema-constrained output normally parses as-is; repair near misses locally
+            score, feedback, repaired = parse_grade(result_text, max_points)
+            if repaired:
+                _record_parse("repaired")
             
-            # Validate structure
-            if "score" not in result or "feedback" not in result:
-                raise ValueError("Missing required fields")
-            
-            # Normalize score
-            score = float(result["score"])
-            score = max(0, min(score, max_points))
-            
-            # Clean feedback
-            feedback = str(result["feedback"]).strip()
+            _record_graded(mode, 1)
+            _record_parse("submissions")
+            if grade_cache is not None:
+                grade_cache.put(cache_key, score, feedback, llm_provider.model_name, prompt_version)
             
             return {
                 "score": score,
@@ -384,20 +1137,40 @@ JSON Output:"""
                 "status": "graded"
             }
             
-        except json.JSONDecodeError as e:
+        except GradeParseError as e:
+            # Only responses beyond repair cost another round trip
             if attempt == max_retries - 1:
+                _record_parse("submissions")
                 return {
                     "score": 0,
                     "feedback": f"Grading error: Unable to parse AI response",
                     "status": "error"
                 }
+            _record_parse("recalls")
             continue
+        except ThrottledError as e:
+            # Never replace a grade with a random mock score because of rate limits
+            print(f"⚠️ DEBUG: API grading throttled: {e}")
+            return _pending_result("AI provider rate limit exceeded")
+        except (CircuitOpenError, RetryBudgetExhausted) as e:
+            return _pending_result()
+        except LLMCallError as e:
+            # generate_content already retried transient errors with backoff
+            print(f"⚠️ DEBUG: API grading failed: {e}")
+            if e.kind == FATAL:
+                return {
+                    "score": 0,
+                    "feedback": f"Grading error: {e}",
+                    "status": "error"
+                }
+            return _pending_result()
         except Exception as e:
-            if attempt == max_retries - 1:
-                print(f"⚠️ DEBUG: API grading failed: {e}")
-                print("🔄 DEBUG: Falling back to mock grading...")
-                return grade_submission_mock(student_code, assignment_description, rubric, reference_solution, max_points)
-            continue
+            print(f"⚠️ DEBUG: Unusable grading response: {e}")
+            return {
+                "score": 0,
+                "feedback": f"Grading error: {e}",
+                "status": "error"
+            }
     
         return {
             "score": 0,
@@ -405,20 +1178,437 @@ JSON Output:"""
             "status": "error"
         }
 
-def grade_all_submissions(assignment_id, rubric, max_points):
+def grade_submission_reduced(student_code, assignment_description, rubric, max_points, issue, retry_budget=None):
+    """
+    Grade a submission that failed a pre-grading check with a short prompt.
+    
+    Used for code that does not compile: the prompt carries the compiler's
+    message instead of the reference solution, and the score is capped at
+    Config.PREGRADE_REDUCED_MAX_FRACTION of max_points.
+    
+    Args:
+        student_code (str): The student's code
+        assignment_description (str): Description of the assignment
+        rubric (str): Grading rubric/criteria
+        max_points (int): Maximum points for the assignment
+        issue (str): What the pre-grading check found
+        retry_budget (RetryBudget): Retry budget shared by the run (optional)
+    
+    Returns:
+        dict: {"score": float, "feedback": str, "status": str}
+    """
+    cap = round(max_points * Config.PREGRADE_REDUCED_MAX_FRACTION, 2)
+    budget = plan_submission(student_code, Config.GRADING_MAX_SUBMISSION_TOKENS, Config.GRADING_CHUNK_TOKENS)
+    prompt = f"""You are a fair programming grader. {issue}
+Award partial credit only for the parts of the assignment the code attempts correctly.
+Return ONLY a JSON object: {{"score": <number between 0 and {cap}>, "feedback": "<under 80 words, mention the error>"}}
+
+Maximum Points: {cap}
+
+Assignment:
+{assignment_description}
+
+Grading Rubric:
+{rubric}
+
+Student Submission:
+{budget.chunks[0]}
+
+JSON Output:"""
+    
+    try:
+        response = generate_content(
+            llm_provider.model(), prompt,
+            expected_output_tokens=200,
+            generation_config=_json_generation_config(GRADE_RESPONSE_SCHEMA),
+            retry_budget=retry_budget,
+            purpose="reduced"
+        )
+        _record_token_usage("single", response, prompt)
+        _record_graded("single", 1)
+        score, feedback, _ = parse_grade(_response_text(response), cap)
+        return {"score": score, "feedback": feedback, "status": "graded"}
+    except (CircuitOpenError, RetryBudgetExhausted, ThrottledError):
+        return _pending_result()
+    except LLMCallError as e:
+        if e.kind != FATAL:
+            return _pending_result()
+        return {"score": 0, "feedback": f"Grading error: {e}", "status": "error"}
+    except Exception as e:
+        print(f"⚠️ DEBUG: Reduced grading failed: {e}")
+        return {"score": 0, "feedback": f"Grading error: {e}", "status": "error"}
+
+def plan_batches(submissions, fixed_tokens, token_budget=None, max_batch_size=None):
+    """
+    Split submissions into consecutive batches that fit a prompt token budget.
+    
+    Args:
+        submissions (list): (key, student_code) tuples, in grading order
+        fixed_tokens (int): Tokens of the shared prompt prefix
+        token_budget (int): Maximum prompt tokens per batch
+        max_batch_size (int): Maximum submissions per batch
+    
+    Returns:
+        list: Lists of (key, student_code) tuples
+    """
+    token_budget = token_budget or Config.GRADING_BATCH_TOKEN_BUDGET
+    max_batch_size = max(1, max_batch_size or Config.GRADING_MAX_BATCH_SIZE)
+    
+    batches = []
+    current = []
+    current_tokens = fixed_tokens
+    for key, code in submissions:
+        # Per-submission framing adds a few tokens on top of the code itself
+        tokens = estimate_tokens(code) + 20
+        if current and (len(current) >= max_batch_size or current_tokens + tokens > token_budget):
+            batches.append(current)
+            current = []
+            current_tokens = fixed_tokens
+        current.append((key, code))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def _batch_prompt_header(assignment_description, rubric, reference_solution, max_points):
+    return f"""You are a fair programming grader. Grade EACH of the student submissions below independently.
+
+Assignment:
+{assignment_description}
+
+Grading Rubric:
+{rubric}
+
+Reference Solution:
+{trim_source(reference_solution)}
+
+Maximum Points: {max_points}
+
+Grading Guidelines:
+- Award full points for correct, working code
+- Deduct points for errors, incomplete features, poor style
+- Be specific about what caused deductions
+- Keep feedback under 100 words per submission
+- If code has syntax errors, score should be low but not zero unless completely empty
+- Grade each submission on its own merits; never compare students
+
+"""
+
+def _grade_batch_once(model, header, batch, max_points, retry_budget=None):
+    """Send one batch prompt; raise ValueError unless every submission is graded"""
+    labels = {f"S{i + 1}": key for i, (key, _) in enumerate(batch)}
+    blocks = "\n".join(
+        f"=== SUBMISSION {label} ===\n{code}\n=== END SUBMISSION {label} ===\n"
+        for label, (_, code) in zip(labels, batch)
+    )
+    prompt = f"""{header}Student Submissions:
+{blocks}
+Return ONLY a JSON array with one object per submission, in this EXACT format:
+[
+  {{"student": "<submission label, e.g. S1>", "score": <number between 0 and {max_points}>, "feedback": "<feedback>"}}
+]
+
+JSON Output:"""
+    
+    response = generate_content(
+        model, prompt,
+        expected_output_tokens=200 * len(batch),
+        generation_config=_json_generation_config(BATCH_GRADE_RESPONSE_SCHEMA),
+        retry_budget=retry_budget,
+        purpose="batch"
+    )
+    _record_token_usage("batch", response, prompt)
+    _record_parse("responses")
+    try:
+        result_text = _response_text(response)
+    except (AttributeError, IndexError) as e:
+        # Blocked or empty response
+        raise ValueError(f"Batch response has no text: {e}") from e
+    if not _legacy_parse_ok(result_text, expect='array'):
+        _record_parse("legacy_failures")
+    
+    items, repaired = parse_json_lenient(result_text, expect='array')
+    if repaired:
+        _record_parse("repaired")
+    if not isinstance(items, list):
+        raise ValueError("Batch response is not a JSON array")
+    
+    graded = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        key = labels.get(str(item.get("student", "")).strip())
+        if key is None or "score" not in item or "feedback" not in item:
+            continue
+        graded[key] = {
+            "score": max(0, min(float(item["score"]), max_points)),
+            "feedback": str(item["feedback"]).strip(),
+            "status": "graded"
+        }
+    
+    missing = [key for key in labels.values() if key not in graded]
+    if missing:
+        raise ValueError(f"Batch response missing {len(missing)} of {len(batch)} submissions")
+    _record_graded("batch", len(batch))
+    _record_parse("submissions", len(batch))
+    return graded
+
+def grade_submissions_batch(submissions, assignment_description, rubric, reference_solution, max_points,
+                            retry_budget=None):
+    """
+    Grade several submissions with one prompt per batch.
+    
+    The assignment, rubric and reference solution are sent once per batch
+    instead of once per student. Batches are sized by
+    Config.GRADING_BATCH_TOKEN_BUDGET; a batch whose response cannot be
+    parsed or comes back incomplete is split in half and retried, down to
+    single submissions, which fall back to grade_submission. A batch that is
+    throttled or hits an outage is left pending rather than split. Submissions are trimmed to the
+    token budget first; any still too large for one prompt are graded on
+    their own, in chunks, by grade_submission.
+    
+    Args:
+        submissions (list): (key, student_code) tuples; keys must be unique
+        assignment_description (str): Description of the assignment
+        rubric (str): Grading rubric/criteria
+        reference_solution (str): Reference solution code
+        max_points (int): Maximum points for the assignment
+        retry_budget (RetryBudget): Retry budget shared by the run (optional)
+    
+    Returns:
+        dict: key -> {"score": float, "feedback": str, "status": str}
+    """
+    results = {}
+    cache_keys = {}
+    pending = []
+    for key, code in submissions:
+        if grade_cache is not None:
+            cache_keys[key] = make_cache_key(
+                code, assignment_description, rubric, reference_solution,
+                max_points, BATCH_GRADING_PROMPT_VERSION, llm_provider.model_name
+            )
+            cached = grade_cache.get(cache_keys[key])
+            if cached is not None:
+                results[key] = {"score": cached["score"], "feedback": cached["feedback"], "status": "graded", "cached": True}
+                call_metrics.record("batch", llm_provider.model_name, status="grade_cache_hit")
+                continue
+        budget = plan_submission(code, Config.GRADING_MAX_SUBMISSION_TOKENS, Config.GRADING_CHUNK_TOKENS)
+        if budget.chunked:
+            results[key] = grade_submission(code, assignment_description, rubric, reference_solution, max_points,
+                                            retry_budget=retry_budget)
+            continue
+        pending.append((key, budget.text))
+    
+    if not pending:
+        return results
+    
+    model = llm_provider.model()
+    header = _batch_prompt_header(assignment_description, rubric, reference_solution, max_points)
+    
+    def grade_or_split(batch):
+        if len(batch) == 1:
+            key, code = batch[0]
+            return {key: grade_submission(code, assignment_description, rubric, reference_solution, max_points,
+                                          retry_budget=retry_budget)}
+        try:
+            graded = _grade_batch_once(model, header, batch, max_points, retry_budget=retry_budget)
+        except ThrottledError as e:
+            # Smaller batches would be throttled the same way; park them all
+            print(f"⚠️ DEBUG: Batch grading throttled: {e}")
+            return {key: _pending_result("AI provider rate limit exceeded") for key, _ in batch}
+        except (CircuitOpenError, RetryBudgetExhausted):
+            return {key: _pending_result() for key, _ in batch}
+        except LLMCallError as e:
+            print(f"⚠️ DEBUG: Batch grading failed: {e}")
+            if e.kind == FATAL:
+                return {key: {"score": 0, "feedback": f"Grading error: {e}", "status": "error"} for key, _ in batch}
+            return {key: _pending_result() for key, _ in batch}
+        except ValueError as e:
+            # Unparseable or incomplete response: the halves are sent again
+            _record_parse("recalls")
+            middle = len(batch) // 2
+            print(f"⚠️ DEBUG: Batch of {len(batch)} failed ({e}); splitting into {middle} + {len(batch) - middle}", flush=True)
+            graded = grade_or_split(batch[:middle])
+            graded.update(grade_or_split(batch[middle:]))
+            return graded
+        if grade_cache is not None:
+            for key, result in graded.items():
+                grade_cache.put(cache_keys[key], result["score"], result["feedback"], llm_provider.model_name, BATCH_GRADING_PROMPT_VERSION)
+        return graded
+    
+    for batch in plan_batches(pending, estimate_tokens(header)):
+        results.update(grade_or_split(batch))
+    return results
+
+def sandbox_limits():
+    """Per-case limits from Config"""
+    return SandboxLimits(
+        cpu_seconds=Config.SANDBOX_CPU_SECONDS,
+        wall_seconds=Config.SANDBOX_WALL_SECONDS,
+        memory_mb=Config.SANDBOX_MEMORY_MB,
+        max_output_bytes=Config.SANDBOX_MAX_OUTPUT_BYTES,
+        max_processes=Config.SANDBOX_MAX_PROCESSES
+    )
+
+
+def load_test_cases(assignment):
+    """
+    The assignment's TestCases as sandbox case dicts.
+    
+    Returns:
+        list: Empty when the assignment has no test cases or the sandbox is
+            disabled or cannot isolate submissions on this host
+    """
+    if not Config.SANDBOX_ENABLED or not assignment.test_cases or not sandbox_available():
+        return []
+    return [
+        {
+            "name": case.name or f"case {i + 1}",
+            "stdin": case.stdin or "",
+            "expected_stdout": case.expected_stdout,
+            "points": case.points if case.points is not None else 1.0
+        }
+        for i, case in enumerate(assignment.test_cases)
+    ]
+
+
+def fill_expected_outputs(assignment, reference_solution, cases):
+    """
+    Fill in the expected output of cases that have none from the reference solution.
+    
+    Outputs are stored as TestVectors keyed by reference-solution hash and
+    input hash, so the reference runs once per input and solution version;
+    later grading runs and every worker read the stored output. Inputs the
+    reference fails on keep no expected output (clean exit only).
+    
+    Args:
+        assignment (Assignment): Assignment the cases belong to
+        reference_solution (str): Reference solution source code
+        cases (list): From load_test_cases()
+    
+    Returns:
+        list: Copies of cases with expected_stdout filled in where possible
+    """
+    from models import db, TestVector
+    from sqlalchemy.exc import IntegrityError
+    
+    if not reference_solution or all(case["expected_stdout"] is not None for case in cases):
+        return cases
+    
+    reference_hash = _sha256(reference_solution)
+    stored = {
+        vector.input_hash: vector.expected_stdout
+        for vector in TestVector.query.filter_by(assignment_id=assignment.id, reference_hash=reference_hash)
+    }
+    missing = {}
+    for case in cases:
+        input_hash = _sha256(case["stdin"])
+        if case["expected_stdout"] is None and input_hash not in stored:
+            missing.setdefault(input_hash, case)
+    
+    if missing:
+        print(f"🧪 Running reference solution on {len(missing)} new test inputs", flush=True)
+        run = run_submission(reference_solution, [dict(case, expected_stdout=None) for case in missing.values()],
+                             sandbox_limits())
+        for input_hash, result in zip(missing, run["cases"]):
+            if not result["passed"]:
+                print(f"  ⚠️  Reference solution failed on {result['name']} (exit {result['exit_code']})", flush=True)
+                continue
+            stored[input_hash] = result["stdout"]
+            db.session.add(TestVector(
+                assignment_id=assignment.id,
+                reference_hash=reference_hash,
+                input_hash=input_hash,
+                expected_stdout=result["stdout"]
+            ))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another run stored the same vectors first; theirs are identical
+            db.session.rollback()
+    else:
+        print(f"♻️ Reusing {len(stored)} stored test vectors", flush=True)
+    
+    return [
+        dict(case, expected_stdout=stored.get(_sha256(case["stdin"])))
+        if case["expected_stdout"] is None else case
+        for case in cases
+    ]
+
+
+def run_assignment_tests(cases, submissions, stop=None):
+    """
+    Run submissions against test cases in the sandbox. Touches no database
+    state, so it can run on a worker thread.
+    
+    Args:
+        cases (list): From load_test_cases()
+        submissions (list): (key, code) tuples
+        stop (threading.Event): Set to stop between test cases
+    
+    Returns:
+        dict: key -> sandbox.run_submission() result, for submissions that ran every case
+    """
+    return run_submissions(submissions, cases, sandbox_limits(), Config.SANDBOX_WORKERS, stop)
+
+
+def test_result_fields(test_run):
+    """SubmissionResult columns for one run_assignment_tests() result (or None)"""
+    if not test_run:
+        return {"tests_passed": None, "tests_total": None, "test_results": None}
+    return {
+        "tests_passed": test_run["passed"],
+        "tests_total": test_run["total"],
+        "test_results": json.dumps(test_run["cases"])
+    }
+
+
+def _student_name(file_path):
+    return os.path.basename(file_path).replace('.py', '')
+
+
+def file_content_hash(file_path):
+    """SHA-256 of a submission file as uploaded"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def grade_all_submissions(assignment_id, rubric, max_points, concurrency=None, mode=None,
+                          resume_report_id=None, on_report=None, abandon=None):
     """
     Grade all submissions for an assignment.
     This function integrates with Person 2's database models.
     
+    Submissions are graded concurrently by a bounded thread pool; database
+    writes stay on the calling thread so the Flask-SQLAlchemy session is
+    never shared between workers.
+    
+    Every finished work unit is committed right away, together with the
+    report's running counters, so an interrupted run keeps what it graded.
+    Resuming the report skips files whose content hash matches a result
+    that is already graded; pending and errored ones are graded again.
+    
     Args:
         assignment_id (int): ID of the assignment in the database
         rubric (str): Grading rubric/criteria
         max_points (int): Maximum points for the assignment
+        concurrency (int): Number of parallel grading workers
+            (defaults to Config.GRADING_CONCURRENCY)
+        mode (str): 'single', 'batch' or 'hybrid' (defaults to Config.GRADING_MODE)
+        resume_report_id (int): Continue this report instead of starting a new one
+        on_report (callable): Called with the GradingReport before it is first
+            committed (the job queue uses it to remember the report to resume)
+        abandon (threading.Event): Set when this run must stop writing, because
+            another worker took its job over; the run then stops like a pause,
+            stores nothing more and raises RunStopped
     
     Returns:
         dict: Summary of grading results
     """
-    from models import db, Assignment, GradingReport, SubmissionResult
+    from models import db, Assignment, GradingReport, SubmissionResult, LLMCallMetric
     from datetime import datetime
     import os
     
@@ -452,134 +1642,614 @@ def grade_all_submissions(assignment_id, rubric, max_points):
     
     print(f"Found {len(python_files)} Python files to grade")
     
-    # Generate reference solution
-    print("\nStep 1: Generating reference solution...")
+    # Load (or generate once) the reference solution
+    print("\nStep 1: Loading reference solution...")
+    assignment_description = load_assignment_content(assignment)
     try:
-        reference_solution = generate_solution(
-            assignment.description or "Code assignment",
-            rubric,
-            max_points
-        )
-        print("✅ Reference solution generated!")
+        with call_metrics.collect() as solution_calls:
+            reference_solution, reference, reused = get_reference_solution(
+                assignment,
+                rubric,
+                max_points,
+                assignment_content=assignment_description
+            )
+        print("✅ Reference solution reused!" if reused else "✅ Reference solution generated!")
     except Exception as e:
         print(f"❌ Solution generation failed: {e}")
         raise
     
-    # Create grading report
-    print("\nStep 2: Creating grading report...")
-    report = GradingReport(
-        assignment_id=assignment_id,
-        report_name=f"{assignment.title} - AI Grading Report",
-        total_submissions=len(python_files),
-        graded_submissions=0
-    )
-    db.session.add(report)
+    # Create grading report, or reopen the interrupted one
+    finished = {}
+    existing_rows = {}
+    if resume_report_id:
+        print(f"\nStep 2: Resuming grading report {resume_report_id}...")
+        report = GradingReport.query.get(resume_report_id)
+        if not report or report.assignment_id != assignment_id:
+            raise ValueError(f"Grading report {resume_report_id} not found for assignment {assignment_id}")
+        for row in SubmissionResult.query.filter_by(report_id=report.id).order_by(SubmissionResult.id).all():
+            # Any row graded again (pending, errored, or its file changed) is updated in place
+            existing_rows.setdefault(row.student_name, row)
+            if row.grading_status not in ('pending', 'error'):
+                finished[(row.student_name, row.content_hash)] = row
+        report.total_submissions = len(python_files)
+        report.status = 'running'
+        report.control = None
+    else:
+        print("\nStep 2: Creating grading report...")
+        report = GradingReport(
+            assignment_id=assignment_id,
+            report_name=f"{assignment.title} - AI Grading Report",
+            total_submissions=len(python_files),
+            graded_submissions=0,
+            status='running',
+            rubric=rubric,
+            max_points=max_points
+        )
+        db.session.add(report)
+        db.session.flush()
+    if on_report:
+        on_report(report)
+    progress_events.publish(assignment_id, 'started', {
+        "report_id": report.id,
+        "total": len(python_files),
+        "already_graded": len(finished),
+        "resumed": bool(resume_report_id)
+    }, report_id=report.id)
     db.session.commit()
-    print(f"✅ Grading report created (ID: {report.id})")
+    progress_events.notify()
+    print(f"✅ Grading report {'reopened' if resume_report_id else 'created'} (ID: {report.id})")
     
-    # Grade each submission
-    print(f"\nStep 3: Grading {len(python_files)} submissions...")
-    results = []
-    total_score = 0
-    successful_grades = 0
+    # Grade submissions in parallel
+    concurrency = max(1, int(concurrency or Config.GRADING_CONCURRENCY))
+    mode = mode or Config.GRADING_MODE
+    print(f"\nStep 3: Grading {len(python_files)} submissions with {concurrency} workers ({mode} mode)...")
     
+    # Read student code and run the static pre-grading checks
+    policy = parse_policy(Config.PREGRADE_POLICY)
+    submissions = []
+    decisions = {}
+    content_hashes = {}
+    resumed = {}
     for i, file_path in enumerate(python_files):
-        import sys
-        sys.stdout.flush()
-        print(f"Grading {i+1}/{len(python_files)}: {os.path.basename(file_path)}", flush=True)
-        
-        # Read student code
+        print(f"Reading {i+1}/{len(python_files)}: {os.path.basename(file_path)}", flush=True)
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                student_code = f.read()
-            print(f"  📄 Read {len(student_code)} characters", flush=True)
-        except Exception as e:
-            print(f"  ⚠️  Error reading file: {e}", flush=True)
-            student_code = ""
+            content_hashes[file_path] = file_content_hash(file_path)
+        except OSError:
+            content_hashes[file_path] = None
+        done = finished.get((_student_name(file_path), content_hashes[file_path]))
+        if done is not None:
+            print(f"  ⏭️  Already graded in this report", flush=True)
+            resumed[file_path] = done
+            continue
+        if Config.PREGRADE_ENABLED:
+            decision = pregrade_file(file_path, policy, Config.PREGRADE_MAX_BYTES)
+        else:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    decision = PregradeDecision(f.read())
+            except Exception as e:
+                print(f"  ⚠️  Error reading file: {e}", flush=True)
+                decision = PregradeDecision("")
+        if decision.category:
+            print(f"  🚧 Pre-grading: {decision.category} -> {decision.action}", flush=True)
+        else:
+            print(f"  📄 Read {len(decision.code)} characters", flush=True)
+        decisions[file_path] = decision
+        submissions.append((file_path, decision.code))
+    
+    # Files the policy settles without the LLM never enter the queue
+    static_outcomes = {}
+    for file_path, decision in decisions.items():
+        if decision.action in ('zero', 'error'):
+            static_outcomes[file_path] = {
+                "file_path": file_path,
+                "grade_result": {
+                    "score": 0,
+                    "feedback": decision.feedback,
+                    "status": "graded" if decision.action == 'zero' else "error"
+                },
+                "error": None,
+                "elapsed": 0.0
+            }
+    reduced = [(file_path, code) for file_path, code in submissions if decisions[file_path].action == 'reduced']
+    queued = [(file_path, code) for file_path, code in submissions if decisions[file_path].action == 'llm']
+    print(f"🚧 Pre-grading settled {len(static_outcomes)} submissions, {len(reduced)} get a reduced prompt", flush=True)
+    
+    # Objective test runs need no LLM. Files that do not compile cannot pass, so they are not run.
+    runnable = [
+        (file_path, code) for file_path, code in submissions
+        if decisions[file_path].category in (None, 'bad_encoding')
+    ]
+    test_cases = fill_expected_outputs(assignment, reference_solution, load_test_cases(assignment))
+    if test_cases:
+        # A stopped run leaves graded rows whose tests it did not finish; run them now
+        for file_path, row in resumed.items():
+            if row.tests_total is None:
+                decision = pregrade_file(file_path, max_bytes=Config.PREGRADE_MAX_BYTES)
+                if decision.category in (None, 'bad_encoding'):
+                    runnable.append((file_path, decision.code))
+    tokens_before = get_token_stats()
+    run_started = time.perf_counter()
+    
+    # Hybrid mode runs the tests first: clear passes and clear failures get a
+    # templated score, and only the ambiguous middle goes to the LLM
+    test_runs = None
+    test_summaries = {}
+    templated_outcomes = {}
+    if mode == 'hybrid' and not test_cases:
+        print("⚠️  Hybrid mode needs test cases; grading every submission with the LLM", flush=True)
+        mode = 'single'
+    if mode == 'hybrid':
+        test_runs = run_assignment_tests(test_cases, runnable)
+        templates = {
+            'passed': (Config.HYBRID_PASS_SCORE_FRACTION, "All tests passed."),
+            'failed': (Config.HYBRID_FAIL_SCORE_FRACTION, "The program did not run successfully on any test.")
+        }
+        still_queued = []
+        for file_path, code in queued:
+            test_run = test_runs.get(file_path)
+            if test_run is None:
+                # Sent to the LLM by the pre-grading policy although it could not run
+                test_summaries[file_path] = f"Not run: {decisions[file_path].feedback}"
+                still_queued.append((file_path, code))
+                continue
+            summary = summarize_test_run(test_run)
+            verdict = classify_test_run(test_run)
+            if verdict == 'ambiguous':
+                test_summaries[file_path] = summary
+                still_queued.append((file_path, code))
+                continue
+            fraction, headline = templates[verdict]
+            templated_outcomes[file_path] = {
+                "file_path": file_path,
+                "grade_result": {
+                    "score": round(max_points * fraction, 2),
+                    "feedback": f"{headline} {summary}",
+                    "status": "graded"
+                },
+                "error": None,
+                "elapsed": 0.0
+            }
+        queued = still_queued
+        print(f"🧪 Tests settled {len(templated_outcomes)} submissions; {len(queued)} go to the LLM", flush=True)
+    
+    # Collapse near-duplicates: grade one representative per fingerprint
+    code_by_path = dict(submissions)
+    fingerprints = {}
+    if Config.GRADING_DEDUPLICATE:
+        groups = group_submissions(queued)
+        for fingerprint, members in groups.items():
+            for file_path in members:
+                fingerprints[file_path] = fingerprint
+        distinct = [(members[0], code_by_path[members[0]]) for members in groups.values()]
+        print(f"🧬 {len(queued)} submissions collapse to {len(distinct)} distinct solutions", flush=True)
+    else:
+        groups = {}
+        distinct = queued
+    
+    # Trimmed size of every file, recorded per submission and used to pack batches
+    budgets = {
+        file_path: plan_submission(student_code, Config.GRADING_MAX_SUBMISSION_TOKENS, Config.GRADING_CHUNK_TOKENS)
+        for file_path, student_code in submissions
+    }
+    
+    # Work units: one submission each, or token-budgeted batches
+    if mode == 'batch':
+        header = _batch_prompt_header(assignment_description, rubric, reference_solution, max_points)
+        units = plan_batches(
+            [(file_path, budgets[file_path].text) for file_path, _ in distinct],
+            estimate_tokens(header)
+        )
+        print(f"📦 Packed into {len(units)} batches", flush=True)
+    else:
+        units = [[submission] for submission in distinct]
+    units += [[submission] for submission in reduced]
+    
+    # One cached prompt prefix and one retry budget for the whole run
+    context = create_grading_context(
+        assignment_description, rubric, reference_solution, max_points, hybrid=mode == 'hybrid'
+    )
+    retry_budget = RetryBudget(Config.LLM_RETRY_BUDGET_PER_RUN)
+    
+    # While the circuit is open the run pauses, up to this deadline, and then
+    # parks whatever is left as pending instead of guessing scores
+    pause_deadline = time.monotonic() + Config.GRADING_MAX_PAUSE_SECONDS
+    
+    def grade_once(remaining):
+        file_path, student_code = remaining[0]
+        if decisions[file_path].action == 'reduced':
+            return {file_path: grade_submission_reduced(
+                student_code, assignment_description, rubric, max_points,
+                decisions[file_path].feedback, retry_budget=retry_budget
+            )}
+        if mode == 'batch':
+            return grade_submissions_batch(
+                remaining, assignment_description, rubric, reference_solution, max_points,
+                retry_budget=retry_budget
+            )
+        file_path, student_code = remaining[0]
+        print(f"  🤖 Sending {os.path.basename(file_path)} to AI for grading...", flush=True)
+        return {file_path: grade_submission(
+            student_code,
+            assignment_description,
+            rubric,
+            reference_solution,
+            max_points,
+            context=context,
+            retry_budget=retry_budget,
+            test_summary=test_summaries.get(file_path)
+        )}
+    
+    # Set when the run is paused or cancelled: units that have not started
+    # are dropped and threads waiting for capacity give it up (RunStopped)
+    stop_event = threading.Event()
+    
+    def circuit_ready():
+        # In short slices, so a stopped run does not sit out the whole pause
+        while not stop_event.is_set():
+            left = pause_deadline - time.monotonic()
+            if circuit_breaker.wait_until_ready(min(left, 1.0)):
+                return True
+            if left <= 1.0:
+                return False
+        raise RunStopped()
+    
+    def grade_unit(unit):
+        started = time.perf_counter()
+        graded = {}
+        errors = {}
+        remaining = unit
+        with call_metrics.collect() as calls, stop_on(stop_event):
+            while remaining:
+                try:
+                    if not circuit_ready():
+                        graded.update((file_path, _pending_result()) for file_path, _ in remaining)
+                        break
+                    graded.update(grade_once(remaining))
+                except RunStopped:
+                    if not stop_event.is_set():
+                        # Coalesced onto a request of another run that was stopped
+                        errors.update((file_path, RuntimeError("Shared grading request was stopped")) for file_path, _ in remaining)
+                    # Otherwise left ungraded; resuming the run grades it
+                    break
+                except Exception as e:
+                    print(f"  ❌ Grading failed: {e}", flush=True)
+                    import traceback
+                    traceback.print_exc()
+                    errors.update((file_path, e) for file_path, _ in remaining)
+                    break
+                remaining = [s for s in remaining if graded[s[0]]["status"] == "pending"]
+                # Only an open circuit is worth waiting for; other pending causes will not clear mid-run
+                if remaining and circuit_breaker.state == CLOSED:
+                    break
+        
+        # Batch time is shared evenly by its members; the unit's calls are stored once, with its first member
+        elapsed = (time.perf_counter() - started) / len(unit)
+        finished = [file_path for file_path, _ in unit if file_path in graded or file_path in errors]
+        return [
+            {
+                "file_path": file_path,
+                "grade_result": graded.get(file_path),
+                "error": errors.get(file_path),
+                "elapsed": elapsed,
+                "llm_calls": calls if i == 0 else [],
+                "batch_size": len(unit)
+            }
+            for i, file_path in enumerate(finished)
+        ]
+    
+    # Results are stored as units finish. A submission that already has a
+    # row in this report (left pending or errored, or graded before its file
+    # changed) updates that row in place.
+    members_of = {members[0]: members for members in groups.values()}
+    rows_by_path = dict(resumed)
+    results_by_path = {
+        file_path: {
+            "student_name": row.student_name,
+            "score": row.score,
+            "feedback": row.feedback,
+            "status": row.grading_status,
+            "resumed": True
+        }
+        for file_path, row in resumed.items()
+    }
+    outcomes = []
+    call_records = [(record, None, 1) for record in solution_calls]
+    totals = {
+        "score": sum(row.score or 0 for row in resumed.values()),
+        "successful": len(resumed),
+        "pending": 0
+    }
+    
+    def store_outcome(outcome):
+        file_path = outcome["file_path"]
+        grade_result = outcome["grade_result"]
         
         # Extract student name from filename
-        student_name = os.path.basename(file_path).replace('.py', '')
+        student_name = _student_name(file_path)
+        budget = budgets[file_path]
+        fields = {
+            "submission_path": file_path,
+            "max_score": max_points,
+            "fingerprint": outcome["fingerprint"],
+            "content_hash": content_hashes[file_path],
+            "submission_tokens": budget.original_tokens,
+            "graded_tokens": budget.tokens,
+            "grading_chunks": len(budget.chunks),
+            "pregrade_category": decisions[file_path].category,
+            **test_result_fields(test_runs.get(file_path) if test_runs else None)
+        }
         
-        # Grade the submission
-        try:
-            print(f"  🤖 Sending to AI for grading...", flush=True)
-            sys.stdout.flush()
-            grade_result = grade_submission(
-                student_code,
-                assignment.description or "Code assignment",
-                rubric,
-                reference_solution,
-                max_points
-            )
-            
-            # Save to database
-            submission = SubmissionResult(
-                assignment_id=assignment_id,
-                student_name=student_name,
-                submission_path=file_path,
+        if outcome["error"] is None and grade_result["status"] == "pending":
+            # Parked for a later run; not counted towards the report
+            fields.update(score=0, feedback=grade_result["feedback"], grading_status="pending", graded_at=None)
+            totals["pending"] += 1
+            print(f"  ⏸️  {student_name}: pending", flush=True)
+        elif outcome["error"] is None:
+            fields.update(
                 score=grade_result["score"],
-                max_score=max_points,
                 feedback=grade_result["feedback"],
                 grading_status=grade_result["status"],
                 graded_at=datetime.utcnow()
             )
-            db.session.add(submission)
-            
-            total_score += grade_result["score"]
-            successful_grades += 1
-            
-            results.append({
-                "student_name": student_name,
-                "score": grade_result["score"],
-                "feedback": grade_result["feedback"],
-                "status": grade_result["status"]
-            })
-            
-            print(f"  ✅ Score: {grade_result['score']}/{max_points}", flush=True)
-            sys.stdout.flush()
-            
-        except Exception as e:
-            print(f"  ❌ Grading failed: {e}", flush=True)
-            import traceback
-            traceback.print_exc()
-            
+            totals["score"] += grade_result["score"]
+            totals["successful"] += 1
+            print(f"  ✅ {student_name}: {grade_result['score']}/{max_points}", flush=True)
+        else:
             # Save error result
-            submission = SubmissionResult(
-                assignment_id=assignment_id,
-                student_name=student_name,
-                submission_path=file_path,
+            fields.update(
                 score=0,
-                max_score=max_points,
-                feedback=f"Grading error: {str(e)}",
+                feedback=f"Grading error: {str(outcome['error'])}",
                 grading_status="error",
                 graded_at=datetime.utcnow()
             )
+        
+        submission = existing_rows.pop(student_name, None)
+        if submission is None:
+            submission = SubmissionResult(assignment_id=assignment_id, report_id=report.id, student_name=student_name)
             db.session.add(submission)
-            
-            results.append({
-                "student_name": student_name,
-                "score": 0,
-                "feedback": f"Grading error: {str(e)}",
-                "status": "error"
-            })
+        for field, value in fields.items():
+            setattr(submission, field, value)
+        rows_by_path[file_path] = submission
+        results_by_path[file_path] = {
+            "student_name": student_name,
+            "score": submission.score,
+            "feedback": submission.feedback,
+            "status": submission.grading_status
+        }
+    
+    def checkpoint(unit_outcomes):
+        """Store finished outcomes, fanned out to their duplicates, and commit them with the report counters"""
+        stored = []
+        for outcome in unit_outcomes:
+            representative = outcome["file_path"]
+            for file_path in members_of.get(representative, [representative]):
+                member = dict(outcome, file_path=file_path, fingerprint=fingerprints.get(file_path))
+                if file_path != representative:
+                    member["elapsed"] = 0.0
+                    member["llm_calls"] = []
+                store_outcome(member)
+                stored.append(member)
+        
+        # Store every LLM call next to the submission it graded
+        db.session.flush()
+        for outcome in stored:
+            batch_size = outcome.get("batch_size", 1)
+            submission_result_id = rows_by_path[outcome["file_path"]].id if batch_size == 1 else None
+            for record in outcome.get("llm_calls", []):
+                call_records.append((record, submission_result_id, batch_size))
+                db.session.add(LLMCallMetric(
+                    report_id=report.id,
+                    submission_result_id=submission_result_id,
+                    batch_size=batch_size,
+                    **record
+                ))
+        outcomes.extend(stored)
+        
+        report.graded_submissions = totals["successful"]
+        report.average_score = totals["score"] / totals["successful"] if totals["successful"] > 0 else 0
+        
+        # One live progress event per stored submission, with an ETA from this run's pace
+        remaining = len(python_files) - len(rows_by_path)
+        elapsed = time.perf_counter() - run_started
+        eta_seconds = round(elapsed / len(outcomes) * remaining, 1) if outcomes else None
+        for outcome in stored:
+            result = results_by_path[outcome["file_path"]]
+            progress_events.publish(assignment_id, 'submission', {
+                "report_id": report.id,
+                "student_name": result["student_name"],
+                "score": result["score"],
+                "max_score": max_points,
+                "status": result["status"],
+                "graded": totals["successful"],
+                "pending": totals["pending"],
+                "done": len(rows_by_path),
+                "total": len(python_files),
+                "running_average": round(report.average_score, 2),
+                "eta_seconds": eta_seconds
+            }, report_id=report.id)
+        db.session.commit()
+        progress_events.notify()
+    
+    # First checkpoint: the solution's calls and everything settled without the LLM
+    for record in solution_calls:
+        db.session.add(LLMCallMetric(report_id=report.id, submission_result_id=None, batch_size=1, **record))
+    checkpoint(list(static_outcomes.values()) + list(templated_outcomes.values()))
+    
+    def requested_stop():
+        """'pause' or 'cancel' once the run has been asked to stop (see GradingReport.control)"""
+        return db.session.query(GradingReport.control).filter_by(id=report.id).scalar()
+    
+    # Outside hybrid mode the tests run in the sandbox alongside LLM grading
+    stop_reason = None
+    try:
+        with ThreadPoolExecutor(max_workers=1) as sandbox_executor:
+            test_future = None
+            if test_runs is None:
+                # Stops between test cases too, so a stopped run does not wait for every test
+                test_future = sandbox_executor.submit(run_assignment_tests, test_cases, runnable, stop_event)
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                stop_reason = requested_stop()
+                if stop_reason:
+                    stop_event.set()
+                futures = set() if stop_reason else {executor.submit(grade_unit, unit) for unit in units}
+                while futures:
+                    done, futures = wait(futures, timeout=Config.GRADING_CONTROL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                    abandoned = abandon is not None and abandon.is_set()
+                    for future in done:
+                        if not future.cancelled() and not abandoned:
+                            checkpoint(future.result())
+                    # Between units, see whether the run was paused or cancelled
+                    if stop_reason is None:
+                        stop_reason = 'abandon' if abandoned else requested_stop()
+                        if stop_reason:
+                            print(f"🛑 Grading run {report.id}: {stop_reason} requested, stopping after in-flight calls", flush=True)
+                            stop_event.set()
+                            for future in futures:
+                                future.cancel()
+                            rate_governor.wake()
+            if abandon is not None and abandon.is_set():
+                # The report belongs to the run that took the job over
+                db.session.rollback()
+                if test_future is not None:
+                    test_future.cancel()
+                raise RunStopped()
+            if test_future is not None:
+                test_runs = test_future.result()
+    finally:
+        context.close()
+    wall_time = time.perf_counter() - run_started
+    llm_usage = token_stats_since(tokens_before)
+    if test_runs:
+        print(f"🧪 Ran {len(test_cases)} test cases against {len(test_runs)} submissions", flush=True)
+        for file_path, test_run in test_runs.items():
+            # A stopped run has no row yet for submissions it never got to
+            if file_path not in rows_by_path:
+                continue
+            for field, value in test_result_fields(test_run).items():
+                setattr(rows_by_path[file_path], field, value)
+    
+    call_summary = call_metrics.summarize_calls(
+        [record for record, _, _ in call_records], wall_time,
+        Config.LLM_PRICE_PER_MILLION_INPUT_TOKENS, Config.LLM_PRICE_PER_MILLION_OUTPUT_TOKENS
+    )
+    # Report totals cover every attempt of the report, including interrupted ones
+    report_summary = call_metrics.summarize_calls(
+        [metric.to_dict() for metric in LLMCallMetric.query.filter_by(report_id=report.id).all()], None,
+        Config.LLM_PRICE_PER_MILLION_INPUT_TOKENS, Config.LLM_PRICE_PER_MILLION_OUTPUT_TOKENS
+    )
     
     # Update report statistics
-    report.graded_submissions = successful_grades
-    report.average_score = total_score / successful_grades if successful_grades > 0 else 0
+    successful_grades = totals["successful"]
+    pending_grades = totals["pending"]
+    report.wall_time_seconds = round((report.wall_time_seconds or 0) + wall_time, 3)
+    report.llm_call_count = report_summary["calls"]
+    report.prompt_tokens = report_summary["tokens"]["prompt"]
+    report.output_tokens = report_summary["tokens"]["output"]
+    report.estimated_cost = report_summary["estimated_cost"]
+    if stop_reason:
+        report.status = 'paused' if stop_reason == 'pause' else 'cancelled'
+    else:
+        report.status = 'incomplete' if pending_grades else 'completed'
+    report.control = None
+    progress_events.publish(assignment_id, 'finished', {
+        "report_id": report.id,
+        "status": report.status,
+        "graded": successful_grades,
+        "pending": pending_grades,
+        "total": len(python_files),
+        "average_score": report.average_score,
+        "wall_time_seconds": round(wall_time, 3)
+    }, report_id=report.id)
     db.session.commit()
+    progress_events.notify()
+    results = [results_by_path[file_path] for file_path in python_files if file_path in results_by_path]
+    
+    # Compare against the time the same calls would have taken back to back
+    serial_time = sum(outcome["elapsed"] for outcome in outcomes)
+    speedup = serial_time / wall_time if wall_time > 0 else 1.0
     
     print(f"\n✅ Batch grading completed!")
     print(f"Successfully graded: {successful_grades}/{len(python_files)}")
+    if resumed:
+        print(f"⏭️  Carried over from the interrupted run: {len(resumed)}")
+    if pending_grades:
+        print(f"⏸️  Pending (AI provider unavailable): {pending_grades}")
+    if stop_reason:
+        print(f"🛑 Run {report.status}: {len(python_files) - len(rows_by_path)} submissions not graded")
     print(f"Average score: {report.average_score:.1f}/{max_points}")
+    print(f"⏱️  Wall time: {wall_time:.1f}s (serial estimate {serial_time:.1f}s, {speedup:.1f}x speedup)")
+    print(f"🚦 Rate governor: {rate_governor.snapshot()}")
+    print(f"🔗 Model clients: {llm_provider.client_stats()}")
+    if grade_cache is not None:
+        print(f"🗃️  Grade cache: {grade_cache.stats()}")
+    print(f"🔢 LLM usage this run by mode: {llm_usage}")
+    trimmed = sum(budget.original_tokens - budget.tokens for budget in budgets.values())
+    chunked = sum(1 for budget in budgets.values() if budget.chunked)
+    print(f"✂️  Trimmed {trimmed} tokens; {chunked} submissions graded in chunks")
+    pregrade_counts = {}
+    for decision in decisions.values():
+        if decision.category:
+            key = f"{decision.category}:{decision.action}"
+            pregrade_counts[key] = pregrade_counts.get(key, 0) + 1
+    print(f"🚧 Pre-grading: {pregrade_counts or 'all submissions sent to the LLM'}")
+    print(f"🧾 Response parsing: {get_parse_stats()}")
+    print(f"🔁 Retries used: {retry_budget.used}/{retry_budget.max_retries}")
+    print(f"🔌 Circuit breaker: {circuit_breaker.snapshot()}")
+    print(f"📈 LLM calls: {call_summary['calls']}, latency p50/p95 {call_summary['latency_seconds']['p50']}/"
+          f"{call_summary['latency_seconds']['p95']}s, est. cost {call_summary['estimated_cost']}")
     
     return {
         "report_id": report.id,
         "assignment_id": assignment_id,
         "generated_solution": reference_solution,
+        "reference_solution_version": reference.version if reference else None,
         "results": results,
         "average_score": report.average_score,
         "total_submissions": len(python_files),
-        "successful_grades": successful_grades
+        "successful_grades": successful_grades,
+        "pending_submissions": pending_grades,
+        "resumed_submissions": len(resumed),
+        "report_status": report.status,
+        "circuit_breaker": circuit_breaker.snapshot(),
+        "call_metrics": call_summary,
+        "distinct_submissions": len(distinct),
+        "duplicate_groups": [
+            [os.path.basename(file_path).replace('.py', '') for file_path in members]
+            for members in groups.values() if len(members) > 1
+        ],
+        "cache": grade_cache.stats() if grade_cache is not None else None,
+        "tokens": get_token_stats(),
+        "llm_usage": {
+            "by_mode": llm_usage,
+            "calls": sum(usage["calls"] for usage in llm_usage.values()),
+            "tokens": sum(usage["prompt_tokens"] + usage["output_tokens"] for usage in llm_usage.values()),
+            "templated_by_tests": len(templated_outcomes)
+        },
+        "submission_tokens": {
+            "original": sum(budget.original_tokens for budget in budgets.values()),
+            "graded": sum(budget.tokens for budget in budgets.values()),
+            "chunked_submissions": chunked
+        },
+        "parsing": get_parse_stats(),
+        "pregrade": {
+            "settled_without_llm": len(static_outcomes),
+            "reduced_prompt": len(reduced),
+            "by_category": pregrade_counts
+        },
+        "tests": {
+            "cases": len(test_cases),
+            "submissions_run": len(test_runs),
+            "all_passed": sum(1 for run in test_runs.values() if run["passed"] == run["total"])
+        },
+        "timing": {
+            "mode": mode,
+            "concurrency": concurrency,
+            "wall_time_seconds": round(wall_time, 3),
+            "serial_time_seconds": round(serial_time, 3),
+            "speedup": round(speedup, 2),
+            "retries_used": retry_budget.used
+        }
     }
 
 if __name__ == "__main__":
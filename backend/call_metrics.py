@@ -0,0 +1,146 @@
+"""
+Per-call LLM instrumentation.
+
+generate_content() reports every call here: queue wait in the rate
+governor, request latency, tokens, retries, model and cache status. The
+records go to the collector active on the calling thread, if any, so a
+grading worker can attach the calls it made to the submission it graded.
+grade_all_submissions persists them as LLMCallMetric rows, and
+summarize_calls() turns rows into per-run aggregates.
+"""
+
+import math
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+@contextmanager
+def collect():
+    """
+    Collect the records of every call made on this thread inside the block.
+
+    Yields:
+        list: Filled with one dict per call; nested collectors each get
+            their own calls only
+    """
+    previous = getattr(_local, 'records', None)
+    records = []
+    _local.records = records
+    try:
+        yield records
+    finally:
+        _local.records = previous
+
+
+def record(purpose, model_name=None, status="ok", queue_wait_seconds=0.0, latency_seconds=0.0,
+           total_seconds=0.0, prompt_tokens=0, output_tokens=0, cached_tokens=0, retries=0,
+           context_cached=False, error=None):
+    """
+    Report one LLM call (or a request answered without one).
+
+    Args:
+        purpose (str): 'grade', 'hybrid', 'reduced', 'chunk', 'batch' or 'solution'
+        status (str): 'ok', 'error', or 'grade_cache_hit' / 'coalesced'
+            for requests that needed no call of their own
+        queue_wait_seconds (float): Time spent waiting for the rate governor
+        latency_seconds (float): Duration of the final request
+        total_seconds (float): Including retries and backoff
+        cached_tokens (int): Prompt tokens served from provider context cache
+        context_cached (bool): Whether the prompt prefix was cached context
+    """
+    records = getattr(_local, 'records', None)
+    if records is None:
+        return
+    records.append({
+        "purpose": purpose,
+        "model_name": model_name,
+        "status": status,
+        "queue_wait_seconds": round(queue_wait_seconds, 4),
+        "latency_seconds": round(latency_seconds, 4),
+        "total_seconds": round(total_seconds, 4),
+        "prompt_tokens": prompt_tokens or 0,
+        "output_tokens": output_tokens or 0,
+        "cached_tokens": cached_tokens or 0,
+        "retries": retries,
+        "context_cached": context_cached,
+        "error": error
+    })
+
+
+def estimate_cost(prompt_tokens, output_tokens, input_price_per_million, output_price_per_million):
+    """Cost in the currency of the configured prices"""
+    return (prompt_tokens * input_price_per_million + output_tokens * output_price_per_million) / 1_000_000
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers, or None when empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize_calls(records, wall_time_seconds=None, input_price_per_million=0.0, output_price_per_million=0.0):
+    """
+    Aggregate call records of one run.
+
+    Args:
+        records (list): Dicts as produced by record() (or LLMCallMetric.to_dict())
+        wall_time_seconds (float): Duration of the run, for run throughput
+
+    Returns:
+        dict: counts, latency and queue wait percentiles, tokens, tokens/sec,
+            cost and a per-purpose breakdown
+    """
+    calls = [r for r in records if r["status"] in ("ok", "error")]
+    latencies = [r["latency_seconds"] for r in calls if r["status"] == "ok"]
+    waits = [r["queue_wait_seconds"] for r in calls]
+    prompt_tokens = sum(r["prompt_tokens"] for r in calls)
+    output_tokens = sum(r["output_tokens"] for r in calls)
+    call_time = sum(latencies)
+
+    def rounded(value, digits=3):
+        return round(value, digits) if value is not None else None
+
+    by_purpose = {}
+    for r in calls:
+        stats = by_purpose.setdefault(r["purpose"], {"calls": 0, "prompt_tokens": 0, "output_tokens": 0})
+        stats["calls"] += 1
+        stats["prompt_tokens"] += r["prompt_tokens"]
+        stats["output_tokens"] += r["output_tokens"]
+
+    return {
+        "calls": len(calls),
+        "failed_calls": sum(1 for r in calls if r["status"] == "error"),
+        "retries": sum(r["retries"] for r in calls),
+        "grade_cache_hits": sum(1 for r in records if r["status"] == "grade_cache_hit"),
+        "coalesced": sum(1 for r in records if r["status"] == "coalesced"),
+        "context_cached_calls": sum(1 for r in calls if r["context_cached"]),
+        "latency_seconds": {
+            "p50": rounded(percentile(latencies, 0.5)),
+            "p95": rounded(percentile(latencies, 0.95)),
+            "max": rounded(max(latencies) if latencies else None)
+        },
+        "queue_wait_seconds": {
+            "p50": rounded(percentile(waits, 0.5)),
+            "p95": rounded(percentile(waits, 0.95)),
+            "total": rounded(sum(waits))
+        },
+        "tokens": {
+            "prompt": prompt_tokens,
+            "output": output_tokens,
+            "cached": sum(r["cached_tokens"] for r in calls)
+        },
+        "tokens_per_second": {
+            # Whole run: all tokens over wall time; per call: output over request time
+            "run": rounded((prompt_tokens + output_tokens) / wall_time_seconds, 1) if wall_time_seconds else None,
+            "output_per_call_second": rounded(output_tokens / call_time, 1) if call_time else None
+        },
+        "estimated_cost": round(
+            estimate_cost(prompt_tokens, output_tokens, input_price_per_million, output_price_per_million), 6
+        ),
+        "by_purpose": by_purpose
+    }
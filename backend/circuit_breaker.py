@@ -0,0 +1,125 @@
+"""
+Circuit breaker for calls to the LLM provider.
+
+After a run of consecutive failures the breaker opens and calls fail fast
+without reaching the API. Once the reset timeout has passed it goes
+half-open and lets a single probe through: success closes it again,
+failure re-opens it for another timeout.
+"""
+
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the circuit is open"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker shared by every call in the process.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open the circuit
+        reset_timeout_seconds (float): How long to fail fast before probing
+        name (str): Label for log messages
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout_seconds=30.0, name="llm"):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.name = name
+        self._cond = threading.Condition()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._times_opened = 0
+        self._rejected = 0
+
+    def _refresh(self):
+        # Caller holds the lock
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_seconds:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+            print(f"🔌 DEBUG: Circuit '{self.name}' half-open, probing provider", flush=True)
+
+    @property
+    def state(self):
+        with self._cond:
+            self._refresh()
+            return self._state
+
+    def allow_request(self):
+        """True if a call may go out now; in half-open state only one probe is let through"""
+        with self._cond:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        """The provider answered (any response that is not an outage)"""
+        with self._cond:
+            if self._state != CLOSED:
+                print(f"✅ DEBUG: Circuit '{self.name}' closed, provider recovered", flush=True)
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            self._cond.notify_all()
+
+    def record_failure(self):
+        """The provider timed out or returned a server error"""
+        with self._cond:
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._consecutive_failures >= self.failure_threshold
+            ):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                self._times_opened += 1
+                print(f"🔌 DEBUG: Circuit '{self.name}' open after {self._consecutive_failures} consecutive failures; "
+                      f"failing fast for {self.reset_timeout_seconds:.0f}s", flush=True)
+            self._cond.notify_all()
+
+    def wait_until_ready(self, timeout):
+        """
+        Block until a call could go out: the circuit is closed, or half-open
+        with the probe slot free.
+
+        Returns:
+            bool: False if that did not happen within timeout seconds
+        """
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            while True:
+                self._refresh()
+                if self._state == CLOSED or (self._state == HALF_OPEN and not self._probe_in_flight):
+                    return True
+                now = time.monotonic()
+                if now >= deadline:
+                    return False
+                wait = deadline - now
+                if self._state == OPEN:
+                    wait = min(wait, max(0.0, self._opened_at + self.reset_timeout_seconds - now))
+                self._cond.wait(wait)
+
+    def snapshot(self):
+        with self._cond:
+            self._refresh()
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "times_opened": self._times_opened,
+                "rejected_calls": self._rejected
+            }
@@ -0,0 +1,92 @@
+"""
+Process-wide registry of reusable LLM model clients.
+
+Building a model client per call repeats client setup on every request.
+ClientRegistry builds one client per key (model name, cached-prefix
+handle) and hands the same object to every caller and thread afterwards.
+
+The registry is fork-safe: a child process of a pre-forking server never
+reuses clients (or transport channels) inherited from its parent. The
+first lookup after a fork drops them and runs the on_fork hook, so each
+worker builds its own.
+"""
+
+import os
+import threading
+import weakref
+
+
+def _renew_lock(reference):
+    registry = reference()
+    if registry is not None:
+        # The parent's lock may have been held at fork time; never wait on it
+        registry._lock = threading.Lock()
+
+
+class ClientRegistry:
+    """
+    Thread-safe cache of model clients.
+
+    Args:
+        on_fork (callable): Called once in a forked child before its first
+            lookup, e.g. to re-create the SDK's transport (optional)
+    """
+
+    def __init__(self, on_fork=None):
+        self.on_fork = on_fork
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._stats = {"created": 0, "reused": 0, "evicted": 0, "fork_resets": 0}
+        # Runs in the child right after fork, while the forking thread is its
+        # only thread, so no caller can be using the lock being replaced
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=lambda reference=weakref.ref(self): _renew_lock(reference))
+
+    def _check_fork(self):
+        """Drop clients inherited from a parent process; call with self._lock held"""
+        if os.getpid() == self._pid:
+            return
+        self._pid = os.getpid()
+        self._clients = {}
+        self._stats = {"created": 0, "reused": 0, "evicted": 0, "fork_resets": 1}
+        if self.on_fork is not None:
+            self.on_fork()
+
+    def get(self, key, factory):
+        """
+        Return the client for key, building it with factory() on first use.
+
+        Args:
+            key (hashable): e.g. (model_name, handle)
+            factory (callable): Builds a new client
+        """
+        with self._lock:
+            self._check_fork()
+            client = self._clients.get(key)
+            if client is not None:
+                self._stats["reused"] += 1
+                return client
+            client = factory()
+            self._clients[key] = client
+            self._stats["created"] += 1
+            return client
+
+    def evict(self, predicate):
+        """Drop every client whose key matches predicate(key)"""
+        with self._lock:
+            self._check_fork()
+            for key in [key for key in self._clients if predicate(key)]:
+                del self._clients[key]
+                self._stats["evicted"] += 1
+
+    def stats(self):
+        with self._lock:
+            self._check_fork()
+            lookups = self._stats["created"] + self._stats["reused"]
+            return dict(
+                self._stats,
+                clients=len(self._clients),
+                reuse_rate=round(self._stats["reused"] / lookups, 3) if lookups else None,
+                pid=self._pid
+            )
@@ -9,3 +9,100 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    
+    # Grading pipeline
+    GRADING_CONCURRENCY = int(os.environ.get('GRADING_CONCURRENCY', 8))  # parallel grade_submission calls per run
+    
+    # Gemini rate governor (AIMD concurrency inside RPM/TPM budgets)
+    GEMINI_REQUESTS_PER_MINUTE = int(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', 60))
+    GEMINI_TOKENS_PER_MINUTE = int(os.environ.get('GEMINI_TOKENS_PER_MINUTE', 250000))
+    GEMINI_INITIAL_CONCURRENCY = int(os.environ.get('GEMINI_INITIAL_CONCURRENCY', 4))
+    GEMINI_MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', 16))
+    GEMINI_MAX_THROTTLE_RETRIES = int(os.environ.get('GEMINI_MAX_THROTTLE_RETRIES', 8))
+    GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-2.5-flash')
+    
+    # LLM provider: 'gemini', or 'offline' for deterministic local responses (demos, throughput tests)
+    LLM_PROVIDER = os.environ.get('LLM_PROVIDER', 'gemini')
+    OFFLINE_LLM_LATENCY_SECONDS = float(os.environ.get('OFFLINE_LLM_LATENCY_SECONDS', 0))
+    OFFLINE_LLM_ERROR_RATE = float(os.environ.get('OFFLINE_LLM_ERROR_RATE', 0))
+    OFFLINE_LLM_ERROR_KIND = os.environ.get('OFFLINE_LLM_ERROR_KIND', 'timeout')  # timeout, server or throttle
+    OFFLINE_LLM_SEED = int(os.environ.get('OFFLINE_LLM_SEED', 0))
+    
+    # Persistent content-addressed cache of grading results
+    GRADE_CACHE_ENABLED = os.environ.get('GRADE_CACHE_ENABLED', 'true').lower() == 'true'
+    GRADE_CACHE_PATH = os.environ.get('GRADE_CACHE_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'grade_cache.db')
+    
+    # Identical grading/solution requests in flight at once share one LLM call;
+    # lock files in SINGLE_FLIGHT_LOCK_DIR extend this across worker processes
+    SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+    SINGLE_FLIGHT_CROSS_PROCESS = os.environ.get('SINGLE_FLIGHT_CROSS_PROCESS', 'true').lower() == 'true'
+    SINGLE_FLIGHT_LOCK_DIR = os.environ.get('SINGLE_FLIGHT_LOCK_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'single_flight')
+    SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS = float(os.environ.get('SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS', 300))
+    
+    # Per-submission token budget; larger files are trimmed, then graded in chunks
+    GRADING_MAX_SUBMISSION_TOKENS = int(os.environ.get('GRADING_MAX_SUBMISSION_TOKENS', 8000))
+    GRADING_CHUNK_TOKENS = int(os.environ.get('GRADING_CHUNK_TOKENS', 4000))
+    
+    # Static pre-grading gate: category=action pairs override pregrade.DEFAULT_POLICY
+    # (categories: empty, unreadable, binary, bad_encoding, too_large, syntax_error;
+    #  actions: llm, reduced, zero, error)
+    PREGRADE_ENABLED = os.environ.get('PREGRADE_ENABLED', 'true').lower() == 'true'
+    PREGRADE_POLICY = os.environ.get('PREGRADE_POLICY', '')
+    PREGRADE_MAX_BYTES = int(os.environ.get('PREGRADE_MAX_BYTES', 1000000))
+    PREGRADE_REDUCED_MAX_FRACTION = float(os.environ.get('PREGRADE_REDUCED_MAX_FRACTION', 0.5))
+    
+    # Sandboxed runs of submissions against the assignment's test cases (sandbox.py);
+    # needs unprivileged user namespaces, test cases are skipped where the kernel refuses them
+    SANDBOX_ENABLED = os.environ.get('SANDBOX_ENABLED', 'true').lower() == 'true'
+    SANDBOX_WORKERS = int(os.environ.get('SANDBOX_WORKERS', os.cpu_count() or 2))
+    SANDBOX_CPU_SECONDS = int(os.environ.get('SANDBOX_CPU_SECONDS', 2))
+    SANDBOX_WALL_SECONDS = float(os.environ.get('SANDBOX_WALL_SECONDS', 5))
+    SANDBOX_MEMORY_MB = int(os.environ.get('SANDBOX_MEMORY_MB', 256))
+    SANDBOX_MAX_OUTPUT_BYTES = int(os.environ.get('SANDBOX_MAX_OUTPUT_BYTES', 65536))
+    SANDBOX_MAX_PROCESSES = int(os.environ.get('SANDBOX_MAX_PROCESSES', 16))
+    
+    # 'single' sends one prompt per submission, 'batch' packs several into one prompt,
+    # 'hybrid' runs the test cases first and only sends ambiguous results to the LLM
+    GRADING_MODE = os.environ.get('GRADING_MODE', 'single')
+    HYBRID_PASS_SCORE_FRACTION = float(os.environ.get('HYBRID_PASS_SCORE_FRACTION', 1.0))  # every test passed
+    HYBRID_FAIL_SCORE_FRACTION = float(os.environ.get('HYBRID_FAIL_SCORE_FRACTION', 0.0))  # every test crashed or timed out
+    GRADING_BATCH_TOKEN_BUDGET = int(os.environ.get('GRADING_BATCH_TOKEN_BUDGET', 24000))  # prompt tokens per batch
+    GRADING_MAX_BATCH_SIZE = int(os.environ.get('GRADING_MAX_BATCH_SIZE', 10))
+    GRADING_DEDUPLICATE = os.environ.get('GRADING_DEDUPLICATE', 'true').lower() == 'true'  # grade near-duplicate submissions once
+    
+    # Provider context caching of the static grading prompt prefix
+    PROMPT_CACHE_ENABLED = os.environ.get('PROMPT_CACHE_ENABLED', 'true').lower() == 'true'
+    PROMPT_CACHE_MIN_TOKENS = int(os.environ.get('PROMPT_CACHE_MIN_TOKENS', 1024))  # provider minimum for cached content
+    PROMPT_CACHE_TTL_SECONDS = int(os.environ.get('PROMPT_CACHE_TTL_SECONDS', 3600))
+    
+    # LLM call deadlines and retries (exponential backoff with full jitter)
+    LLM_CALL_TIMEOUT_SECONDS = float(os.environ.get('LLM_CALL_TIMEOUT_SECONDS', 60))
+    LLM_SOLUTION_TIMEOUT_SECONDS = float(os.environ.get('LLM_SOLUTION_TIMEOUT_SECONDS', 120))
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 3))  # per call, for timeouts and 5xx
+    LLM_BACKOFF_BASE_SECONDS = float(os.environ.get('LLM_BACKOFF_BASE_SECONDS', 1.0))
+    LLM_BACKOFF_MAX_SECONDS = float(os.environ.get('LLM_BACKOFF_MAX_SECONDS', 30.0))
+    LLM_RETRY_BUDGET_PER_RUN = int(os.environ.get('LLM_RETRY_BUDGET_PER_RUN', 50))
+    
+    # Circuit breaker around the LLM provider
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5))
+    CIRCUIT_BREAKER_RESET_SECONDS = float(os.environ.get('CIRCUIT_BREAKER_RESET_SECONDS', 30))
+    GRADING_MAX_PAUSE_SECONDS = float(os.environ.get('GRADING_MAX_PAUSE_SECONDS', 300))  # then park the rest as pending
+    GRADING_CONTROL_POLL_SECONDS = float(os.environ.get('GRADING_CONTROL_POLL_SECONDS', 1))  # how often a run checks for pause/cancel
+    
+    # Background jobs (job_queue.py), run by worker.py processes
+    WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', 2))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 2))
+    JOB_HEARTBEAT_SECONDS = float(os.environ.get('JOB_HEARTBEAT_SECONDS', 15))
+    JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', 120))  # no heartbeat for this long: worker died
+    JOB_RETRY_DELAY_SECONDS = float(os.environ.get('JOB_RETRY_DELAY_SECONDS', 30))
+    
+    # Live grading progress (progress_events.py): events are stored in the database,
+    # so the web process sees those published by any worker process
+    PROGRESS_POLL_SECONDS = float(os.environ.get('PROGRESS_POLL_SECONDS', 0.5))  # one query per web process, not per client
+    PROGRESS_KEEPALIVE_SECONDS = float(os.environ.get('PROGRESS_KEEPALIVE_SECONDS', 15))
+    PROGRESS_EVENT_RETENTION_HOURS = float(os.environ.get('PROGRESS_EVENT_RETENTION_HOURS', 24))
+    
+    # Prices used for the estimated cost in grading metrics (per million tokens)
+    LLM_PRICE_PER_MILLION_INPUT_TOKENS = float(os.environ.get('LLM_PRICE_PER_MILLION_INPUT_TOKENS', 0.30))
+    LLM_PRICE_PER_MILLION_OUTPUT_TOKENS = float(os.environ.get('LLM_PRICE_PER_MILLION_OUTPUT_TOKENS', 2.50))
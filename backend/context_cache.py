@@ -0,0 +1,97 @@
+"""
+Provider-side context caching for prompts with a large static prefix.
+
+A grading run sends the same instructions, assignment, rubric and
+reference solution with every submission. PromptContext uploads that
+prefix once per run as cached content and hands out models bound to it,
+so each call only sends the per-student suffix. When caching is disabled,
+unavailable or the prefix is below the provider's minimum size, calls fall
+back to prefix + suffix. The prefix still comes first, which keeps the
+provider's implicit prefix caching effective.
+"""
+
+import datetime
+import threading
+
+import google.generativeai as genai
+
+
+class GeminiContextCacheClient:
+    """Thin wrapper over google.generativeai's CachedContent API"""
+
+    def create(self, model_name, prefix, ttl_seconds):
+        return genai.caching.CachedContent.create(
+            model=f"models/{model_name}",
+            display_name="grading-run-prefix",
+            contents=[prefix],
+            ttl=datetime.timedelta(seconds=ttl_seconds)
+        )
+
+    def model(self, model_name, handle=None):
+        if handle is not None:
+            return genai.GenerativeModel.from_cached_content(cached_content=handle)
+        return genai.GenerativeModel(model_name)
+
+    def delete(self, handle):
+        handle.delete()
+
+
+class PromptContext:
+    """
+    Static prompt prefix shared by every call of one run.
+
+    The prefix is registered lazily on first use, exactly once even when
+    called from many worker threads, and released by close().
+    """
+
+    def __init__(self, prefix, model_name, client, enabled=True, min_tokens=0, ttl_seconds=3600, estimate_tokens=None):
+        self.prefix = prefix
+        self.model_name = model_name
+        self.client = client
+        self.enabled = enabled
+        self.min_tokens = min_tokens
+        self.ttl_seconds = ttl_seconds
+        self.prefix_tokens = estimate_tokens(prefix) if estimate_tokens else None
+        self._lock = threading.Lock()
+        self._registered = False
+        self._handle = None
+
+    @property
+    def cached(self):
+        return self._handle is not None
+
+    def _register(self):
+        with self._lock:
+            if self._registered:
+                return
+            self._registered = True
+            if not self.enabled:
+                return
+            if self.prefix_tokens is not None and self.prefix_tokens < self.min_tokens:
+                print(f"ℹ️ DEBUG: Prompt prefix ({self.prefix_tokens} tokens) below context cache minimum, sending inline", flush=True)
+                return
+            try:
+                self._handle = self.client.create(self.model_name, self.prefix, self.ttl_seconds)
+                print(f"🧷 DEBUG: Registered cached prompt prefix ({self.prefix_tokens} tokens)", flush=True)
+            except Exception as e:
+                print(f"⚠️ DEBUG: Context caching unavailable, sending full prompts: {e}", flush=True)
+
+    def model(self):
+        """Model to call for this run, bound to the cached prefix when there is one"""
+        self._register()
+        return self.client.model(self.model_name, self._handle)
+
+    def prompt_for(self, suffix):
+        """Text to send for one call: only the suffix when the prefix is cached"""
+        self._register()
+        return suffix if self._handle is not None else self.prefix + suffix
+
+    def close(self):
+        """Release the provider-side cache at the end of the run"""
+        with self._lock:
+            handle, self._handle = self._handle, None
+        if handle is not None:
+            try:
+                self.client.delete(handle)
+            except Exception as e:
+                print(f"⚠️ DEBUG: Failed to delete cached prompt prefix: {e}", flush=True)
@@ -0,0 +1,115 @@
+"""
+Structural fingerprints for near-duplicate submission detection.
+
+Two submissions get the same fingerprint when they differ only in
+comments, docstrings, whitespace or the names chosen for variables,
+functions and classes. String literals and program structure are kept,
+so anything that can change the program's behaviour or output changes
+the fingerprint.
+"""
+
+import ast
+import builtins
+import hashlib
+import re
+
+_BUILTIN_NAMES = set(dir(builtins))
+
+
+class _Canonicalizer(ast.NodeTransformer):
+    """Strip docstrings and rename user identifiers to v0, v1, ... in order of appearance"""
+
+    def __init__(self):
+        self.names = {}
+
+    def _canonical(self, name):
+        if name is None or name in _BUILTIN_NAMES:
+            return name
+        if name not in self.names:
+            self.names[name] = f"v{len(self.names)}"
+        return self.names[name]
+
+    def visit_Expr(self, node):
+        # Bare string statements (docstrings, "comment" strings) do nothing
+        if isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            return None
+        return self.generic_visit(node)
+
+    def visit_Name(self, node):
+        node.id = self._canonical(node.id)
+        return node
+
+    def visit_arg(self, node):
+        node.arg = self._canonical(node.arg)
+        return self.generic_visit(node)
+
+    def visit_FunctionDef(self, node):
+        node.name = self._canonical(node.name)
+        return self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        node.name = self._canonical(node.name)
+        return self.generic_visit(node)
+
+    def visit_alias(self, node):
+        if node.asname:
+            node.asname = self._canonical(node.asname)
+        return node
+
+    def visit_Global(self, node):
+        node.names = [self._canonical(name) for name in node.names]
+        return node
+
+    visit_Nonlocal = visit_Global
+
+    def visit_ExceptHandler(self, node):
+        node.name = self._canonical(node.name)
+        return self.generic_visit(node)
+
+
+def _text_fingerprint(code):
+    """Fallback for files that do not parse: ignore comment lines and whitespace"""
+    lines = []
+    for line in (code or "").splitlines():
+        stripped = re.sub(r'\s+', '', line)
+        if stripped and not stripped.startswith('#'):
+            lines.append(stripped)
+    return hashlib.sha256(("text:" + "\n".join(lines)).encode('utf-8')).hexdigest()
+
+
+def fingerprint_source(code):
+    """
+    Return a SHA-256 fingerprint of a submission's normalized structure.
+
+    Args:
+        code (str): Python source code
+
+    Returns:
+        str: 64-character hex digest
+    """
+    try:
+        tree = ast.parse(code or "")
+    except (SyntaxError, ValueError):
+        return _text_fingerprint(code)
+
+    tree = _Canonicalizer().visit(tree)
+    dump = ast.dump(tree, annotate_fields=False, include_attributes=False)
+    return hashlib.sha256(("ast:" + dump).encode('utf-8')).hexdigest()
+
+
+def group_submissions(submissions):
+    """
+    Group submissions by fingerprint, preserving first-seen order.
+
+    Args:
+        submissions (list): (key, student_code) tuples
+
+    Returns:
+        dict: fingerprint -> list of keys; the first key is the representative
+    """
+    groups = {}
+    for key, code in submissions:
+        groups.setdefault(fingerprint_source(code), []).append(key)
+    return groups
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """
 Fix database schema to add subject_id column to assignments table
+and any columns added to existing tables since (see ADDED_COLUMNS)
 """
 
 import sys
@@ -11,12 +12,49 @@ from app import app
 from models import db, Professor, Assignment, Subject
 import sqlite3
 
+# Columns added to tables that already exist in deployed databases.
+# db.create_all() only creates missing tables, so these are added here.
+ADDED_COLUMNS = [
+    # (table, column, SQLite type)
+    ('submission_results', 'fingerprint', 'VARCHAR(64)'),
+    ('submission_results', 'submission_tokens', 'INTEGER'),
+    ('submission_results', 'graded_tokens', 'INTEGER'),
+    ('submission_results', 'grading_chunks', 'INTEGER'),
+    ('submission_results', 'pregrade_category', 'VARCHAR(32)'),
+    ('submission_results', 'tests_passed', 'INTEGER'),
+    ('submission_results', 'tests_total', 'INTEGER'),
+    ('submission_results', 'test_results', 'TEXT'),
+    ('grading_reports', 'wall_time_seconds', 'FLOAT'),
+    ('grading_reports', 'llm_call_count', 'INTEGER'),
+    ('grading_reports', 'prompt_tokens', 'INTEGER'),
+    ('grading_reports', 'output_tokens', 'INTEGER'),
+    ('grading_reports', 'estimated_cost', 'FLOAT'),
+    ('submission_results', 'report_id', 'INTEGER'),
+    ('submission_results', 'content_hash', 'VARCHAR(64)'),
+    ('grading_reports', 'status', 'VARCHAR(20)'),
+    ('grading_reports', 'rubric', 'TEXT'),
+    ('grading_reports', 'max_points', 'FLOAT'),
+    ('grading_reports', 'control', 'VARCHAR(20)'),
+]
+
+def add_missing_columns(cursor):
+    """Add every column in ADDED_COLUMNS that the database does not have yet"""
+    for table, column, column_type in ADDED_COLUMNS:
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = [row[1] for row in cursor.fetchall()]
+        if not existing:
+            continue  # table will be created by db.create_all()
+        if column not in existing:
+            print(f"Adding {column} column to {table} table...")
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            print(f"✅ {table}.{column} added")
+
 def fix_database_schema():
     """Add subject_id column to assignments table"""
     with app.app_context():
         try:
             # Get the database path
-            db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
+            db_path = db.engine.url.database  # resolved against the instance folder
             
             # Connect to SQLite database directly
             conn = sqlite3.connect(db_path)
@@ -39,10 +77,15 @@ def fix_database_schema():
             else:
                 print("✅ subject_id column already exists")
             
+            add_missing_columns(cursor)
+            
             # Commit changes
             conn.commit()
             conn.close()
             
+            # Create any new tables
+            db.create_all()
+            
             # Verify the change
             with app.app_context():
                 assignments = Assignment.query.all()
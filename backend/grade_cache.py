@@ -0,0 +1,106 @@
+"""
+Persistent, content-addressed cache of LLM grading results.
+
+Entries are keyed by a SHA-256 of everything that can change a grade: the
+normalized student code, assignment, rubric, reference solution, max
+points, prompt version and model name. The cache lives in its own SQLite
+file so grading workers can use it without a Flask app context.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+
+def normalize_code(code):
+    """Normalize line endings and trailing whitespace so cosmetic edits still hit"""
+    lines = (code or "").replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip('\n')
+
+
+def make_cache_key(student_code, assignment_description, rubric, reference_solution, max_points, prompt_version, model_name):
+    """Content hash identifying a single grading request"""
+    payload = json.dumps({
+        'code': normalize_code(student_code),
+        'assignment': (assignment_description or "").strip(),
+        'rubric': (rubric or "").strip(),
+        'reference': normalize_code(reference_solution),
+        'max_points': float(max_points),
+        'prompt_version': prompt_version,
+        'model': model_name
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class GradeCache:
+    """Thread-safe SQLite-backed grade cache with hit/miss counters"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS grade_cache (
+                cache_key TEXT PRIMARY KEY,
+                score REAL NOT NULL,
+                feedback TEXT NOT NULL,
+                model_name TEXT,
+                prompt_version TEXT,
+                created_at TEXT NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def get(self, cache_key):
+        """Return the cached {"score", "feedback"} for a key, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT score, feedback FROM grade_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE grade_cache SET hit_count = hit_count + 1 WHERE cache_key = ?", (cache_key,))
+            self._conn.commit()
+            return {"score": row[0], "feedback": row[1]}
+
+    def put(self, cache_key, score, feedback, model_name=None, prompt_version=None):
+        """Store a successful grade"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO grade_cache (cache_key, score, feedback, model_name, prompt_version, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key, score, feedback, model_name, prompt_version, datetime.utcnow().isoformat())
+            )
+            self._conn.commit()
+            self.stores += 1
+
+    def clear(self):
+        """Drop every cached grade"""
+        with self._lock:
+            self._conn.execute("DELETE FROM grade_cache")
+            self._conn.commit()
+
+    def stats(self):
+        """Hit/miss counters for this process plus the persistent entry count"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM grade_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'entries': entries,
+            'path': self.path
+        }
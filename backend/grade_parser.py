@@ -0,0 +1,144 @@
+"""
+Tolerant parsing of LLM grading responses.
+
+Grading calls request schema-constrained JSON, but responses can still
+arrive wrapped in markdown fences, with trailing commas, single quotes,
+Python literals or raw newlines inside strings. These helpers repair such
+near-miss JSON locally so a malformed response does not cost another LLM
+round trip.
+"""
+
+import json
+import re
+
+_FENCE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_UNQUOTED_KEY = re.compile(r'([{,]\s*)([A-Za-z_][A-Za-z0-9_]*)\s*:')
+_SINGLE_QUOTED = re.compile(r"'((?:[^'\\]|\\.)*)'")
+_PY_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+
+class GradeParseError(ValueError):
+    """Raised when a response cannot be turned into a grade, even after repair"""
+    pass
+
+
+def _extract_span(text, opener, closer):
+    """Return the first balanced opener...closer span, ignoring brackets inside strings"""
+    start = text.find(opener)
+    if start == -1:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == opener:
+            depth += 1
+        elif char == closer:
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    # Truncated response: close whatever string and brackets were left open
+    if depth > 0:
+        return text[start:] + ('"' if in_string else '') + closer * depth
+    return None
+
+
+def _escape_newlines_in_strings(text):
+    out = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif char == '\n':
+                out.append('\\n')
+                continue
+        elif char == '"':
+            in_string = True
+        out.append(char)
+    return ''.join(out)
+
+
+def _repair(text):
+    text = text.replace('“', '"').replace('”', '"').replace('‘', "'").replace('’', "'")
+    if '"' not in text:
+        text = _SINGLE_QUOTED.sub(lambda m: json.dumps(m.group(1)), text)
+    text = _UNQUOTED_KEY.sub(r'\1"\2":', text)
+    for literal, replacement in _PY_LITERALS.items():
+        text = re.sub(rf'(?<=[:\[,\s]){literal}(?=\s*[,}}\]])', replacement, text)
+    text = _TRAILING_COMMA.sub(r'\1', text)
+    return _escape_newlines_in_strings(text)
+
+
+def parse_json_lenient(text, expect='object'):
+    """
+    Parse JSON from an LLM response, repairing common defects.
+
+    Args:
+        text (str): Raw response text
+        expect (str): 'object' or 'array'
+
+    Returns:
+        tuple: (parsed value, repaired flag); repaired is False when strict
+            json.loads on the raw text succeeded
+    """
+    raw = (text or "").strip()
+    try:
+        return json.loads(raw), False
+    except (json.JSONDecodeError, ValueError):
+        pass
+
+    candidate = _FENCE.sub('', raw)
+    opener, closer = ('[', ']') if expect == 'array' else ('{', '}')
+    candidate = _extract_span(candidate, opener, closer) or candidate
+
+    for attempt in (candidate, _repair(candidate)):
+        try:
+            return json.loads(attempt), True
+        except (json.JSONDecodeError, ValueError):
+            continue
+    raise GradeParseError("Response is not valid JSON, even after repair")
+
+
+def parse_grade(text, max_points):
+    """
+    Extract a {"score", "feedback"} grade from a response.
+
+    Falls back to pulling the two fields out with regular expressions when
+    the JSON cannot be repaired.
+
+    Returns:
+        tuple: (score clamped to [0, max_points], feedback, repaired flag)
+    """
+    try:
+        result, repaired = parse_json_lenient(text, expect='object')
+        if not isinstance(result, dict) or "score" not in result or "feedback" not in result:
+            raise GradeParseError("Missing required fields")
+        score = float(result["score"])
+        feedback = str(result["feedback"]).strip()
+    except (GradeParseError, TypeError, ValueError):
+        score_match = re.search(r'["\']?score["\']?\s*[:=]\s*(-?\d+(?:\.\d+)?)', text or "", re.IGNORECASE)
+        feedback_match = re.search(r'["\']?feedback["\']?\s*[:=]\s*["\'](.*?)["\']\s*[,}]?\s*$', text or "", re.IGNORECASE | re.DOTALL)
+        if not score_match or not feedback_match:
+            raise GradeParseError("Could not find score and feedback in response")
+        score = float(score_match.group(1))
+        feedback = feedback_match.group(1).strip()
+        repaired = True
+
+    return max(0, min(score, max_points)), feedback, repaired
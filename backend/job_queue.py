@@ -0,0 +1,254 @@
+"""
+Durable job queue on the grading_jobs table.
+
+The web process only enqueues jobs; worker.py processes claim and run
+them. A claim is a conditional UPDATE (status still 'queued'), so two
+workers can never take the same job, on SQLite or any other database.
+While a job runs, its worker refreshes heartbeat_at; a job whose worker
+stops heartbeating (crash, killed host) is put back in the queue by the
+next worker that polls, up to max_attempts.
+
+Pausing or cancelling a running grade job is a request on its report
+(GradingReport.control) that the run honours between work units; the job
+then ends 'paused' or 'cancelled'. A queued job is cancelled directly.
+
+All functions need an application context.
+"""
+
+import json
+import os
+import shutil
+import socket
+import zipfile
+from datetime import datetime, timedelta
+
+from config import Config
+from models import db, Assignment, GradingJob, GradingReport
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+PAUSED = 'paused'
+CANCELLED = 'cancelled'
+
+# kind -> handler(job, lease_lost) returning the GradingReport id (or None);
+# lease_lost is a threading.Event set once the worker no longer owns the job
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register the function that runs jobs of this kind"""
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+def worker_name(index=0):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def enqueue(assignment_id, kind='grade', payload=None, max_attempts=None):
+    """
+    Add a job to the queue.
+
+    Returns:
+        GradingJob: The queued job
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}', expected one of {sorted(HANDLERS)}")
+    job = GradingJob(
+        assignment_id=assignment_id,
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        status=QUEUED,
+        max_attempts=max_attempts or Config.JOB_MAX_ATTEMPTS,
+        run_after=datetime.utcnow()
+    )
+    db.session.add(job)
+    db.session.commit()
+    print(f"📥 Queued {kind} job {job.id} for assignment {assignment_id}", flush=True)
+    return job
+
+
+def claim_next(worker_id):
+    """
+    Take the oldest runnable job, or return None when there is none.
+
+    Returns:
+        GradingJob: Now 'running' and owned by worker_id
+    """
+    while True:
+        now = datetime.utcnow()
+        candidate = db.session.query(GradingJob.id).filter(
+            GradingJob.status == QUEUED,
+            GradingJob.run_after <= now
+        ).order_by(GradingJob.id).first()
+        if candidate is None:
+            db.session.commit()
+            return None
+        claimed = GradingJob.query.filter_by(id=candidate.id, status=QUEUED).update({
+            'status': RUNNING,
+            'worker_id': worker_id,
+            'attempts': GradingJob.attempts + 1,
+            'started_at': now,
+            'heartbeat_at': now,
+            'finished_at': None,
+            'error': None
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(GradingJob, candidate.id)
+        # Another worker claimed it first; try the next one
+
+
+def heartbeat(job_id, worker_id):
+    """Mark a running job as alive; False if the worker no longer owns it"""
+    updated = GradingJob.query.filter_by(id=job_id, worker_id=worker_id, status=RUNNING).update(
+        {'heartbeat_at': datetime.utcnow()}, synchronize_session=False
+    )
+    db.session.commit()
+    return bool(updated)
+
+
+def complete(job, report_id=None):
+    # A run that stopped on request ends the job the same way
+    report_status = db.session.query(GradingReport.status).filter_by(id=report_id).scalar() if report_id else None
+    job.status = {'paused': PAUSED, 'cancelled': CANCELLED}.get(report_status, SUCCEEDED)
+    job.report_id = report_id
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def fail(job, error):
+    """Record a failed attempt; requeue with a delay while attempts remain"""
+    now = datetime.utcnow()
+    job.error = str(error)[:2000]
+    if job.attempts < job.max_attempts:
+        job.status = QUEUED
+        job.worker_id = None
+        job.run_after = now + timedelta(seconds=Config.JOB_RETRY_DELAY_SECONDS * job.attempts)
+    else:
+        job.status = FAILED
+        job.finished_at = now
+    db.session.commit()
+
+
+def cancel_queued(job_id):
+    """Cancel a job no worker has claimed yet; False if it is no longer queued"""
+    cancelled = GradingJob.query.filter_by(id=job_id, status=QUEUED).update(
+        {'status': CANCELLED, 'finished_at': datetime.utcnow()}, synchronize_session=False
+    )
+    db.session.commit()
+    return bool(cancelled)
+
+
+def request_stop(report, action):
+    """
+    Ask a grading run to pause or cancel at its next check.
+
+    Args:
+        action (str): 'pause' or 'cancel'
+    """
+    report.control = action
+    db.session.commit()
+    print(f"🛑 {action.capitalize()} requested for grading report {report.id}", flush=True)
+
+
+def requeue_stale():
+    """
+    Put running jobs whose worker stopped heartbeating back in the queue.
+
+    Returns:
+        int: Number of jobs recovered or given up on
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=Config.JOB_STALE_SECONDS)
+    stale = GradingJob.query.filter(GradingJob.status == RUNNING, GradingJob.heartbeat_at < cutoff).all()
+    for job in stale:
+        print(f"🧟 Job {job.id} lost its worker {job.worker_id}", flush=True)
+        fail(job, f"Worker {job.worker_id} stopped responding")
+    return len(stale)
+
+
+def queue_stats():
+    """Job counts by status and kind"""
+    rows = db.session.query(GradingJob.status, GradingJob.kind, db.func.count(GradingJob.id)).group_by(
+        GradingJob.status, GradingJob.kind
+    ).all()
+    by_status = {}
+    for status, kind, count in rows:
+        by_status.setdefault(status, {})[kind] = count
+    return {
+        "by_status": by_status,
+        "queued": sum(by_status.get(QUEUED, {}).values()),
+        "running": sum(by_status.get(RUNNING, {}).values())
+    }
+
+
+@handler('grade')
+def run_grade_job(job, lease_lost):
+    # Import here to avoid circular imports
+    from ai_service import grade_all_submissions
+    payload = json.loads(job.payload or '{}')
+
+    def remember_report(report):
+        # Committed with the report, so a retry of this job resumes it
+        job.report_id = report.id
+
+    result = grade_all_submissions(
+        job.assignment_id,
+        payload['rubric'],
+        payload['max_points'],
+        concurrency=payload.get('concurrency'),
+        mode=payload.get('mode'),
+        resume_report_id=job.report_id or payload.get('report_id'),
+        on_report=remember_report,
+        abandon=lease_lost
+    )
+    return result['report_id']
+
+
+@handler('extract')
+def run_extract_job(job, lease_lost):
+    """Unpack an uploaded submissions ZIP, then queue grading of it"""
+    payload = json.loads(job.payload or '{}')
+    zip_path = payload['zip_path']
+    upload_dir = os.path.dirname(zip_path)
+
+    # Every upload gets its own folder, swapped in whole once extracted, so a
+    # grade still running on the previous upload keeps its files and a
+    # retried job never sees a half-written folder
+    extract_path = os.path.join(upload_dir, f"extracted-{job.id}")
+    staging_path = f"{extract_path}.part"
+    shutil.rmtree(staging_path, ignore_errors=True)
+    with zipfile.ZipFile(zip_path, 'r') as archive:
+        archive.extractall(staging_path)
+    shutil.rmtree(extract_path, ignore_errors=True)
+    os.replace(staging_path, extract_path)
+    print(f"📂 Extracted {zip_path} to {extract_path}", flush=True)
+
+    assignment = db.session.get(Assignment, job.assignment_id)
+    assignment.extracted_folder_path = extract_path
+    db.session.commit()
+    remove_old_extractions(job.assignment_id, upload_dir, extract_path)
+
+    if payload.get('grade'):
+        enqueue(job.assignment_id, 'grade', payload['grade'])
+    return None
+
+
+def remove_old_extractions(assignment_id, upload_dir, current_path):
+    """
+    Delete earlier extracted folders of an upload directory, unless a grade
+    job of the assignment is running (it may still be reading one of them;
+    the next extraction cleans up instead).
+    """
+    grading = GradingJob.query.filter_by(assignment_id=assignment_id, kind='grade', status=RUNNING).count()
+    if grading:
+        print(f"📂 Keeping earlier extractions while {grading} grade job(s) run", flush=True)
+        return
+    for name in os.listdir(upload_dir):
+        path = os.path.join(upload_dir, name)
+        if path != current_path and os.path.isdir(path) and (name == 'extracted' or name.startswith('extracted-')):
+            shutil.rmtree(path, ignore_errors=True)
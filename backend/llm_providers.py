@@ -0,0 +1,365 @@
+"""
+LLM provider layer.
+
+ai_service talks to the model through an LLMProvider instead of calling
+google.generativeai directly. A provider hands out model objects with a
+Gemini-style generate_content(prompt, **kwargs) method, so the shared
+rate governor, retries and circuit breaker in ai_service.generate_content
+apply to every provider. It also offers sync, async and batch helpers and
+doubles as the PromptContext cache client (create/model/delete). Model
+objects come from a per-provider ClientRegistry, so they are built once
+per model and reused across calls and threads.
+
+Providers:
+    gemini  - Google Gemini via google.generativeai
+    offline - deterministic local responses with configurable latency and
+              error injection, for demos and reproducible throughput tests
+"""
+
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from client_registry import ClientRegistry
+from context_cache import GeminiContextCacheClient
+
+
+class LLMProvider:
+    """Interface implemented by every provider"""
+
+    name = None
+    model_name = None
+    clients = None
+
+    def model(self, model_name=None, handle=None):
+        """Shared model object with generate_content(prompt, **kwargs), bound to a cached prefix if handle is given"""
+        model_name = model_name or self.model_name
+        return self.clients.get((model_name, handle), lambda: self._build_model(model_name, handle))
+
+    def _build_model(self, model_name, handle):
+        raise NotImplementedError
+
+    def client_stats(self):
+        """Model client reuse counters"""
+        return self.clients.stats()
+
+    def create(self, model_name, prefix, ttl_seconds):
+        """Register a cached prompt prefix; return a handle for model()"""
+        raise NotImplementedError
+
+    def delete(self, handle):
+        """Release a cached prompt prefix"""
+        raise NotImplementedError
+
+    def generate(self, prompt, model_name=None, **kwargs):
+        """Synchronous call"""
+        return self.model(model_name).generate_content(prompt, **kwargs)
+
+    async def generate_async(self, prompt, model_name=None, **kwargs):
+        """Asynchronous call; runs the sync call in a worker thread unless overridden"""
+        return await asyncio.to_thread(self.generate, prompt, model_name, **kwargs)
+
+    def generate_batch(self, prompts, model_name=None, max_workers=4, **kwargs):
+        """
+        Send several independent prompts concurrently.
+
+        Returns:
+            list: One response per prompt, in order; a failed call leaves its
+                exception in place of the response
+        """
+        def call(prompt):
+            try:
+                return self.generate(prompt, model_name, **kwargs)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            return list(executor.map(call, prompts))
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through google.generativeai"""
+
+    name = "gemini"
+
+    def __init__(self, api_key=None, model_name="gemini-2.5-flash"):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._configure()
+        self._cache_client = GeminiContextCacheClient()
+        # A forked worker must not share the parent's gRPC channels
+        self.clients = ClientRegistry(on_fork=self._configure)
+
+    def _configure(self):
+        import google.generativeai as genai
+        genai.configure(api_key=self.api_key)
+
+    def _build_model(self, model_name, handle):
+        return self._cache_client.model(model_name, handle)
+
+    def create(self, model_name, prefix, ttl_seconds):
+        return self._cache_client.create(model_name or self.model_name, prefix, ttl_seconds)
+
+    def delete(self, handle):
+        self.clients.evict(lambda key: key[1] is handle)
+        self._cache_client.delete(handle)
+
+    async def generate_async(self, prompt, model_name=None, **kwargs):
+        return await self.model(model_name).generate_content_async(prompt, **kwargs)
+
+
+def _stable_hash(*parts):
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+class _Usage:
+    def __init__(self, prompt_tokens, output_tokens, cached_tokens=0):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.cached_content_token_count = cached_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class _Part:
+    def __init__(self, text):
+        self.text = text
+
+
+class _Content:
+    def __init__(self, text):
+        self.parts = [_Part(text)]
+
+
+class _Candidate:
+    def __init__(self, text):
+        self.content = _Content(text)
+
+
+class OfflineResponse:
+    """Mirrors the parts of a Gemini response that ai_service reads"""
+
+    def __init__(self, prompt, text, cached_prefix=""):
+        self.text = text
+        self.candidates = [_Candidate(text)]
+        self.usage_metadata = _Usage(max(1, len(prompt) // 4), max(1, len(text) // 4), len(cached_prefix) // 4)
+
+
+class InjectedTimeout(TimeoutError):
+    """Timeout raised on purpose by the offline provider"""
+    pass
+
+
+class InjectedServerError(Exception):
+    """503 raised on purpose by the offline provider"""
+
+    code = 503
+
+    def __init__(self):
+        super().__init__("503 Service unavailable (injected by offline provider)")
+
+
+class InjectedThrottle(Exception):
+    """429 raised on purpose by the offline provider"""
+
+    code = 429
+
+    def __init__(self):
+        super().__init__("429 Resource exhausted (injected by offline provider)")
+
+
+_INJECTED_ERRORS = {
+    "timeout": lambda: InjectedTimeout("Request timed out (injected by offline provider)"),
+    "server": InjectedServerError,
+    "throttle": InjectedThrottle
+}
+
+_MAX_POINTS = re.compile(r"Maximum Points:\s*(\d+(?:\.\d+)?)")
+_SINGLE_SUBMISSION = re.compile(r"Student Submission:\n(.*?)\n\nJSON Output:", re.DOTALL)
+_CHUNK_PART = re.compile(r"Student Submission \(part \d+ of \d+\):\n(.*?)\n\nJSON Output:", re.DOTALL)
+_CHUNK_NOTE_SCORE = re.compile(r"offline part score (\d+(?:\.\d+)?)")
+_BATCH_SUBMISSION = re.compile(r"=== SUBMISSION (\S+) ===\n(.*?)\n=== END SUBMISSION \1 ===", re.DOTALL)
+
+
+class OfflineModel:
+    """Offline stand-in for a GenerativeModel, optionally bound to a cached prefix"""
+
+    def __init__(self, provider, prefix=""):
+        self.provider = provider
+        self.prefix = prefix
+
+    def generate_content(self, prompt, generation_config=None, request_options=None, stream=False, **kwargs):
+        provider = self.provider
+        timeout = (request_options or {}).get("timeout")
+        if provider.latency_seconds and not stream:
+            if timeout is not None and provider.latency_seconds > timeout:
+                time.sleep(timeout)
+                raise InjectedTimeout(f"Request timed out after {timeout}s (offline latency {provider.latency_seconds}s)")
+            time.sleep(provider.latency_seconds)
+        provider.maybe_fail(prompt)
+        full_prompt = self.prefix + prompt
+        text = provider.respond(full_prompt, generation_config)
+        if stream:
+            return self._stream(full_prompt, text)
+        return OfflineResponse(full_prompt, text, self.prefix)
+
+    def _stream(self, prompt, text):
+        """Yield the response line by line, spreading the latency over the lines"""
+        pieces = text.splitlines(keepends=True) or [text]
+        delay = self.provider.latency_seconds / len(pieces)
+        for piece in pieces:
+            if delay:
+                time.sleep(delay)
+            yield OfflineResponse(prompt, piece)
+
+    async def generate_content_async(self, prompt, generation_config=None, request_options=None, **kwargs):
+        return await asyncio.to_thread(self.generate_content, prompt, generation_config, request_options, **kwargs)
+
+
+class OfflineProvider(LLMProvider):
+    """
+    Deterministic local provider.
+
+    The same prompt always gets the same answer, and grades depend only on
+    the submission, so runs are reproducible for throughput tests. Error
+    injection is deterministic too: whether attempt n of a prompt fails
+    depends only on (seed, prompt, n), not on thread scheduling.
+
+    Args:
+        latency_seconds (float): Simulated time per call; calls whose
+            request timeout is shorter raise a timeout
+        error_rate (float): Fraction of attempts that fail, 0.0 - 1.0
+        error_kind (str): 'timeout', 'server' (503) or 'throttle' (429)
+        seed (int): Changes which attempts fail and the score jitter
+    """
+
+    name = "offline"
+
+    def __init__(self, latency_seconds=0.0, error_rate=0.0, error_kind="timeout", seed=0,
+                 model_name="offline-deterministic"):
+        if error_kind not in _INJECTED_ERRORS:
+            raise ValueError(f"Unknown error_kind '{error_kind}', expected one of {sorted(_INJECTED_ERRORS)}")
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self.seed = seed
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._attempts = {}
+        self._caches = {}
+        self.clients = ClientRegistry()
+
+    def _build_model(self, model_name, handle):
+        with self._lock:
+            prefix = self._caches.get(handle, "") if handle is not None else ""
+        return OfflineModel(self, prefix)
+
+    def create(self, model_name, prefix, ttl_seconds):
+        with self._lock:
+            handle = f"offline-cache-{len(self._caches) + 1}"
+            self._caches[handle] = prefix
+        return handle
+
+    def delete(self, handle):
+        self.clients.evict(lambda key: key[1] == handle)
+        with self._lock:
+            self._caches.pop(handle, None)
+
+    def maybe_fail(self, prompt):
+        """Raise an injected error for this attempt of the prompt, if it is one of the unlucky ones"""
+        if self.error_rate <= 0:
+            return
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+        if _stable_hash(self.seed, key, attempt) / 2 ** 64 < self.error_rate:
+            raise _INJECTED_ERRORS[self.error_kind]()
+
+    def respond(self, prompt, generation_config=None):
+        """Deterministic response text for a full prompt"""
+        match = _MAX_POINTS.search(prompt)
+        max_points = float(match.group(1)) if match else 100.0
+
+        batch = _BATCH_SUBMISSION.findall(prompt)
+        if batch:
+            grades = []
+            for label, code in batch:
+                score, feedback = self.grade(code, max_points)
+                grades.append(f'{{"student": "{label}", "score": {score}, "feedback": "{feedback}"}}')
+            return "[" + ", ".join(grades) + "]"
+
+        # Map-reduce grading of an oversized submission: score each part, then average
+        part = _CHUNK_PART.search(prompt)
+        if part:
+            score, _ = self.grade(part.group(1), max_points)
+            return f'{{"notes": "Offline review, offline part score {score}"}}'
+        part_scores = [float(score) for score in _CHUNK_NOTE_SCORE.findall(prompt)]
+        if part_scores:
+            score = round(sum(part_scores) / len(part_scores), 1)
+            return f'{{"score": {score}, "feedback": "Offline grade from {len(part_scores)} parts."}}'
+
+        single = _SINGLE_SUBMISSION.search(prompt)
+        if single:
+            score, feedback = self.grade(single.group(1), max_points)
+            return f'{{"score": {score}, "feedback": "{feedback}"}}'
+
+        if "Generate the Python solution" in prompt:
+            return ("def main():\n"
+                    "    # Offline reference solution\n"
+                    "    print(\"Hello, World!\")\n\n"
+                    "if __name__ == \"__main__\":\n"
+                    "    main()")
+        return "Offline provider response"
+
+    def grade(self, code, max_points):
+        """Score a submission from simple structural checks plus a small stable jitter"""
+        if not code.strip():
+            return 0, "Empty submission."
+        checks = [
+            ("def " in code, "defines functions"),
+            ("main()" in code, "has a main entry point"),
+            ("input(" in code, "reads input"),
+            ("print(" in code, "prints output")
+        ]
+        met = [label for ok, label in checks if ok]
+        try:
+            compile(code, "<submission>", "exec")
+            syntax_ok = True
+        except (SyntaxError, ValueError):
+            syntax_ok = False
+
+        fraction = 0.3 + 0.15 * len(met)
+        if not syntax_ok:
+            fraction = min(fraction, 0.4)
+        fraction += (_stable_hash(self.seed, code) % 11 - 5) / 100
+        score = round(max(0.0, min(1.0, fraction)) * max_points, 1)
+
+        feedback = "Offline grade: " + (", ".join(met) if met else "no recognizable structure")
+        if not syntax_ok:
+            feedback += "; has syntax errors"
+        return score, feedback + "."
+
+
+PROVIDERS = {
+    GeminiProvider.name: GeminiProvider,
+    OfflineProvider.name: OfflineProvider
+}
+
+
+def get_provider(name, **options):
+    """
+    Create the provider registered under name.
+
+    Args:
+        name (str): 'gemini' or 'offline'
+        **options: Passed to the provider's constructor
+    """
+    try:
+        provider_class = PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown LLM provider '{name}', expected one of {sorted(PROVIDERS)}")
+    return provider_class(**options)
@@ -1,3 +1,4 @@
+import json
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from sqlalchemy import Text
@@ -73,7 +74,7 @@ class Assignment(db.Model):
     question_file_path = db.Column(db.String(500))  # Path to uploaded question file (DOCX, PDF, TXT)
     
     # LLM Integration fields (commented out for now to fix schema issues)
-    # ideal_solution = db.Column(Text)
+    # ideal_solution lives in the versioned reference_solutions table
     # rubrics = db.Column(Text)
     # llm_processing_status = db.Column(db.String(50), default='pending')  # pending, processing, completed, error
     # llm_processed_at = db.Column(db.DateTime)
@@ -81,6 +82,12 @@ class Assignment(db.Model):
     # Relationships
     grading_reports = db.relationship('GradingReport', backref='assignment', lazy=True, cascade='all, delete-orphan')
     submission_results = db.relationship('SubmissionResult', backref='assignment', lazy=True, cascade='all, delete-orphan')
+    reference_solutions = db.relationship('ReferenceSolution', backref='assignment', lazy=True, cascade='all, delete-orphan')
+    test_cases = db.relationship('TestCase', backref='assignment', lazy=True, cascade='all, delete-orphan',
+                                 order_by='TestCase.position')
+    test_vectors = db.relationship('TestVector', backref='assignment', lazy=True, cascade='all, delete-orphan')
+    grading_jobs = db.relationship('GradingJob', backref='assignment', lazy=True, cascade='all, delete-orphan')
+    grading_events = db.relationship('GradingEvent', backref='assignment', lazy=True, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Assignment {self.title}>'
@@ -111,8 +118,20 @@ class GradingReport(db.Model):
     total_submissions = db.Column(db.Integer, default=0)
     graded_submissions = db.Column(db.Integer, default=0)
     average_score = db.Column(db.Float)
+    wall_time_seconds = db.Column(db.Float)  # run totals; per-call rows are in llm_call_metrics
+    llm_call_count = db.Column(db.Integer)
+    prompt_tokens = db.Column(db.Integer)
+    output_tokens = db.Column(db.Integer)
+    estimated_cost = db.Column(db.Float)
+    status = db.Column(db.String(20))  # running, completed, incomplete (pending left), paused, cancelled; resumable unless completed/cancelled
+    control = db.Column(db.String(20))  # 'pause' or 'cancel' requested; the run checks it between work units
+    rubric = db.Column(Text)  # grading settings, reused when the run is resumed
+    max_points = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    call_metrics = db.relationship('LLMCallMetric', backref='report', lazy=True, cascade='all, delete-orphan')
+    submission_results = db.relationship('SubmissionResult', backref='report', lazy=True)
+    
     def __repr__(self):
         return f'<GradingReport {self.report_name}>'
     
@@ -125,6 +144,14 @@ class GradingReport(db.Model):
             'total_submissions': self.total_submissions,
             'graded_submissions': self.graded_submissions,
             'average_score': self.average_score,
+            'wall_time_seconds': self.wall_time_seconds,
+            'llm_call_count': self.llm_call_count,
+            'prompt_tokens': self.prompt_tokens,
+            'output_tokens': self.output_tokens,
+            'estimated_cost': self.estimated_cost,
+            'status': self.status,
+            'control': self.control,
+            'max_points': self.max_points,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
@@ -133,6 +160,7 @@ class SubmissionResult(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     assignment_id = db.Column(db.Integer, db.ForeignKey('assignments.id'), nullable=False)
+    report_id = db.Column(db.Integer, db.ForeignKey('grading_reports.id'), index=True)  # run that graded it
     student_name = db.Column(db.String(100), nullable=False)
     student_id = db.Column(db.String(50))
     submission_path = db.Column(db.String(500))
@@ -140,9 +168,20 @@ class SubmissionResult(db.Model):
     max_score = db.Column(db.Float)
     feedback = db.Column(Text)
     grading_status = db.Column(db.String(50), default='pending')  # pending, graded, error
+    fingerprint = db.Column(db.String(64), index=True)  # normalized AST hash; equal values were graded once
+    content_hash = db.Column(db.String(64))  # SHA-256 of the file; a resumed run skips unchanged graded files
+    submission_tokens = db.Column(db.Integer)  # estimated tokens of the file as uploaded
+    graded_tokens = db.Column(db.Integer)  # after trimming (token_budget)
+    grading_chunks = db.Column(db.Integer)  # > 1 when graded map-reduce style
+    pregrade_category = db.Column(db.String(32))  # failed static check (pregrade), if any
+    tests_passed = db.Column(db.Integer)  # sandbox run against the assignment's TestCases
+    tests_total = db.Column(db.Integer)
+    test_results = db.Column(Text)  # JSON list of per-case results (sandbox.run_submission)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     graded_at = db.Column(db.DateTime)
     
+    call_metrics = db.relationship('LLMCallMetric', backref='submission_result', lazy=True)
+    
     def __repr__(self):
         return f'<SubmissionResult {self.student_name}>'
     
@@ -150,6 +189,7 @@ class SubmissionResult(db.Model):
         return {
             'id': self.id,
             'assignment_id': self.assignment_id,
+            'report_id': self.report_id,
             'student_name': self.student_name,
             'student_id': self.student_id,
             'submission_path': self.submission_path,
@@ -157,6 +197,214 @@ class SubmissionResult(db.Model):
             'max_score': self.max_score,
             'feedback': self.feedback,
             'grading_status': self.grading_status,
+            'fingerprint': self.fingerprint,
+            'content_hash': self.content_hash,
+            'submission_tokens': self.submission_tokens,
+            'graded_tokens': self.graded_tokens,
+            'grading_chunks': self.grading_chunks,
+            'pregrade_category': self.pregrade_category,
+            'tests_passed': self.tests_passed,
+            'tests_total': self.tests_total,
+            'test_results': json.loads(self.test_results) if self.test_results else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'graded_at': self.graded_at.isoformat() if self.graded_at else None
         }
+
+class ReferenceSolution(db.Model):
+    __tablename__ = 'reference_solutions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignments.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 of the extracted question content
+    rubric_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of rubric + max points
+    solution = db.Column(Text, nullable=False)
+    model_name = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ReferenceSolution assignment={self.assignment_id} v{self.version}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'assignment_id': self.assignment_id,
+            'version': self.version,
+            'content_hash': self.content_hash,
+            'rubric_hash': self.rubric_hash,
+            'solution': self.solution,
+            'model_name': self.model_name,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class TestCase(db.Model):
+    __tablename__ = 'test_cases'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignments.id'), nullable=False)
+    name = db.Column(db.String(200))
+    stdin = db.Column(Text, default='')
+    expected_stdout = db.Column(Text)  # None: the case only has to exit cleanly
+    points = db.Column(db.Float, default=1.0)
+    position = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TestCase {self.name} assignment={self.assignment_id}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'assignment_id': self.assignment_id,
+            'name': self.name,
+            'stdin': self.stdin,
+            'expected_stdout': self.expected_stdout,
+            'points': self.points,
+            'position': self.position,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class TestVector(db.Model):
+    """Output of a reference solution for one test input, computed once and reused by every grading run"""
+    __tablename__ = 'test_vectors'
+    __table_args__ = (db.UniqueConstraint('assignment_id', 'reference_hash', 'input_hash'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignments.id'), nullable=False)
+    reference_hash = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 of the reference solution
+    input_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of the stdin
+    expected_stdout = db.Column(Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TestVector assignment={self.assignment_id} {self.input_hash[:8]}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'assignment_id': self.assignment_id,
+            'reference_hash': self.reference_hash,
+            'input_hash': self.input_hash,
+            'expected_stdout': self.expected_stdout,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class LLMCallMetric(db.Model):
+    """One LLM call made while grading (or a request answered without one), see call_metrics.py"""
+    __tablename__ = 'llm_call_metrics'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.Integer, db.ForeignKey('grading_reports.id'), nullable=False, index=True)
+    submission_result_id = db.Column(db.Integer, db.ForeignKey('submission_results.id'))  # None for shared calls
+    batch_size = db.Column(db.Integer, default=1)  # submissions the call graded
+    purpose = db.Column(db.String(20))  # grade, hybrid, reduced, chunk, batch, solution
+    model_name = db.Column(db.String(100))
+    status = db.Column(db.String(20))  # ok, error, grade_cache_hit, coalesced
+    queue_wait_seconds = db.Column(db.Float)
+    latency_seconds = db.Column(db.Float)
+    total_seconds = db.Column(db.Float)  # including retries and backoff
+    prompt_tokens = db.Column(db.Integer)
+    output_tokens = db.Column(db.Integer)
+    cached_tokens = db.Column(db.Integer)
+    retries = db.Column(db.Integer)
+    context_cached = db.Column(db.Boolean)
+    error = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<LLMCallMetric {self.purpose} {self.status} report={self.report_id}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'report_id': self.report_id,
+            'submission_result_id': self.submission_result_id,
+            'batch_size': self.batch_size,
+            'purpose': self.purpose,
+            'model_name': self.model_name,
+            'status': self.status,
+            'queue_wait_seconds': self.queue_wait_seconds,
+            'latency_seconds': self.latency_seconds,
+            'total_seconds': self.total_seconds,
+            'prompt_tokens': self.prompt_tokens,
+            'output_tokens': self.output_tokens,
+            'cached_tokens': self.cached_tokens,
+            'retries': self.retries,
+            'context_cached': self.context_cached,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class GradingJob(db.Model):
+    """Durable background job, claimed and run by worker.py processes (see job_queue.py)"""
+    __tablename__ = 'grading_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignments.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False, default='grade')
+    payload = db.Column(Text)  # JSON arguments for the job
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, succeeded, failed, paused, cancelled
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    worker_id = db.Column(db.String(100))
+    report_id = db.Column(db.Integer, db.ForeignKey('grading_reports.id'))
+    error = db.Column(Text)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)  # retry backoff
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<GradingJob {self.id} {self.kind} {self.status}>'
+    
+    def to_dict(self):
+        queued_seconds = None
+        if self.started_at and self.created_at:
+            queued_seconds = round((self.started_at - self.created_at).total_seconds(), 3)
+        run_seconds = None
+        if self.started_at and self.finished_at:
+            run_seconds = round((self.finished_at - self.started_at).total_seconds(), 3)
+        return {
+            'id': self.id,
+            'assignment_id': self.assignment_id,
+            'kind': self.kind,
+            'payload': json.loads(self.payload) if self.payload else None,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'worker_id': self.worker_id,
+            'report_id': self.report_id,
+            'error': self.error,
+            'queued_seconds': queued_seconds,
+            'run_seconds': run_seconds,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class GradingEvent(db.Model):
+    """Progress event of a grading run, streamed to dashboards (see progress_events.py)"""
+    __tablename__ = 'grading_events'
+    
+    id = db.Column(db.Integer, primary_key=True)  # also the SSE event id
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignments.id'), nullable=False, index=True)
+    report_id = db.Column(db.Integer, db.ForeignKey('grading_reports.id'), index=True)
+    event = db.Column(db.String(30), nullable=False)  # started, submission, finished, error
+    data = db.Column(Text)  # JSON payload
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<GradingEvent {self.id} {self.event}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'assignment_id': self.assignment_id,
+            'report_id': self.report_id,
+            'event': self.event,
+            'data': json.loads(self.data) if self.data else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,181 @@
+"""
+Static pre-grading gate.
+
+Cheap checks that run before a submission is queued for the LLM: can the
+file be read, is it text, is it within size limits, does it contain any
+code, does it parse. Each failed check is a category; the configured
+policy maps categories to an action:
+
+    llm     - grade normally
+    reduced - grade with a short prompt (no reference solution), score capped
+    zero    - deterministic score of 0, no LLM call
+    error   - no LLM call, flagged for manual review
+"""
+
+import ast
+import io
+import os
+import tokenize
+
+EMPTY = 'empty'
+UNREADABLE = 'unreadable'
+BINARY = 'binary'
+BAD_ENCODING = 'bad_encoding'
+TOO_LARGE = 'too_large'
+SYNTAX_ERROR = 'syntax_error'
+
+ACTIONS = ('llm', 'reduced', 'zero', 'error')
+
+DEFAULT_POLICY = {
+    EMPTY: 'zero',
+    UNREADABLE: 'error',
+    BINARY: 'zero',
+    BAD_ENCODING: 'llm',
+    TOO_LARGE: 'error',
+    SYNTAX_ERROR: 'reduced'
+}
+
+FEEDBACK = {
+    EMPTY: "The submission contains no code.",
+    UNREADABLE: "The submission file could not be read: {detail}",
+    BINARY: "The submission is not a text file.",
+    BAD_ENCODING: "The submission is not valid UTF-8 and was read as Latin-1.",
+    TOO_LARGE: "The submission is too large to grade automatically ({detail}).",
+    SYNTAX_ERROR: "The submission does not compile: {detail}"
+}
+
+
+class PregradeDecision:
+    """Outcome of the static checks for one file"""
+
+    def __init__(self, code, category=None, detail="", action='llm'):
+        self.code = code
+        self.category = category
+        self.detail = detail
+        self.action = action
+
+    @property
+    def feedback(self):
+        if self.category is None:
+            return ""
+        return FEEDBACK[self.category].format(detail=self.detail)
+
+    def to_dict(self):
+        return {
+            "category": self.category,
+            "detail": self.detail,
+            "action": self.action
+        }
+
+
+def parse_policy(spec):
+    """
+    Build a policy from 'category=action,...', on top of DEFAULT_POLICY.
+
+    Raises:
+        ValueError: For unknown categories or actions
+    """
+    policy = dict(DEFAULT_POLICY)
+    for item in (spec or "").split(','):
+        if not item.strip():
+            continue
+        category, _, action = item.partition('=')
+        category, action = category.strip(), action.strip()
+        if category not in DEFAULT_POLICY:
+            raise ValueError(f"Unknown pre-grading category '{category}'")
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown pre-grading action '{action}' for {category}")
+        policy[category] = action
+    return policy
+
+
+def _has_code(code):
+    """False for files holding only whitespace, comments and docstrings"""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        # Does not parse: it has code as long as there are non-comment tokens
+        try:
+            tokens = tokenize.generate_tokens(io.StringIO(code).readline)
+            return any(
+                token.type not in (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT,
+                                   tokenize.DEDENT, tokenize.ENDMARKER)
+                for token in tokens
+            )
+        except (tokenize.TokenError, SyntaxError):
+            return bool(code.strip())
+    return any(
+        not (isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str))
+        for node in tree.body
+    )
+
+
+def check_source(code, size_bytes, max_bytes):
+    """
+    Run the checks that only need the decoded text.
+
+    Returns:
+        tuple: (category or None, detail)
+    """
+    if max_bytes and size_bytes > max_bytes:
+        return TOO_LARGE, f"{size_bytes} bytes, limit {max_bytes}"
+    if not _has_code(code):
+        return EMPTY, ""
+    try:
+        compile(code, '<submission>', 'exec', dont_inherit=True)
+    except (SyntaxError, ValueError) as e:
+        line = getattr(e, 'lineno', None)
+        message = getattr(e, 'msg', None) or str(e)
+        return SYNTAX_ERROR, f"{message} (line {line})" if line else message
+    return None, ""
+
+
+def pregrade_file(file_path, policy=None, max_bytes=None):
+    """
+    Read a submission and run every static check on it.
+
+    Args:
+        file_path (str): Path of the .py file
+        policy (dict): category -> action (defaults to DEFAULT_POLICY)
+        max_bytes (int): Size limit; 0 or None disables the check
+
+    Returns:
+        PregradeDecision: Decoded code ("" if unreadable, cut at max_bytes
+            if too large), the first failed
+            check and the action the policy assigns to it
+    """
+    policy = policy or DEFAULT_POLICY
+
+    def decide(code, category, detail=""):
+        action = policy.get(category, 'llm') if category else 'llm'
+        return PregradeDecision(code, category, detail, action)
+
+    try:
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # Never hold more than the limit in memory; one extra byte shows
+            # a file that grew after the size was read
+            raw = f.read(max_bytes + 1) if max_bytes else f.read()
+    except OSError as e:
+        return decide("", UNREADABLE, str(e))
+    size = max(size, len(raw))
+
+    if b'\x00' in raw:
+        return decide("", BINARY)
+
+    if max_bytes and size > max_bytes:
+        # Keep only the part within the limit, for policies that still grade it
+        code = raw[:max_bytes].decode('utf-8-sig', errors='ignore')
+        return decide(code, TOO_LARGE, f"{size} bytes, limit {max_bytes}")
+
+    try:
+        code = raw.decode('utf-8-sig')
+        encoding_issue = False
+    except UnicodeDecodeError:
+        code = raw.decode('latin-1')
+        encoding_issue = True
+
+    category, detail = check_source(code, size, max_bytes)
+    if category is None and encoding_issue:
+        category = BAD_ENCODING
+    return decide(code, category, detail)
@@ -0,0 +1,199 @@
+"""
+Live grading progress: publish/subscribe over the grading_events table.
+
+Grading runs (in the web process or in worker.py processes) publish events
+as rows, committed together with the results they describe. Each web
+process runs one broker thread that reads new rows and fans them out to
+the in-memory queues of its subscribers, the SSE streams. Clients
+therefore cost no database queries of their own, and events from every
+worker process reach every dashboard. Publishing in the web process itself
+wakes the broker immediately instead of waiting for its next poll.
+
+Event ids must increase in commit order, so that a client reconnecting
+with the last id it saw is replayed exactly what it missed. SQLite gives
+this for free, since it runs one write transaction at a time. On
+PostgreSQL, publish() serializes event writers with a transaction-level
+advisory lock. Other databases are refused rather than silently skipping
+events that commit late.
+"""
+
+import json
+import queue
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from config import Config
+from models import db, GradingEvent
+
+# Arbitrary key of the PostgreSQL advisory lock held by event writers
+_WRITER_LOCK_KEY = 7201
+
+
+
+def publish(assignment_id, event, data, report_id=None):
+    """
+    Add a progress event to the current session; it is delivered once the
+    caller commits. Call notify() after the commit.
+
+    Args:
+        event (str): 'started', 'submission', 'finished' or 'error'
+        data (dict): JSON-serializable payload
+    """
+    _serialize_writers()
+    db.session.add(GradingEvent(
+        assignment_id=assignment_id,
+        report_id=report_id,
+        event=event,
+        data=json.dumps(data)
+    ))
+    if event == 'finished':
+        cutoff = datetime.utcnow() - timedelta(hours=Config.PROGRESS_EVENT_RETENTION_HOURS)
+        GradingEvent.query.filter(GradingEvent.created_at < cutoff).delete(synchronize_session=False)
+
+
+def _serialize_writers():
+    """Make event ids follow commit order on databases with concurrent writers"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return
+    if dialect == 'postgresql':
+        # Held until this transaction commits, so the next writer's ids come after ours
+        db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _WRITER_LOCK_KEY})
+        return
+    raise RuntimeError(f"Grading progress events need SQLite or PostgreSQL, not {dialect}")
+
+
+def latest_id():
+    """Id of the newest stored event (0 if none): a cursor for 'only what comes next'"""
+    return db.session.query(db.func.max(GradingEvent.id)).scalar() or 0
+
+
+def notify():
+    """Wake this process's broker to deliver newly committed events now"""
+    broker.wake()
+
+
+def replay(assignment_id, after_id=None):
+    """
+    Stored events to send a new subscriber.
+
+    Args:
+        after_id (int): Last event id the client has; None starts at the
+            latest run of the assignment
+
+    Returns:
+        list: Event dicts, oldest first
+    """
+    if after_id is None:
+        latest_start = GradingEvent.query.filter_by(assignment_id=assignment_id, event='started').order_by(
+            GradingEvent.id.desc()
+        ).first()
+        if latest_start is None:
+            return []
+        after_id = latest_start.id - 1
+    rows = GradingEvent.query.filter(
+        GradingEvent.assignment_id == assignment_id,
+        GradingEvent.id > after_id
+    ).order_by(GradingEvent.id).all()
+    return [row.to_dict() for row in rows]
+
+
+class Subscription:
+    """Events of one assignment, filled by the broker thread"""
+
+    def __init__(self, assignment_id, max_queued=1000):
+        self.assignment_id = assignment_id
+        self.events = queue.Queue(maxsize=max_queued)
+        self.lagged = False  # queue overflowed; the client should reconnect and replay
+
+    def deliver(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.lagged = True
+
+    def get(self, timeout):
+        """Next event, or None after timeout seconds"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ProgressBroker:
+    """
+    Reads new grading events with one query per poll and hands them to the
+    subscriptions of this process.
+
+    Args:
+        poll_seconds (float): Interval between reads while anyone subscribes
+    """
+
+    def __init__(self, poll_seconds):
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_id = None
+        self._stats = {"polls": 0, "delivered": 0}
+
+    def subscribe(self, app, assignment_id):
+        """
+        Start receiving an assignment's events. Needs an application context;
+        subscribe before replaying stored events, so none fall in between.
+        """
+        subscription = Subscription(assignment_id)
+        with self._lock:
+            if self._last_id is None:
+                # Read here rather than in the thread, before the caller replays
+                self._last_id = latest_id()
+            self._subscriptions.add(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(app,), daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self, app):
+        while True:
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            with self._lock:
+                subscriptions = list(self._subscriptions)
+            if not subscriptions:
+                continue
+            try:
+                with app.app_context():
+                    rows = GradingEvent.query.filter(GradingEvent.id > self._last_id).order_by(
+                        GradingEvent.id
+                    ).limit(500).all()
+                    events = [row.to_dict() for row in rows]
+                    db.session.remove()
+            except Exception as e:
+                print(f"⚠️  Progress broker poll failed: {e}", flush=True)
+                continue
+            self._stats["polls"] += 1
+            for event in events:
+                self._last_id = event["id"]
+                for subscription in subscriptions:
+                    if subscription.assignment_id == event["assignment_id"]:
+                        subscription.deliver(event)
+                        self._stats["delivered"] += 1
+            if len(events) == 500:
+                self._wake.set()  # more are waiting
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, subscribers=len(self._subscriptions), last_event_id=self._last_id)
+
+
+broker = ProgressBroker(Config.PROGRESS_POLL_SECONDS)
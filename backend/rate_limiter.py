@@ -0,0 +1,285 @@
+"""
+Adaptive rate governor for LLM API calls.
+
+Every request to the model passes through a RateGovernor, which enforces
+requests-per-minute and tokens-per-minute budgets over a sliding window
+and adapts the number of concurrent requests with AIMD: the limit grows
+by roughly one slot per round of successful calls and is cut
+multiplicatively whenever the provider throttles us (HTTP 429 / quota).
+
+A grading run that is paused or cancelled gives its place in the queue up
+at once: threads working for it run inside stop_on(event), and acquire()
+raises RunStopped in them as soon as the event is set and wake() is called.
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+WINDOW_SECONDS = 60.0
+
+_local = threading.local()
+
+
+class RunStopped(BaseException):
+    """
+    The calling thread's run was paused or cancelled while it waited for
+    capacity or a retry. Like asyncio.CancelledError it is not an Exception,
+    so handlers for failed LLM calls do not catch it.
+    """
+
+
+@contextmanager
+def stop_on(event):
+    """Make waits on this thread give up with RunStopped once event is set"""
+    previous = getattr(_local, 'stop_event', None)
+    _local.stop_event = event
+    try:
+        yield
+    finally:
+        _local.stop_event = previous
+
+
+def check_stopped():
+    """Raise RunStopped if this thread's run has been stopped"""
+    event = getattr(_local, 'stop_event', None)
+    if event is not None and event.is_set():
+        raise RunStopped()
+
+
+def sleep_unless_stopped(seconds):
+    """time.sleep() that ends early with RunStopped when the run is stopped"""
+    event = getattr(_local, 'stop_event', None)
+    if event is None:
+        time.sleep(seconds)
+    elif event.wait(seconds):
+        raise RunStopped()
+
+
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token)"""
+    if not text:
+        return 0
+    return len(text) // 4 + 1
+
+
+# "429 Resource exhausted", "... status code: 503", "HTTP 502 ..."
+_STATUS_IN_MESSAGE = re.compile(r'^\s*(\d{3})\b|\b(?:status|status code|http|error code)[\s:=]*(\d{3})\b')
+
+
+def status_code(error):
+    """HTTP status carried by an API exception (.code, .status_code or .response), or None"""
+    for candidate in (getattr(error, 'code', None), getattr(error, 'status_code', None),
+                      getattr(getattr(error, 'response', None), 'status_code', None)):
+        if isinstance(candidate, int) and not isinstance(candidate, bool) and 100 <= candidate <= 599:
+            return candidate
+    return None
+
+
+def message_status(message):
+    """
+    HTTP status quoted in an error message, for exceptions that carry no
+    code. Only a leading status or one labelled as such counts, so other
+    numbers in the message are ignored.
+    """
+    match = _STATUS_IN_MESSAGE.search(message.lower())
+    if match is None:
+        return None
+    return int(match.group(1) or match.group(2))
+
+
+def is_throttle_error(error):
+    """Return True if an exception means the provider is rate limiting us"""
+    try:
+        from google.api_core import exceptions as google_exceptions
+        if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+            return True
+    except ImportError:
+        pass
+
+    code = status_code(error)
+    if code is not None:
+        return code == 429
+
+    # Last resort for untyped errors
+    message = str(error).lower()
+    if message_status(message) == 429:
+        return True
+    return 'quota' in message or 'rate limit' in message or 'resource exhausted' in message
+
+
+class _Reservation:
+    """Budget held by a single in-flight request"""
+
+    def __init__(self, started_at, tokens):
+        self.started_at = started_at
+        self.tokens = tokens
+        self.tokens_used = None
+        self.wait_seconds = 0.0  # time spent queued in acquire()
+
+    def record_usage(self, tokens_used):
+        """Replace the estimated token count with the provider's actual count"""
+        if tokens_used:
+            self.tokens_used = tokens_used
+
+
+class RateGovernor:
+    """
+    Thread-safe RPM/TPM limiter with AIMD concurrency control.
+
+    Usage:
+        with governor.slot(estimated_tokens) as reservation:
+            response = model.generate_content(prompt)
+            reservation.record_usage(actual_tokens)
+
+    An exception raised inside the block is classified with
+    is_throttle_error(); throttles shrink the concurrency limit and pause
+    new requests for a short cool-down.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, initial_concurrency=4,
+                 min_concurrency=1, max_concurrency=16, decrease_factor=0.5, cooldown_seconds=2.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.concurrency_limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self.decrease_factor = decrease_factor
+        self.cooldown_seconds = cooldown_seconds
+
+        self._condition = threading.Condition()
+        self._requests = deque()  # start timestamps
+        self._tokens = deque()  # reservations, oldest first
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'errors': 0,
+            'tokens': 0,
+            'wait_seconds': 0.0,
+            'stopped_waits': 0
+        }
+
+    def _prune(self, now):
+        cutoff = now - WINDOW_SECONDS
+        while self._requests and self._requests[0] <= cutoff:
+            self._requests.popleft()
+        while self._tokens and self._tokens[0].started_at <= cutoff:
+            self._tokens.popleft()
+
+    def _tokens_in_window(self):
+        return sum(r.tokens_used if r.tokens_used is not None else r.tokens for r in self._tokens)
+
+    def _seconds_until_allowed(self, now, tokens):
+        """How long the caller must wait before the budgets admit a request"""
+        waits = [self._paused_until - now]
+
+        if self.requests_per_minute and len(self._requests) >= self.requests_per_minute:
+            waits.append(self._requests[0] + WINDOW_SECONDS - now)
+
+        if self.tokens_per_minute and self._tokens:
+            # A request larger than the whole budget is admitted on an empty window
+            excess = self._tokens_in_window() + tokens - self.tokens_per_minute
+            for reservation in self._tokens:
+                if excess <= 0:
+                    break
+                excess -= reservation.tokens_used if reservation.tokens_used is not None else reservation.tokens
+                waits.append(reservation.started_at + WINDOW_SECONDS - now)
+
+        return max(waits)
+
+    def acquire(self, estimated_tokens=0):
+        """Block until a request may be sent and return its reservation"""
+        wait_started = time.monotonic()
+        with self._condition:
+            while True:
+                try:
+                    check_stopped()
+                except RunStopped:
+                    self.stats['stopped_waits'] += 1
+                    raise
+                now = time.monotonic()
+                self._prune(now)
+                wait = self._seconds_until_allowed(now, estimated_tokens)
+                if self._in_flight < int(self.concurrency_limit) and wait <= 0:
+                    break
+                self._condition.wait(timeout=wait if wait > 0 else None)
+
+            reservation = _Reservation(now, estimated_tokens)
+            reservation.wait_seconds = now - wait_started
+            self._requests.append(now)
+            self._tokens.append(reservation)
+            self._in_flight += 1
+            self.stats['requests'] += 1
+            self.stats['wait_seconds'] += now - wait_started
+            return reservation
+
+    def release(self, reservation, throttled=False, failed=False):
+        """Return a slot and adapt the concurrency limit"""
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+
+            if throttled:
+                self.stats['throttled'] += 1
+                # Only cut once per burst: requests sent before the last cut
+                # were already accounted for
+                if reservation.started_at >= self._last_decrease:
+                    self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit * self.decrease_factor)
+                    self._last_decrease = now
+                    self._paused_until = now + self.cooldown_seconds
+                    print(f"🐢 DEBUG: Throttled by provider, concurrency limit now {int(self.concurrency_limit)}", flush=True)
+            elif failed:
+                self.stats['errors'] += 1
+            else:
+                self.stats['tokens'] += reservation.tokens_used if reservation.tokens_used is not None else reservation.tokens
+                # Additive increase: about +1 slot per full window of successes
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1.0 / self.concurrency_limit)
+
+            self._condition.notify_all()
+
+    def wake(self):
+        """Let waiting callers re-check whether their run was stopped"""
+        with self._condition:
+            self._condition.notify_all()
+
+    def slot(self, estimated_tokens=0):
+        """Context manager wrapping acquire()/release()"""
+        return _Slot(self, estimated_tokens)
+
+    def snapshot(self):
+        """Current limits and counters, for logging and status endpoints"""
+        with self._condition:
+            self._prune(time.monotonic())
+            return {
+                'concurrency_limit': int(self.concurrency_limit),
+                'in_flight': self._in_flight,
+                'requests_last_minute': len(self._requests),
+                'tokens_last_minute': self._tokens_in_window(),
+                'requests_per_minute': self.requests_per_minute,
+                'tokens_per_minute': self.tokens_per_minute,
+                **self.stats
+            }
+
+
+class _Slot:
+    def __init__(self, governor, estimated_tokens):
+        self.governor = governor
+        self.estimated_tokens = estimated_tokens
+        self.reservation = None
+
+    def __enter__(self):
+        self.reservation = self.governor.acquire(self.estimated_tokens)
+        return self.reservation
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is None:
+            self.governor.release(self.reservation)
+        else:
+            self.governor.release(self.reservation, throttled=is_throttle_error(exc), failed=True)
+        return False
@@ -0,0 +1,97 @@
+"""
+Retry policy for LLM calls: error classification, capped exponential
+backoff with full jitter, and a per-run retry budget.
+"""
+
+import random
+import threading
+
+from rate_limiter import is_throttle_error, message_status, status_code
+
+THROTTLED = 'throttled'
+RETRYABLE = 'retryable'
+FATAL = 'fatal'
+
+_RETRYABLE_STATUSES = (408, 500, 502, 503, 504)
+_RETRYABLE_MESSAGES = ('timed out', 'timeout', 'deadline', 'unavailable', 'connection reset',
+                       'connection aborted', 'temporarily')
+
+
+class RetryBudgetExhausted(Exception):
+    """Raised when a grading run has used up its retry budget"""
+    pass
+
+
+class LLMCallError(Exception):
+    """Raised when an LLM call fails with a fatal error or runs out of retries"""
+
+    def __init__(self, message, kind=FATAL, attempts=1):
+        super().__init__(message)
+        self.kind = kind
+        self.attempts = attempts
+
+
+def classify_error(error):
+    """
+    Classify an exception from an LLM call.
+
+    Returns:
+        str: THROTTLED (429 / quota), RETRYABLE (timeouts, 5xx, dropped
+            connections) or FATAL (bad request, auth, blocked prompt, ...)
+    """
+    if is_throttle_error(error):
+        return THROTTLED
+
+    try:
+        from google.api_core import exceptions as google_exceptions
+        if isinstance(error, (google_exceptions.DeadlineExceeded, google_exceptions.ServiceUnavailable,
+                              google_exceptions.InternalServerError, google_exceptions.BadGateway,
+                              google_exceptions.GatewayTimeout, google_exceptions.Aborted)):
+            return RETRYABLE
+        if isinstance(error, google_exceptions.GoogleAPICallError):
+            return FATAL
+    except ImportError:
+        pass
+
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return RETRYABLE
+
+    code = status_code(error)
+    if code is None:
+        code = message_status(str(error))
+    if code is not None:
+        return RETRYABLE if code in _RETRYABLE_STATUSES else FATAL
+
+    # Last resort for errors with neither a type nor a status we know
+    message = str(error).lower()
+    if any(fragment in message for fragment in _RETRYABLE_MESSAGES):
+        return RETRYABLE
+    return FATAL
+
+
+def backoff_delay(attempt, base_seconds, max_seconds):
+    """Capped exponential backoff with full jitter for the given retry number (1-based)"""
+    ceiling = min(max_seconds, base_seconds * (2 ** (attempt - 1)))
+    return random.uniform(0, ceiling)
+
+
+class RetryBudget:
+    """Thread-safe cap on the total number of retries across one grading run"""
+
+    def __init__(self, max_retries):
+        self.max_retries = max_retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def try_spend(self):
+        """Take one retry from the budget; False when none are left"""
+        with self._lock:
+            if self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+
+    @property
+    def remaining(self):
+        with self._lock:
+            return max(0, self.max_retries - self.used)
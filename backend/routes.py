@@ -1,21 +1,23 @@
-from flask import Blueprint, request, jsonify, current_app
-from models import db, Professor, Assignment, GradingReport, SubmissionResult, Subject
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from models import db, Professor, Assignment, GradingReport, SubmissionResult, Subject, ReferenceSolution, TestCase, LLMCallMetric, GradingJob
+from config import Config
 import os
 import zipfile
 import shutil
 import tempfile
+import json
 from datetime import datetime
 
 # Conditional import to handle missing ai_service gracefully
 try:
-    from ai_service import grade_all_submissions, generate_solution
+    from ai_service import grade_all_submissions, generate_solution, get_reference_solution
     AI_SERVICE_AVAILABLE = True
 except ImportError as e:
     print(f"Warning: ai_service not available: {e}")
     AI_SERVICE_AVAILABLE = False
     
     # Mock functions for when AI service is not available
-    def grade_all_submissions(assignment_id, rubric, max_points):
+    def grade_all_submissions(assignment_id, rubric, max_points, concurrency=None, mode=None):
         return {
             'report_id': 'mock_report',
             'total_submissions': 0,
@@ -27,6 +29,10 @@ except ImportError as e:
     def generate_solution(assignment_description, rubric, max_points):
         return f"Mock solution for: {assignment_description}"
 
+# Rubric used when the professor has not supplied one. The solution endpoint
+# and upload auto-grading must agree on it so they share one reference solution.
+DEFAULT_RUBRIC = "Code quality, correctness, efficiency, and adherence to requirements"
+
 def extract_assignment_content(file, title, description):
     """
     Enhanced file content extraction with better error handling and validation
@@ -325,68 +331,49 @@ def upload_assignment_zip(assignment_id):
         return jsonify({'error': 'File must be a ZIP file'}), 400
     
     # Create assignment-specific directory
-    assignment_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], f'assignment_{assignment_id}')
+    assignment_dir = os.path.abspath(os.path.join(current_app.config['UPLOAD_FOLDER'], f'assignment_{assignment_id}'))
     os.makedirs(assignment_dir, exist_ok=True)
     
-    # Save the zip file
-    zip_path = os.path.join(assignment_dir, file.filename)
-    file.save(zip_path)
-    
-    # Extract the zip file
-    extract_path = os.path.join(assignment_dir, 'extracted')
-    os.makedirs(extract_path, exist_ok=True)
-    
+    # Save the zip file durably before acknowledging it: write aside, fsync, rename
+    zip_path = os.path.join(assignment_dir, os.path.basename(file.filename))
+    partial_path = zip_path + '.part'
     try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_path)
+        file.save(partial_path)
+        with open(partial_path, 'rb') as saved:
+            os.fsync(saved.fileno())
+        if not zipfile.is_zipfile(partial_path):
+            os.remove(partial_path)
+            return jsonify({'error': 'Invalid ZIP file'}), 400
+        os.replace(partial_path, zip_path)
         
-        # Update assignment with file paths
         assignment.zip_file_path = zip_path
-        assignment.extracted_folder_path = extract_path
         db.session.commit()
         
-        # Automatically start grading process after successful upload
-        import sys
-        sys.stdout.flush()  # Force flush to ensure messages appear
-        print(f"🚀 Starting grading for assignment {assignment_id}", flush=True)
-        print(f"📁 ZIP file saved to: {zip_path}", flush=True)
-        print(f"📂 Extracted to: {extract_path}", flush=True)
-        
-        try:
-            # Use default rubric and max points
-            default_rubric = "Code quality, correctness, efficiency, and adherence to requirements"
-            max_points = assignment.max_points or 100
-            
-            print(f"📋 Using rubric: {default_rubric}", flush=True)
-            print(f"📊 Max points: {max_points}", flush=True)
-            
-            # Import here to avoid circular imports
-            from ai_service import grade_all_submissions
-            
-            # Run grading synchronously (blocks until complete)
-            print(f"🔄 Starting synchronous grading for assignment {assignment_id}", flush=True)
-            print(f"⏰ This will take approximately 30-60 seconds...", flush=True)
-            result = grade_all_submissions(assignment_id, default_rubric, max_points)
-            print(f"✅ Auto-grading completed for assignment {assignment_id}", flush=True)
-            print(f"📊 Results: {result['total_submissions']} submissions, avg score: {result['average_score']}", flush=True)
-            sys.stdout.flush()
-            
-        except Exception as e:
-            print(f"⚠️ Grading failed: {e}")
-            import traceback
-            traceback.print_exc()
-            # Don't fail the upload if grading fails
+        # Extraction and grading run in the workers (worker.py); the extract
+        # job queues the grade job once the submissions are on disk
+        import job_queue
+        # Read the stream cursor first, so the new job's events all come after it
+        events_url = _grading_events_url(assignment_id)
+        job = job_queue.enqueue(assignment_id, 'extract', {
+            'zip_path': zip_path,
+            'grade': {
+                'rubric': DEFAULT_RUBRIC,
+                'max_points': assignment.max_points or 100
+            }
+        })
+        print(f"📁 ZIP file saved to: {zip_path}, extraction and grading queued", flush=True)
         
         return jsonify({
-            'message': 'File uploaded, extracted, and graded successfully',
+            'message': 'File uploaded; extraction and grading queued',
             'zip_path': zip_path,
-            'extracted_path': extract_path,
-            'grading_status': 'completed'
-        }), 200
+            'grading_status': job.status,
+            'job': job.to_dict(),
+            'events_url': events_url
+        }), 202
         
-    except zipfile.BadZipFile:
-        return jsonify({'error': 'Invalid ZIP file'}), 400
     except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
         return jsonify({'error': f'Error processing file: {str(e)}'}), 500
 
 @main_bp.route('/api/assignments/<int:assignment_id>/submissions', methods=['GET'])
@@ -395,6 +382,87 @@ def get_submissions(assignment_id):
     submissions = SubmissionResult.query.filter_by(assignment_id=assignment_id).all()
     return jsonify([submission.to_dict() for submission in submissions])
 
+@main_bp.route('/api/assignments/<int:assignment_id>/test-cases', methods=['GET', 'POST'])
+def assignment_test_cases(assignment_id):
+    """Inputs (stdin) and expected outputs that submissions are run against in the sandbox"""
+    assignment = Assignment.query.get_or_404(assignment_id)
+    
+    if request.method == 'GET':
+        return jsonify([case.to_dict() for case in assignment.test_cases])
+    
+    elif request.method == 'POST':
+        data = request.get_json()
+        case = TestCase(
+            assignment_id=assignment_id,
+            name=data.get('name'),
+            stdin=data.get('stdin', ''),
+            expected_stdout=data.get('expected_stdout'),
+            points=data.get('points', 1.0),
+            position=data.get('position', len(assignment.test_cases))
+        )
+        db.session.add(case)
+        db.session.commit()
+        return jsonify(case.to_dict()), 201
+
+@main_bp.route('/api/test-cases/<int:test_case_id>', methods=['DELETE'])
+def delete_test_case(test_case_id):
+    case = TestCase.query.get_or_404(test_case_id)
+    db.session.delete(case)
+    db.session.commit()
+    return jsonify({'success': True}), 200
+
+@main_bp.route('/api/assignments/<int:assignment_id>/run-tests', methods=['POST'])
+def run_assignment_tests(assignment_id):
+    """
+    Run the stored submissions against the assignment's test cases, without
+    any LLM call, and store the results on each SubmissionResult
+    """
+    if not AI_SERVICE_AVAILABLE:
+        return jsonify({'error': 'AI service not available'}), 503
+    
+    from ai_service import fill_expected_outputs, load_test_cases, run_assignment_tests as run_tests, test_result_fields
+    from pregrade import pregrade_file
+    
+    assignment = Assignment.query.get_or_404(assignment_id)
+    cases = load_test_cases(assignment)
+    if not cases:
+        return jsonify({'error': 'Assignment has no test cases (or the sandbox is disabled or unavailable on this host)'}), 400
+    
+    # Expected outputs come from the latest stored reference solution
+    reference = ReferenceSolution.query.filter_by(assignment_id=assignment_id).order_by(
+        ReferenceSolution.version.desc()
+    ).first()
+    if reference:
+        cases = fill_expected_outputs(assignment, reference.solution, cases)
+    
+    # Only the latest report's rows; older reports keep the results they had
+    latest_report = GradingReport.query.filter_by(assignment_id=assignment_id).order_by(GradingReport.id.desc()).first()
+    results = SubmissionResult.query.filter_by(
+        assignment_id=assignment_id,
+        report_id=latest_report.id if latest_report else None
+    ).all()
+    runnable = []
+    for result in results:
+        if not result.submission_path or not os.path.exists(result.submission_path):
+            continue
+        decision = pregrade_file(result.submission_path, max_bytes=Config.PREGRADE_MAX_BYTES)
+        if decision.category in (None, 'bad_encoding'):
+            runnable.append((result.id, decision.code))
+    
+    test_runs = run_tests(cases, runnable)
+    for result in results:
+        if result.id in test_runs:
+            for field, value in test_result_fields(test_runs[result.id]).items():
+                setattr(result, field, value)
+    db.session.commit()
+    
+    return jsonify({
+        'assignment_id': assignment_id,
+        'test_cases': len(cases),
+        'submissions_run': len(test_runs),
+        'results': [result.to_dict() for result in results if result.id in test_runs]
+    }), 200
+
 @main_bp.route('/api/grading-reports', methods=['GET', 'POST'])
 def grading_reports():
     if request.method == 'GET':
@@ -458,7 +526,11 @@ def grade_assignment(assignment_id):
             return jsonify({'error': 'Rubric is required'}), 400
         
         # Call AI grading function
-        result = grade_all_submissions(assignment_id, rubric, max_points)
+        result = grade_all_submissions(
+            assignment_id, rubric, max_points,
+            concurrency=data.get('concurrency'),
+            mode=data.get('mode')
+        )
         
         return jsonify({
             'success': True,
@@ -468,7 +540,8 @@ def grade_assignment(assignment_id):
             'total_submissions': result['total_submissions'],
             'successful_grades': result['successful_grades'],
             'average_score': result['average_score'],
-            'results': result['results']
+            'results': result['results'],
+            'timing': result.get('timing')
         }), 200
         
     except ValueError as e:
@@ -479,7 +552,7 @@ def grade_assignment(assignment_id):
 @main_bp.route('/api/assignments/<int:assignment_id>/grade-async', methods=['POST'])
 def grade_assignment_async(assignment_id):
     """
-    Start grading process asynchronously (returns immediately)
+    Queue grading for the background workers (returns immediately)
     """
     try:
         # Get assignment
@@ -496,26 +569,23 @@ def grade_assignment_async(assignment_id):
         if not rubric:
             return jsonify({'error': 'Rubric is required'}), 400
         
-        # Start grading in background (simplified for now)
-        import threading
-        
-        def grade_background():
-            try:
-                grade_all_submissions(assignment_id, rubric, max_points)
-                print(f"✅ Background grading completed for assignment {assignment_id}")
-            except Exception as e:
-                print(f"❌ Background grading failed: {e}")
-        
-        # Start background thread
-        thread = threading.Thread(target=grade_background)
-        thread.daemon = True
-        thread.start()
+        # Workers (worker.py) pick the job up from the database
+        import job_queue
+        events_url = _grading_events_url(assignment_id)
+        job = job_queue.enqueue(assignment_id, 'grade', {
+            'rubric': rubric,
+            'max_points': max_points,
+            'concurrency': data.get('concurrency'),
+            'mode': data.get('mode')
+        })
         
         return jsonify({
             'success': True,
-            'message': 'Grading started in background',
+            'message': 'Grading queued',
             'assignment_id': assignment_id,
-            'status': 'processing'
+            'status': job.status,
+            'job': job.to_dict(),
+            'events_url': events_url
         }), 202
         
     except ValueError as e:
@@ -529,6 +599,28 @@ def get_grading_status(assignment_id):
     Check the grading status for an assignment
     """
     try:
+        # A queued or running job takes precedence over older reports
+        active_job = GradingJob.query.filter(
+            GradingJob.assignment_id == assignment_id,
+            GradingJob.status.in_(['queued', 'running'])
+        ).order_by(GradingJob.created_at.desc()).first()
+        if active_job:
+            status = {
+                'status': active_job.status,
+                'message': 'Waiting for a worker' if active_job.status == 'queued' else 'Grading in progress',
+                'job': active_job.to_dict()
+            }
+            # The report's counters advance as each submission is committed
+            report = GradingReport.query.get(active_job.report_id) if active_job.report_id else None
+            if report:
+                status.update({
+                    'report_id': report.id,
+                    'total_submissions': report.total_submissions,
+                    'graded_submissions': report.graded_submissions,
+                    'progress_percentage': (report.graded_submissions / report.total_submissions) * 100 if report.total_submissions > 0 else 0
+                })
+            return jsonify(status), 200
+        
         # Get the latest grading report for this assignment
         latest_report = GradingReport.query.filter_by(assignment_id=assignment_id).order_by(GradingReport.created_at.desc()).first()
         
@@ -538,12 +630,29 @@ def get_grading_status(assignment_id):
                 'message': 'No grading has been started for this assignment'
             }), 200
         
-        # Check if grading is complete
-        if latest_report.graded_submissions == latest_report.total_submissions:
+        # A stopped run stays stopped until it is resumed
+        if latest_report.status in ('paused', 'cancelled'):
+            graded = latest_report.graded_submissions or 0
+            return jsonify({
+                'status': latest_report.status,
+                'message': 'Grading paused; resume it to grade the rest' if latest_report.status == 'paused' else 'Grading cancelled',
+                'report_id': latest_report.id,
+                'report_status': latest_report.status,
+                'total_submissions': latest_report.total_submissions,
+                'graded_submissions': graded,
+                'remaining_submissions': max(0, (latest_report.total_submissions or 0) - graded),
+                'average_score': latest_report.average_score
+            }), 200
+        
+        # Check if grading is complete (reports from before status was tracked: by counters)
+        if latest_report.status in ('completed', 'incomplete') or (
+            latest_report.status is None and latest_report.graded_submissions == latest_report.total_submissions
+        ):
             return jsonify({
                 'status': 'completed',
                 'message': 'Grading completed successfully',
                 'report_id': latest_report.id,
+                'report_status': latest_report.status,
                 'total_submissions': latest_report.total_submissions,
                 'graded_submissions': latest_report.graded_submissions,
                 'average_score': latest_report.average_score
@@ -553,6 +662,7 @@ def get_grading_status(assignment_id):
                 'status': 'processing',
                 'message': 'Grading in progress',
                 'report_id': latest_report.id,
+                'report_status': latest_report.status,
                 'total_submissions': latest_report.total_submissions,
                 'graded_submissions': latest_report.graded_submissions,
                 'progress_percentage': (latest_report.graded_submissions / latest_report.total_submissions) * 100 if latest_report.total_submissions > 0 else 0
@@ -561,6 +671,143 @@ def get_grading_status(assignment_id):
     except Exception as e:
         return jsonify({'error': f'Failed to get grading status: {str(e)}'}), 500
 
+def _grading_events_url(assignment_id):
+    """Progress stream URL that skips the events of earlier runs; read it before queueing the run"""
+    import progress_events
+    return f"/api/assignments/{assignment_id}/grading-events?after={progress_events.latest_id()}"
+
+@main_bp.route('/api/assignments/<int:assignment_id>/grading-events', methods=['GET'])
+def stream_grading_events(assignment_id):
+    """
+    Live grading progress as server-sent events.
+    
+    Events: 'started' ({report_id, total, already_graded, resumed}), one
+    'submission' per stored result ({student_name, score, status, graded,
+    done, total, running_average, eta_seconds, ...}), 'finished' ({status,
+    average_score, ...}), and 'error' ({error, will_retry}) when a background
+    job fails. The stream opens with the events of the latest run so far; a
+    reconnecting browser continues after its Last-Event-ID (or ?after=<id>).
+    """
+    Assignment.query.get_or_404(assignment_id)
+    import progress_events
+    after = request.headers.get('Last-Event-ID') or request.args.get('after')
+    after_id = int(after) if after and after.isdigit() else None
+    app = current_app._get_current_object()
+    
+    def events():
+        subscription = progress_events.broker.subscribe(app, assignment_id)
+        try:
+            # Send something right away so proxies and the browser open the stream
+            yield ": connected\n\n"
+            # Everything up to here comes from the replay, the rest from the broker
+            last_id = after_id if after_id is not None else progress_events.latest_id()
+            for event in progress_events.replay(assignment_id, after_id):
+                last_id = event['id']
+                yield _sse(event['event'], event['data'], event['id'])
+            # Don't hold a database transaction open for the life of the stream
+            db.session.remove()
+            
+            # Once the queue overflows, end the stream; the browser reconnects and replays
+            while not subscription.lagged:
+                event = subscription.get(Config.PROGRESS_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keepalive\n\n"
+                elif event['id'] > last_id:
+                    last_id = event['id']
+                    yield _sse(event['event'], event['data'], event['id'])
+        finally:
+            progress_events.broker.unsubscribe(subscription)
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@main_bp.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """
+    Background jobs, newest first (?status=queued&assignment_id=1&limit=50), with queue counts
+    """
+    import job_queue
+    query = GradingJob.query
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    if request.args.get('assignment_id'):
+        query = query.filter_by(assignment_id=request.args.get('assignment_id', type=int))
+    jobs = query.order_by(GradingJob.created_at.desc()).limit(request.args.get('limit', 50, type=int)).all()
+    return jsonify({
+        'jobs': [job.to_dict() for job in jobs],
+        'queue': job_queue.queue_stats()
+    }), 200
+
+@main_bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Status, attempts and timings of one background job
+    """
+    job = GradingJob.query.get_or_404(job_id)
+    return jsonify(job.to_dict()), 200
+
+@main_bp.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """
+    Cancel a background job: at once if no worker has claimed it, otherwise
+    by asking its grading run to stop at the next check
+    """
+    import job_queue
+    job = GradingJob.query.get_or_404(job_id)
+    if job_queue.cancel_queued(job.id):
+        db.session.refresh(job)
+        return jsonify({'success': True, 'message': 'Job cancelled', 'job': job.to_dict()}), 200
+    
+    db.session.refresh(job)
+    report = GradingReport.query.get(job.report_id) if job.report_id else None
+    if job.status == 'running' and report is not None and report.status == 'running':
+        job_queue.request_stop(report, 'cancel')
+        return jsonify({'success': True, 'message': 'Cancel requested', 'job': job.to_dict(), 'report': report.to_dict()}), 202
+    
+    return jsonify({'error': f'Job is {job.status} and cannot be cancelled now', 'job': job.to_dict()}), 400
+
+@main_bp.route('/api/grade-cache', methods=['GET', 'DELETE'])
+def grade_cache_stats():
+    """
+    Inspect (GET) or clear (DELETE) the persistent grade cache
+    """
+    try:
+        from ai_service import grade_cache
+    except ImportError:
+        grade_cache = None
+
+    if grade_cache is None:
+        return jsonify({'enabled': False}), 200
+
+    if request.method == 'DELETE':
+        grade_cache.clear()
+
+    return jsonify({'enabled': True, **grade_cache.stats()}), 200
+
+@main_bp.route('/api/grading-stats', methods=['GET'])
+def grading_stats():
+    """
+    Token usage per grading mode, response parsing, rate governor and circuit breaker state,
+    model client reuse, single-flight coalescing, grade cache and live progress broker counters
+    """
+    if not AI_SERVICE_AVAILABLE:
+        return jsonify({'error': 'AI service not available'}), 503
+    
+    import ai_service
+    return jsonify({
+        'tokens': ai_service.get_token_stats(),
+        'parsing': ai_service.get_parse_stats(),
+        'rate_governor': ai_service.rate_governor.snapshot(),
+        'circuit_breaker': ai_service.circuit_breaker.snapshot(),
+        'clients': ai_service.llm_provider.client_stats(),
+        'single_flight': ai_service.single_flight.stats() if ai_service.single_flight is not None else None,
+        'grade_cache': ai_service.grade_cache.stats() if ai_service.grade_cache is not None else None,
+        'progress_events': ai_service.progress_events.broker.stats()
+    }), 200
+
 @main_bp.route('/api/grading-reports/<int:report_id>', methods=['GET'])
 def get_grading_report(report_id):
     """
@@ -568,7 +815,8 @@ def get_grading_report(report_id):
     """
     try:
         report = GradingReport.query.get_or_404(report_id)
-        submissions = SubmissionResult.query.filter_by(assignment_id=report.assignment_id).all()
+        # Results of older reports were not linked to the run that graded them
+        submissions = report.submission_results or SubmissionResult.query.filter_by(assignment_id=report.assignment_id).all()
         
         return jsonify({
             'report': report.to_dict(),
@@ -578,6 +826,130 @@ def get_grading_report(report_id):
     except Exception as e:
         return jsonify({'error': f'Failed to get report: {str(e)}'}), 500
 
+@main_bp.route('/api/grading-reports/<int:report_id>/resume', methods=['POST'])
+def resume_grading_report(report_id):
+    """
+    Queue an interrupted, paused or incomplete grading run to continue where it
+    stopped: already graded, unchanged submissions are skipped
+    """
+    try:
+        report = GradingReport.query.get_or_404(report_id)
+        if report.status in ('completed', 'cancelled'):
+            return jsonify({'error': f'Grading report is {report.status}'}), 400
+        
+        # Withdraw a pause the run has not reached yet
+        if report.status == 'running' and report.control == 'pause':
+            report.control = None
+            db.session.commit()
+            return jsonify({'success': True, 'message': 'Pause withdrawn', 'report': report.to_dict()}), 200
+        
+        active_job = GradingJob.query.filter(
+            GradingJob.report_id == report.id,
+            GradingJob.status.in_(['queued', 'running'])
+        ).first()
+        if active_job:
+            return jsonify({'error': 'Grading report is already being graded', 'job': active_job.to_dict()}), 409
+        
+        data = request.get_json(silent=True) or {}
+        rubric = data.get('rubric') or report.rubric
+        max_points = data.get('max_points') or report.max_points
+        if not rubric or not max_points:
+            return jsonify({'error': 'Rubric and max_points are required for reports without stored settings'}), 400
+        
+        import job_queue
+        events_url = _grading_events_url(report.assignment_id)
+        job = job_queue.enqueue(report.assignment_id, 'grade', {
+            'rubric': rubric,
+            'max_points': max_points,
+            'concurrency': data.get('concurrency'),
+            'mode': data.get('mode'),
+            'report_id': report.id
+        })
+        
+        return jsonify({
+            'success': True,
+            'message': 'Grading resume queued',
+            'report_id': report.id,
+            'graded_submissions': report.graded_submissions,
+            'total_submissions': report.total_submissions,
+            'job': job.to_dict(),
+            'events_url': events_url
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to resume grading: {str(e)}'}), 500
+
+@main_bp.route('/api/grading-reports/<int:report_id>/<any(pause, cancel):action>', methods=['POST'])
+def stop_grading_report(report_id, action):
+    """
+    Pause or cancel a grading run. The run stops between work units: calls
+    already sent finish and are stored, queued ones give their rate-limit
+    capacity up at once. A paused run continues with POST .../resume.
+    """
+    import job_queue
+    report = GradingReport.query.get_or_404(report_id)
+    
+    if report.status == 'running':
+        job_queue.request_stop(report, action)
+        return jsonify({
+            'success': True,
+            'message': f'{action.capitalize()} requested',
+            'report': report.to_dict()
+        }), 202
+    
+    # Nothing is running; a stopped or incomplete run can still be closed for good
+    if action == 'cancel' and report.status in ('paused', 'incomplete'):
+        for job in GradingJob.query.filter_by(report_id=report.id, status='queued').all():
+            job_queue.cancel_queued(job.id)
+        report.status = 'cancelled'
+        db.session.commit()
+        return jsonify({'success': True, 'message': 'Grading run cancelled', 'report': report.to_dict()}), 200
+    
+    return jsonify({'error': f'Grading report is {report.status or "not running"}'}), 400
+
+@main_bp.route('/api/grading-reports/<int:report_id>/metrics', methods=['GET'])
+def get_grading_report_metrics(report_id):
+    """
+    LLM call aggregates for one grading run: latency and queue wait p50/p95,
+    tokens, tokens/sec, retries, cache hits and estimated cost, overall and
+    per submission. ?calls=true also returns every call.
+    """
+    from call_metrics import summarize_calls
+    
+    report = GradingReport.query.get_or_404(report_id)
+    calls = [call.to_dict() for call in LLMCallMetric.query.filter_by(report_id=report_id).order_by(LLMCallMetric.id)]
+    prices = (Config.LLM_PRICE_PER_MILLION_INPUT_TOKENS, Config.LLM_PRICE_PER_MILLION_OUTPUT_TOKENS)
+    
+    by_submission = {}
+    for call in calls:
+        if call['submission_result_id'] is not None:
+            by_submission.setdefault(call['submission_result_id'], []).append(call)
+    names = {
+        result.id: result.student_name
+        for result in SubmissionResult.query.filter(SubmissionResult.id.in_(list(by_submission))).all()
+    } if by_submission else {}
+    
+    response = {
+        'report': report.to_dict(),
+        'summary': summarize_calls(calls, report.wall_time_seconds, *prices),
+        'submissions': [
+            {
+                'submission_result_id': submission_id,
+                'student_name': names.get(submission_id),
+                'calls': len([c for c in submission_calls if c['status'] in ('ok', 'error')]),
+                'latency_seconds': round(sum(c['total_seconds'] or 0 for c in submission_calls), 3),
+                'prompt_tokens': sum(c['prompt_tokens'] or 0 for c in submission_calls),
+                'output_tokens': sum(c['output_tokens'] or 0 for c in submission_calls),
+                'retries': sum(c['retries'] or 0 for c in submission_calls),
+                'grade_cache_hit': any(c['status'] == 'grade_cache_hit' for c in submission_calls)
+            }
+            for submission_id, submission_calls in by_submission.items()
+        ]
+    }
+    if request.args.get('calls', '').lower() == 'true':
+        response['calls'] = calls
+    return jsonify(response), 200
+
 @main_bp.route('/api/upload-question-file', methods=['POST'])
 def upload_question_file():
     """Upload and store assignment question file"""
@@ -661,12 +1033,24 @@ def generate_solution_endpoint(assignment_id):
             assignment.description
         )
         
+        # Reuse the stored solution unless the question or rubric changed
+        regenerate = request.args.get('regenerate', 'false').lower() == 'true'
+        version = None
+        reused = False
+        
         # Generate solution using AI
         try:
             if AI_SERVICE_AVAILABLE:
-                print("🤖 DEBUG: Generating solution with AI...")
-                solution = generate_solution(assignment_content, "Code quality, correctness, and efficiency", assignment.max_points)
-                print(f"✅ DEBUG: Solution generated successfully ({len(solution)} characters)")
+                print("🤖 DEBUG: Loading solution (generating with AI if needed)...")
+                solution, reference, reused = get_reference_solution(
+                    assignment,
+                    DEFAULT_RUBRIC,
+                    assignment.max_points or 100,
+                    assignment_content=assignment_content,
+                    regenerate=regenerate
+                )
+                version = reference.version if reference else None
+                print(f"✅ DEBUG: Solution ready ({len(solution)} characters, reused={reused})")
             else:
                 print("⚠️ DEBUG: AI service not available, using mock solution")
                 solution = f"Mock AI-generated solution for: {assignment_content}\n\nThis is a placeholder solution. Please configure the GEMINI_API_KEY in a .env file to enable real AI solution generation."
@@ -674,10 +1058,12 @@ def generate_solution_endpoint(assignment_id):
             return jsonify({
                 'success': True,
                 'solution': solution,
-                'message': 'Solution generated successfully',
+                'message': 'Solution loaded successfully' if reused else 'Solution generated successfully',
                 'content_length': len(assignment_content),
                 'solution_length': len(solution),
-                'assignment_id': assignment_id
+                'assignment_id': assignment_id,
+                'solution_version': version,
+                'reused': reused
             }), 200
             
         except Exception as e:
@@ -691,6 +1077,51 @@ def generate_solution_endpoint(assignment_id):
     except Exception as e:
         return jsonify({'error': f'Solution generation failed: {str(e)}'}), 500
 
+def _sse(event, data, event_id=None):
+    """Format one server-sent event"""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@main_bp.route('/api/generate-solution/<int:assignment_id>/stream', methods=['GET'])
+def stream_solution_endpoint(assignment_id):
+    """
+    Stream solution generation as server-sent events.
+    
+    Events: 'delta' ({"text"}) as the model writes, then 'done'
+    ({"solution", "solution_version", "reused"}) after the final text is
+    stored, or 'error' ({"error"}). Accepts ?regenerate=true like the POST
+    endpoint.
+    """
+    assignment = Assignment.query.get_or_404(assignment_id)
+    if not assignment.question_file_path:
+        return jsonify({'error': 'No question file found for this assignment'}), 400
+    if not AI_SERVICE_AVAILABLE:
+        return jsonify({'error': 'AI service not available'}), 503
+    
+    from ai_service import stream_reference_solution
+    regenerate = request.args.get('regenerate', 'false').lower() == 'true'
+    
+    def events():
+        try:
+            # Send something right away so proxies and the browser open the stream
+            yield _sse('start', {'assignment_id': assignment_id})
+            for event, data in stream_reference_solution(
+                assignment,
+                DEFAULT_RUBRIC,
+                assignment.max_points or 100,
+                regenerate=regenerate
+            ):
+                yield _sse(event, {'text': data} if event == 'delta' else data)
+        except Exception as e:
+            print(f"❌ DEBUG: Streaming solution generation error: {e}")
+            yield _sse('error', {'error': f'Solution generation failed: {str(e)}'})
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @main_bp.route('/api/grade-assignment-new', methods=['POST'])
 def grade_assignment_new():
     try:
@@ -711,13 +1142,17 @@ def grade_assignment_new():
                 title=title,
                 description=description,
                 max_points=max_points,
-                ideal_solution=solution,
-                rubrics=rubric,
-                professor_id=1  # Default professor
+                professor_id=1,  # Default professor
+                subject_id=1  # Default subject
             )
             db.session.add(assignment)
             db.session.commit()
             assignment_id = assignment.id
+            
+            # Keep the professor-supplied solution as the reference for grading
+            if solution:
+                from ai_service import load_assignment_content, store_reference_solution
+                store_reference_solution(assignment, solution, load_assignment_content(assignment), rubric, max_points)
         
         # Call AI grading function
         if AI_SERVICE_AVAILABLE:
@@ -0,0 +1,360 @@
+"""
+Sandboxed execution of student submissions against test inputs.
+
+Each test case runs the submission in its own Python subprocess, which
+isolates itself before any student code runs:
+- new user, mount, network, IPC and PID namespaces, with the server's user
+  mapped to nobody; the submission runs as PID 1 of its own PID namespace,
+  so it has no network, cannot see or signal any process outside it, and
+  every process it starts dies with it
+- an empty root (a small tmpfs) holding only the Python standard library and
+  system libraries, read-only, plus the submission; the server's code, .env,
+  database and other students' files do not exist inside it
+- all capabilities dropped and no_new_privs set before the submission runs
+- CPU time, address space, file size, process count and core dump rlimits
+- a wall-clock timeout that kills the namespace's init, and so every
+  process of the submission, even ones that left its process group
+- scripted stdin; stdout and stderr go to size-capped files
+
+The sandbox fails closed: when the kernel refuses any isolation step
+(e.g. user namespaces are disabled) the submission is not run and
+SandboxUnavailable is raised. available() probes this once per process.
+
+The isolation happens in the freshly started child interpreter, not in a
+preexec_fn, so nothing but exec runs between fork and exec in the
+(multi-threaded) server.
+
+Submissions run in parallel on a worker pool. Every test case is its own OS process, so the workers only wait on their children.
+"""
+
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Runs inside the child: isolate, then execute the submission as __main__.
+# argv: workdir cpu_seconds memory_bytes max_output_bytes max_processes. A child
+# that cannot isolate itself writes the reason to workdir/unavailable, where the
+# student code (which never runs in that case, and cannot see workdir) cannot
+# forge it. The process started by the server only unshares and forks: its
+# child is PID 1 of the new PID namespace and runs the submission, and its host
+# pid goes to workdir/pid so the server can kill the whole namespace.
+_BOOTSTRAP = """
+import ctypes, os, resource, runpy, signal, sys, sysconfig
+
+CLONE_NEWNS, CLONE_NEWIPC, CLONE_NEWUSER, CLONE_NEWPID, CLONE_NEWNET = 0x20000, 0x8000000, 0x10000000, 0x20000000, 0x40000000
+MS_RDONLY, MS_NOSUID, MS_NODEV, MS_NOEXEC, MS_REMOUNT = 1, 2, 4, 8, 32
+MS_NOATIME, MS_NODIRATIME, MS_BIND, MS_MOVE, MS_REC, MS_PRIVATE, MS_RELATIME = 1024, 2048, 4096, 8192, 16384, 1 << 18, 1 << 21
+# statvfs flags a bind mount inherits and must keep when remounted read-only
+LOCKED_FLAGS = {os.ST_NOSUID: MS_NOSUID, os.ST_NODEV: MS_NODEV, os.ST_NOEXEC: MS_NOEXEC,
+                os.ST_NOATIME: MS_NOATIME, os.ST_NODIRATIME: MS_NODIRATIME, os.ST_RELATIME: MS_RELATIME}
+NOBODY = 65534
+
+libc = ctypes.CDLL(None, use_errno=True)
+libc.mount.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p]
+
+
+def unavailable(step, detail):
+    write(os.path.join(workdir, 'unavailable'), "%s: %s" % (step, detail))
+    os._exit(125)
+
+
+def check(result, step):
+    if result != 0:
+        unavailable(step, os.strerror(ctypes.get_errno()))
+
+
+def mount(source, target, fstype, flags, data=None):
+    encode = lambda value: value.encode() if value else None
+    check(libc.mount(encode(source), encode(target), encode(fstype), flags, encode(data)), "mount " + target)
+
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def expose(path, root):
+    # Make path visible, read-only, at the same location under root
+    target = root + path
+    if os.path.islink(path):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.symlink(os.readlink(path), target)
+        return
+    if os.path.isdir(path):
+        os.makedirs(target, exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        open(target, 'w').close()
+    mount(path, target, None, MS_BIND)
+    flags = sum(flag for st_flag, flag in LOCKED_FLAGS.items() if os.statvfs(path).f_flag & st_flag)
+    mount(None, target, None, MS_REMOUNT | MS_BIND | MS_RDONLY | flags)
+
+
+workdir = sys.argv[1]
+cpu, memory, max_output, max_processes = (int(value) for value in sys.argv[2:6])
+with open(os.path.join(workdir, 'submission.py'), 'rb') as f:
+    code = f.read()
+
+try:
+    uid, gid = os.getuid(), os.getgid()
+    check(libc.unshare(CLONE_NEWUSER | CLONE_NEWNS | CLONE_NEWNET | CLONE_NEWIPC | CLONE_NEWPID), "unshare")
+    write('/proc/self/setgroups', 'deny')
+    write('/proc/self/uid_map', "%d %d 1" % (NOBODY, uid))
+    write('/proc/self/gid_map', "%d %d 1" % (NOBODY, gid))
+    init = os.fork()
+except OSError as e:
+    unavailable("setup", e)
+
+if init:
+    # Outside the namespace: wait for it and exit the way the submission did
+    write(os.path.join(workdir, 'pid'), str(init))
+    status = os.waitpid(init, 0)[1]
+    if os.WIFSIGNALED(status):
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        signal.signal(os.WTERMSIG(status), signal.SIG_DFL)
+        os.kill(os.getpid(), os.WTERMSIG(status))
+    os._exit(os.waitstatus_to_exitcode(status))
+
+try:
+    mount(None, '/', None, MS_REC | MS_PRIVATE)
+    root = os.path.join(workdir, 'root')
+    mount('tmpfs', root, 'tmpfs', MS_NOSUID | MS_NODEV, 'size=64m,mode=0755')
+    read_only = {os.path.dirname(os.__file__), sysconfig.get_path('stdlib'), sysconfig.get_path('platstdlib'),
+                 '/lib', '/lib32', '/lib64', '/usr/lib', '/usr/lib64',
+                 '/dev/null', '/dev/zero', '/dev/random', '/dev/urandom'}
+    for path in sorted(read_only):
+        if path and os.path.lexists(path):
+            expose(path, root)
+    for directory in ('work', 'tmp'):
+        os.mkdir(os.path.join(root, directory))
+    write(os.path.join(root, 'work', 'submission.py'), code.decode('utf-8', errors='replace'))
+
+    # The tmpfs becomes /; nothing of the old root is reachable from it
+    os.chdir(root)
+    mount(root, '/', None, MS_MOVE)
+    os.chroot('.')
+    os.chdir('/work')
+
+    # Give up every capability the new user namespace granted
+    check(libc.prctl(38, 1, 0, 0, 0), "no_new_privs")
+    header = (ctypes.c_uint32 * 2)(0x20080522, 0)
+    check(libc.capset(header, (ctypes.c_uint32 * 6)()), "capset")
+except OSError as e:
+    unavailable("setup", e)
+
+resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+resource.setrlimit(resource.RLIMIT_FSIZE, (max_output, max_output))
+resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+# Counted per user namespace, so this only limits the submission's own processes
+# (the kernel does not apply it to a server running as root)
+resource.setrlimit(resource.RLIMIT_NPROC, (max_processes, max_processes))
+sys.argv = ['submission.py']
+runpy.run_path('/work/submission.py', run_name='__main__')
+"""
+
+
+class SandboxUnavailable(RuntimeError):
+    """Raised when a submission cannot be isolated, so it was not run"""
+    pass
+
+
+class SandboxLimits:
+    """Resource limits for one test case run"""
+
+    def __init__(self, cpu_seconds=2, wall_seconds=5, memory_mb=256, max_output_bytes=65536, max_processes=16):
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_mb = memory_mb
+        self.max_output_bytes = max_output_bytes
+        self.max_processes = max_processes
+
+
+def _read_capped(path, limit):
+    with open(path, 'rb') as f:
+        data = f.read(limit + 1)
+    text = data[:limit].decode('utf-8', errors='replace')
+    return text + ("\n[output truncated]" if len(data) > limit else "")
+
+
+def normalize_output(text):
+    """Ignore trailing whitespace on each line and trailing blank lines"""
+    return "\n".join(line.rstrip() for line in (text or "").replace('\r\n', '\n').split('\n')).rstrip()
+
+
+def outputs_match(actual, expected):
+    return normalize_output(actual) == normalize_output(expected)
+
+
+def _kill_namespace(process, pid_path):
+    """Kill a timed-out run: the namespace's init (which takes every process of it along) and the bootstrap"""
+    try:
+        with open(pid_path) as f:
+            init = int(f.read() or 0)
+    except (OSError, ValueError):
+        init = 0
+    # While the bootstrap runs it has not reaped init, so the pid still names it
+    if init and process.poll() is None:
+        try:
+            os.kill(init, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_case(code, stdin="", expected_stdout=None, limits=None):
+    """
+    Run one submission against one input.
+
+    Args:
+        code (str): Python source of the submission
+        stdin (str): Text fed to the program's standard input
+        expected_stdout (str): Expected output; None to only require a clean exit
+        limits (SandboxLimits): Resource limits (defaults to SandboxLimits())
+
+    Returns:
+        dict: passed, exit_code, timed_out, stdout, stderr, duration_seconds
+
+    Raises:
+        SandboxUnavailable: The kernel refused to isolate the child
+    """
+    limits = limits or SandboxLimits()
+    workdir = tempfile.mkdtemp(prefix='sandbox-')
+    try:
+        with open(os.path.join(workdir, 'submission.py'), 'w', encoding='utf-8') as f:
+            f.write(code)
+        os.mkdir(os.path.join(workdir, 'root'))
+        unavailable_path = os.path.join(workdir, 'unavailable')
+        stdout_path = os.path.join(workdir, 'stdout')
+        stderr_path = os.path.join(workdir, 'stderr')
+
+        started = time.perf_counter()
+        timed_out = False
+        with open(stdout_path, 'wb') as stdout, open(stderr_path, 'wb') as stderr:
+            process = subprocess.Popen(
+                [sys.executable, '-I', '-c', _BOOTSTRAP, workdir, str(max(1, int(limits.cpu_seconds))),
+                 str(limits.memory_mb * 1024 * 1024), str(limits.max_output_bytes),
+                 str(max(1, int(limits.max_processes)))],
+                stdin=subprocess.PIPE,
+                stdout=stdout,
+                stderr=stderr,
+                cwd=workdir,
+                env={'PYTHONIOENCODING': 'utf-8', 'PYTHONDONTWRITEBYTECODE': '1'},
+                start_new_session=True,
+                close_fds=True
+            )
+            try:
+                process.communicate(input=(stdin or "").encode('utf-8'), timeout=limits.wall_seconds)
+            except subprocess.TimeoutExpired:
+                timed_out = True
+                _kill_namespace(process, os.path.join(workdir, 'pid'))
+                process.wait()
+            except BrokenPipeError:
+                # The program exited without reading all of its input
+                process.wait()
+        duration = time.perf_counter() - started
+        if os.path.exists(unavailable_path):
+            with open(unavailable_path, encoding='utf-8', errors='replace') as f:
+                raise SandboxUnavailable(f"Cannot isolate the submission ({f.read()}); it was not run")
+
+        output = _read_capped(stdout_path, limits.max_output_bytes)
+        errors = _read_capped(stderr_path, limits.max_output_bytes)
+        exit_code = process.returncode
+        passed = not timed_out and exit_code == 0 and (
+            expected_stdout is None or outputs_match(output, expected_stdout)
+        )
+        return {
+            "passed": passed,
+            "exit_code": exit_code,
+            "timed_out": timed_out,
+            "stdout": output,
+            "stderr": errors[-2000:],
+            "duration_seconds": round(duration, 3)
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+_available = None
+_available_lock = threading.Lock()
+
+
+def available():
+    """
+    Whether this host can isolate submissions, probed once per process.
+    Callers skip test cases when it cannot, instead of running them unconfined.
+    """
+    global _available
+    with _available_lock:
+        if _available is None:
+            try:
+                _available = run_case("print('ok')\n", expected_stdout="ok")["passed"]
+            except SandboxUnavailable as e:
+                print(f"⚠️  Test cases disabled: {e}", flush=True)
+                _available = False
+        return _available
+
+
+def run_submission(code, cases, limits=None, stop=None):
+    """
+    Run a submission against every test case.
+
+    Args:
+        code (str): Python source of the submission
+        cases (list): dicts with name, stdin, expected_stdout and points
+        stop (threading.Event): Checked before each case; once set, the
+            remaining cases are not run
+
+    Returns:
+        dict: {"passed": int, "total": int, "points": float, "max_points": float, "cases": [...]},
+            or None if stopped before the last case
+    """
+    results = []
+    for case in cases:
+        if stop is not None and stop.is_set():
+            return None
+        result = run_case(code, case.get("stdin", ""), case.get("expected_stdout"), limits)
+        result["name"] = case.get("name")
+        result["expected_stdout"] = case.get("expected_stdout")
+        result["points"] = case.get("points", 1.0) if result["passed"] else 0.0
+        results.append(result)
+    return {
+        "passed": sum(1 for result in results if result["passed"]),
+        "total": len(results),
+        "points": sum(result["points"] for result in results),
+        "max_points": sum(case.get("points", 1.0) for case in cases),
+        "cases": results
+    }
+
+
+def run_submissions(submissions, cases, limits=None, workers=None, stop=None):
+    """
+    Run many submissions against the same test cases in parallel.
+
+    Args:
+        submissions (list): (key, code) tuples
+        cases (list): Test case dicts, see run_submission
+        limits (SandboxLimits): Per-case limits
+        workers (int): Parallel submissions (defaults to the CPU count)
+        stop (threading.Event): Set to stop between test cases; returns once
+            the cases already running finish
+
+    Returns:
+        dict: key -> run_submission() result, for the submissions that ran
+            every case
+    """
+    if not submissions or not cases:
+        return {}
+    workers = max(1, workers or os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda item: run_submission(item[1], cases, limits, stop), submissions)
+        return {key: result for (key, _), result in zip(submissions, results) if result is not None}
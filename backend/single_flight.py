@@ -0,0 +1,155 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+When several callers ask for the same result at the same time (a double-
+clicked grade button, or the solution page and the upload both generating
+the reference solution), only the first caller does the work; the others
+wait on its future and share the result, or its exception.
+
+Within a process, callers are coalesced on an in-memory future. Across
+worker processes, the leader also holds an advisory file lock for the key.
+A leader in another process waits for that lock and then calls recheck()
+to pick up the result the first process stored (grade cache, database)
+before doing the work itself. The wait is bounded: past lock_timeout the
+waiter does the work without the lock rather than hang behind a stuck
+process. Lock files are removed by the process that releases them.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; coalescing stays in-process
+    fcntl = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key.
+
+    Args:
+        lock_dir (str): Directory for cross-process lock files; None keeps
+            coalescing within this process
+        lock_timeout (float): Longest wait for another process's lock, in seconds
+    """
+
+    def __init__(self, lock_dir=None, lock_timeout=300.0):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._stats = {"leaders": 0, "coalesced": 0, "rechecked": 0, "lock_timeouts": 0}
+
+    def _acquire_file_lock(self, path):
+        """
+        Open and lock path, waiting at most lock_timeout seconds.
+
+        Returns:
+            file: The locked lock file, or None on timeout
+        """
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.01
+        while True:
+            lock_file = open(path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                if time.monotonic() >= deadline:
+                    return None
+                time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+                delay = min(delay * 2, 0.5)
+                continue
+            # The previous holder may have removed the file after we opened it;
+            # a lock on a removed file excludes nobody, so start over
+            try:
+                if os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    @contextmanager
+    def _process_lock(self, key, enabled):
+        if not enabled:
+            yield
+            return
+        path = os.path.join(self.lock_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.lock')
+        lock_file = self._acquire_file_lock(path)
+        if lock_file is None:
+            with self._lock:
+                self._stats["lock_timeouts"] += 1
+            print(f"⚠️  Single-flight lock for {key[:40]} still held after {self.lock_timeout}s; not waiting longer", flush=True)
+            yield
+            return
+        try:
+            yield
+        finally:
+            # Remove the file while still holding the lock, so the directory
+            # only ever holds files of keys in flight
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def do(self, key, fn, recheck=None):
+        """
+        Return fn(), running it at most once at a time per key.
+
+        Args:
+            key (str): Identifies the request by content
+            fn (callable): Does the work
+            recheck (callable): Returns a result stored by another process,
+                or None; called under the cross-process lock before fn().
+                Without it there is nothing to share across processes, so
+                only callers in this process are coalesced
+
+        Returns:
+            tuple: (result, shared) where shared is True if another caller
+                or process did the work
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            return future.result(), True
+
+        cross_process = recheck is not None and bool(self.lock_dir)
+        try:
+            with self._process_lock(key, cross_process):
+                shared = False
+                result = recheck() if cross_process else None
+                if result is not None:
+                    shared = True
+                    with self._lock:
+                        self._stats["rechecked"] += 1
+                else:
+                    result = fn()
+            future.set_result(result)
+            return result, shared
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._in_flight), cross_process=bool(self.lock_dir))
@@ -7,9 +7,11 @@ echo "=================================================="
 # Function to check if a port is in use
 check_port() {
     if lsof -Pi :$1 -sTCP:LISTEN -t >/dev/null ; then
-        echo "⚠️  Port $1 is already in use - killing existing process"
-        lsof -ti:$1 | xargs kill -9 2>/dev/null || true
+        echo "⚠️  Port $1 is already in use - stopping existing process"
+        lsof -ti:$1 | xargs kill 2>/dev/null || true
         sleep 2
+        # Only force it if it did not exit on its own
+        lsof -ti:$1 | xargs kill -9 2>/dev/null || true
     else
         echo "✅ Port $1 is available"
     fi
@@ -18,6 +20,7 @@ check_port() {
 # Kill any existing processes
 echo "🧹 Cleaning up existing processes..."
 pkill -f "python3 app.py" 2>/dev/null || true
+pkill -f "python3 worker.py" 2>/dev/null || true
 
 # Check port
 echo "🔍 Checking port availability..."
@@ -33,6 +36,10 @@ source venv/bin/activate
 python3 app.py &
 SERVER_PID=$!
 
+# Background grading workers (jobs queued by /grade-async)
+python3 worker.py &
+WORKER_PID=$!
+
 # Wait for server to start
 sleep 3
 
@@ -59,6 +66,7 @@ cleanup() {
     echo ""
     echo "🛑 Stopping application..."
     kill $SERVER_PID 2>/dev/null || true
+    kill $WORKER_PID 2>/dev/null || true
     pkill -f "python3 app.py" 2>/dev/null || true
     echo "✅ Application stopped"
     exit 0
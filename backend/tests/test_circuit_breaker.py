@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Checks the circuit breaker: consecutive failures open it, it fails fast
+while open, then lets exactly one probe through (no API calls)
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def test_opens_after_failures_and_closes_after_a_good_probe():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout_seconds=0.2, name="test")
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow_request()
+
+    time.sleep(0.25)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request() and not breaker.allow_request()  # one probe only
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow_request()
+    assert breaker.snapshot()["times_opened"] == 1
+
+
+def test_failed_probe_reopens_and_waiters_time_out():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_seconds=0.2, name="test")
+    breaker.record_failure()
+    assert not breaker.wait_until_ready(0.05)
+    assert breaker.wait_until_ready(1.0)  # half-open after the reset timeout
+
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.snapshot()["times_opened"] == 2
+
+
+if __name__ == '__main__':
+    test_opens_after_failures_and_closes_after_a_good_probe()
+    test_failed_probe_reopens_and_waiters_time_out()
+    print("✓ Circuit breaker opens, probes and recovers")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Checks the client registry: one client per key is shared across threads,
+and a forked child builds its own even if the parent's lock was held at
+fork time (no API calls)
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from client_registry import ClientRegistry
+
+
+def _in_threads(function, count=8):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(function())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_clients_are_shared_across_threads():
+    registry = ClientRegistry()
+    clients = _in_threads(lambda: registry.get(('model', None), object))
+    assert len({id(client) for client in clients}) == 1
+    assert registry.get(('model', 'handle'), object) is not clients[0]
+    registry.evict(lambda key: key[1] == 'handle')
+    stats = registry.stats()
+    assert stats["created"] == 2 and stats["reused"] == 7 and stats["evicted"] == 1 and stats["clients"] == 1
+
+
+def test_forked_child_builds_its_own_clients():
+    forks = []
+    registry = ClientRegistry(on_fork=lambda: forks.append(os.getpid()))
+    inherited = registry.get('model', object)
+    registry._lock.acquire()  # another thread is inside the registry when the fork happens
+    pid = os.fork()
+    if pid == 0:
+        clients = _in_threads(lambda: registry.get('model', object))
+        fresh = all(client is not inherited for client in clients) and len({id(c) for c in clients}) == 1
+        os._exit(0 if fresh and forks == [os.getpid()] and registry.stats()["fork_resets"] == 1 else 1)
+    registry._lock.release()
+    assert os.waitpid(pid, 0)[1] == 0
+    assert registry.get('model', object) is inherited and forks == []
+
+
+if __name__ == '__main__':
+    test_clients_are_shared_across_threads()
+    test_forked_child_builds_its_own_clients()
+    print("✓ Client registry shares clients and is fork-safe")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Checks submission fingerprints: renamed, re-commented or reformatted
+copies collapse to one group, and any change in behaviour keeps them
+apart (no API calls)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fingerprint import fingerprint_source, group_submissions
+
+ORIGINAL = '''
+def double(number):
+    """Return twice the number"""
+    return number * 2
+
+print(double(int(input())))
+'''
+
+RENAMED = '''
+# my solution
+def twice(x):
+    return x   *   2   # multiply
+
+
+print(twice(int(input())))
+'''
+
+
+def test_cosmetic_changes_share_a_fingerprint():
+    assert fingerprint_source(ORIGINAL) == fingerprint_source(RENAMED)
+    # Behaviour changes are never merged
+    assert fingerprint_source(ORIGINAL) != fingerprint_source(ORIGINAL.replace("* 2", "* 3"))
+    assert fingerprint_source('print("yes")') != fingerprint_source('print("no")')
+    # Built-in names are not renamed away
+    assert fingerprint_source("print(len(x))") != fingerprint_source("print(sum(x))")
+    # Files that do not parse still ignore comment lines and whitespace
+    assert fingerprint_source("def f(:\n  pass") == fingerprint_source("# draft\ndef f( :\n\tpass\n")
+
+
+def test_groups_keep_first_seen_order():
+    groups = group_submissions([
+        ("alice", ORIGINAL),
+        ("bob", "print(input())"),
+        ("carol", RENAMED)
+    ])
+    assert list(groups.values()) == [["alice", "carol"], ["bob"]]
+
+
+if __name__ == '__main__':
+    test_cosmetic_changes_share_a_fingerprint()
+    test_groups_keep_first_seen_order()
+    print("✓ Fingerprints group near-duplicate submissions")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Checks the lenient grade parser: common defects in model output are
+repaired instead of costing another call, and hopeless responses are
+rejected (no API calls)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from grade_parser import GradeParseError, parse_grade, parse_json_lenient
+
+
+def test_defective_json_is_repaired():
+    assert parse_json_lenient('{"score": 8, "feedback": "ok"}') == ({"score": 8, "feedback": "ok"}, False)
+    repaired = [
+        '```json\n{"score": 8, "feedback": "ok",}\n```',
+        "{'score': 8, 'feedback': 'ok'}",
+        '{score: 8, feedback: "ok"}',
+        'Here is the grade: {"score": 8, "feedback": "ok"} Hope this helps!'
+    ]
+    for text in repaired:
+        assert parse_json_lenient(text) == ({"score": 8, "feedback": "ok"}, True), text
+    assert parse_json_lenient('{"score": 9, "feedback": "line 1\nline 2"}')[0]["feedback"] == "line 1\nline 2"
+    assert parse_json_lenient('{"late": True, "note": None}')[0] == {"late": True, "note": None}
+    items, _ = parse_json_lenient('[{"student": "S1", "score": 3, "feedback": "a"},]', expect='array')
+    assert items == [{"student": "S1", "score": 3, "feedback": "a"}]
+
+
+def test_grades_are_clamped_and_garbage_rejected():
+    assert parse_grade('{"score": 15, "feedback": "great"}', 10) == (10, "great", False)
+    assert parse_grade('{"score": -2, "feedback": "empty"}', 10)[0] == 0
+    # Not JSON at all, but both fields are there
+    assert parse_grade('score: 4.5\nfeedback: "needs tests"', 10) == (4.5, "needs tests", True)
+    for text in ("I cannot grade this submission.", '{"score": 5}', ""):
+        try:
+            parse_grade(text, 10)
+            assert False, f"expected GradeParseError for {text!r}"
+        except GradeParseError:
+            pass
+
+
+if __name__ == '__main__':
+    test_defective_json_is_repaired()
+    test_grades_are_clamped_and_garbage_rejected()
+    print("✓ Grade parser repairs and validates model output")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Checks pausing and cancelling a grading run of an assignment with test
+cases: the run stops between submissions, the report (and the status
+endpoint) shows 'paused' or 'cancelled', and resuming grades the rest (offline provider, temporary
+SQLite database, no API calls)
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'control.db'))
+os.environ.setdefault('GRADE_CACHE_ENABLED', 'false')
+os.environ.setdefault('GEMINI_API_KEY', '')
+
+from app import app
+from config import Config
+from models import db, Professor, Subject, Assignment, GradingReport, SubmissionResult, TestCase
+import ai_service
+from llm_providers import OfflineProvider
+
+SUBMISSIONS = 6
+
+
+def _assignment(cases=1, delay=0):
+    db.create_all()
+    professor = Professor(name='Control Test', email=f'control{datetime.utcnow().timestamp()}@example.com')
+    db.session.add(professor)
+    db.session.commit()
+    subject = Subject(name='Control', code=f'C{professor.id}', professor_id=professor.id)
+    db.session.add(subject)
+    db.session.commit()
+    folder = tempfile.mkdtemp()
+    for i in range(SUBMISSIONS):
+        with open(os.path.join(folder, f's{i}.py'), 'w') as f:
+            f.write(f"import time\ntime.sleep({delay})\noffset = {i} - {i}\nprint(int(input()) * 2 + offset)\n")
+    assignment = Assignment(title='Double', description='Print twice the input', professor_id=professor.id,
+                            subject_id=subject.id, max_points=10, extracted_folder_path=folder)
+    db.session.add(assignment)
+    db.session.commit()
+    for n in range(2, 2 + cases):
+        db.session.add(TestCase(assignment_id=assignment.id, name=str(n), stdin=f'{n}\n', expected_stdout=str(2 * n), points=1))
+    db.session.commit()
+    return assignment
+
+
+def _grade_and_stop(assignment_id, action, after_seconds, resume_report_id=None):
+    """Run grade_all_submissions and request action once it has been running for after_seconds"""
+    started = threading.Event()
+    report_ids = []
+
+    def on_report(report):
+        report_ids.append(report.id)
+        started.set()
+
+    def stop():
+        started.wait()
+        time.sleep(after_seconds)
+        with app.app_context():
+            GradingReport.query.filter_by(id=report_ids[0]).update({'control': action})
+            db.session.commit()
+
+    stopper = threading.Thread(target=stop)
+    stopper.start()
+    result = ai_service.grade_all_submissions(assignment_id, 'Correctness', 10, concurrency=1, mode='single',
+                                              resume_report_id=resume_report_id, on_report=on_report)
+    stopper.join()
+    return result
+
+
+def _with_slow_provider(test):
+    def run():
+        saved = (ai_service.llm_provider, ai_service.context_cache_client, Config.GRADING_CONTROL_POLL_SECONDS,
+                 Config.SANDBOX_WORKERS)
+        ai_service.llm_provider = ai_service.context_cache_client = OfflineProvider(latency_seconds=0.2)
+        Config.GRADING_CONTROL_POLL_SECONDS = 0.05
+        Config.SANDBOX_WORKERS = 1
+        try:
+            with app.app_context():
+                test()
+        finally:
+            (ai_service.llm_provider, ai_service.context_cache_client, Config.GRADING_CONTROL_POLL_SECONDS,
+             Config.SANDBOX_WORKERS) = saved
+    run.__name__ = test.__name__
+    return run
+
+
+@_with_slow_provider
+def test_pause_and_resume_with_test_cases():
+    assignment = _assignment()
+    paused = _grade_and_stop(assignment.id, 'pause', 0.5)
+    report = db.session.get(GradingReport, paused['report_id'])
+    assert report.status == 'paused' and report.control is None
+    assert 0 < report.graded_submissions < SUBMISSIONS
+    status = app.test_client().get(f'/api/assignments/{assignment.id}/grading-status').get_json()
+    assert status['status'] == 'paused'
+    assert status['remaining_submissions'] == SUBMISSIONS - report.graded_submissions
+
+    resumed = ai_service.grade_all_submissions(assignment.id, 'Correctness', 10, concurrency=2, mode='single',
+                                               resume_report_id=report.id)
+    db.session.refresh(report)
+    rows = SubmissionResult.query.filter_by(report_id=report.id).all()
+    assert resumed['report_id'] == report.id and report.status == 'completed'
+    assert len(rows) == SUBMISSIONS and all(row.grading_status == 'graded' for row in rows)
+    if ai_service.load_test_cases(assignment):
+        assert all(row.tests_passed == 1 and row.tests_total == 1 for row in rows)
+
+
+@_with_slow_provider
+def test_cancel_with_test_cases():
+    # Running every case of every submission would take well over 10 seconds
+    assignment = _assignment(cases=5, delay=0.4)
+    started = time.perf_counter()
+    cancelled = _grade_and_stop(assignment.id, 'cancel', 0.3)
+    report = db.session.get(GradingReport, cancelled['report_id'])
+    assert report.status == 'cancelled'
+    assert SubmissionResult.query.filter_by(report_id=report.id).count() < SUBMISSIONS
+    # Cancelling does not wait for the remaining test runs
+    assert time.perf_counter() - started < 6
+
+
+if __name__ == '__main__':
+    test_pause_and_resume_with_test_cases()
+    test_cancel_with_test_cases()
+    print("✓ Grading runs pause, resume and cancel with test cases")
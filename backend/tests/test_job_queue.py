@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Checks the durable job queue: a job is claimed once, failed attempts are
+retried up to max_attempts, and jobs of dead workers are recovered
+(temporary SQLite database, no API calls)
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'jobs.db')
+os.environ.setdefault('GRADE_CACHE_ENABLED', 'false')
+os.environ.setdefault('GEMINI_API_KEY', '')
+
+from app import app
+from config import Config
+from models import db, Professor, Subject, Assignment, GradingJob
+import job_queue
+
+
+def _assignment():
+    db.create_all()
+    professor = Professor(name='Queue Test', email=f'queue{datetime.utcnow().timestamp()}@example.com')
+    db.session.add(professor)
+    db.session.commit()
+    subject = Subject(name='Queues', code=f'Q{professor.id}', professor_id=professor.id)
+    db.session.add(subject)
+    db.session.commit()
+    assignment = Assignment(title='HW', description='d', professor_id=professor.id, subject_id=subject.id)
+    db.session.add(assignment)
+    db.session.commit()
+    return assignment
+
+
+def test_job_is_claimed_once_and_retried():
+    with app.app_context():
+        assignment = _assignment()
+        job = job_queue.enqueue(assignment.id, 'grade', {'rubric': 'r', 'max_points': 10}, max_attempts=2)
+
+        claimed = job_queue.claim_next('worker-a')
+        assert claimed.id == job.id and claimed.status == 'running' and claimed.attempts == 1
+        assert job_queue.claim_next('worker-b') is None
+
+        original_delay = Config.JOB_RETRY_DELAY_SECONDS
+        Config.JOB_RETRY_DELAY_SECONDS = 0
+        try:
+            job_queue.fail(claimed, RuntimeError('model unavailable'))
+            assert claimed.status == 'queued'
+            retried = job_queue.claim_next('worker-b')
+            assert retried.id == job.id and retried.attempts == 2
+            job_queue.fail(retried, RuntimeError('model unavailable'))
+        finally:
+            Config.JOB_RETRY_DELAY_SECONDS = original_delay
+        assert retried.status == 'failed' and retried.finished_at is not None
+
+
+def test_stale_job_is_requeued():
+    with app.app_context():
+        assignment = _assignment()
+        job = job_queue.enqueue(assignment.id, 'grade', {'rubric': 'r', 'max_points': 10})
+        job_queue.claim_next('worker-dead')
+        GradingJob.query.filter_by(id=job.id).update(
+            {'heartbeat_at': datetime.utcnow() - timedelta(seconds=Config.JOB_STALE_SECONDS + 1)}
+        )
+        db.session.commit()
+
+        assert job_queue.requeue_stale() == 1
+        db.session.refresh(job)
+        assert job.status == 'queued' and job.worker_id is None
+
+
+if __name__ == '__main__':
+    test_job_is_claimed_once_and_retried()
+    test_stale_job_is_requeued()
+    print("✓ Job queue claims, retries and recovers jobs")
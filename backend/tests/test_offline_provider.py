@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Checks that the offline LLM provider is deterministic: the same submissions
+get the same grades run after run, and injected errors hit the same
+attempts regardless of thread scheduling (no API calls)
+"""
+
+import os
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('GRADE_CACHE_ENABLED', 'false')
+os.environ.setdefault('GEMINI_API_KEY', '')  # offline: keep .env's key out of this process
+
+import ai_service
+from llm_providers import OfflineProvider
+
+SUBMISSIONS = [
+    "def main():\n    n = int(input())\n    print(n * 2)\n\nmain()\n",
+    "print('hello')\n",
+    "def broken(:\n    pass\n",
+    ""
+]
+
+
+def _grade_all(provider):
+    context = ai_service.create_grading_context(
+        "Double a number", "Correctness", "print(int(input()) * 2)", 10, client=provider
+    )
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            return list(executor.map(
+                lambda code: ai_service.grade_submission(
+                    code, "Double a number", "Correctness", "print(int(input()) * 2)", 10, context=context
+                ),
+                SUBMISSIONS
+            ))
+    finally:
+        context.close()
+
+
+def test_grades_are_reproducible():
+    first = _grade_all(OfflineProvider(seed=7))
+    second = _grade_all(OfflineProvider(seed=7))
+
+    assert all(result["status"] == "graded" for result in first)
+    assert [r["score"] for r in first] == [r["score"] for r in second]
+    assert first[0]["score"] > first[1]["score"] > first[3]["score"] == 0
+    assert all(0 <= result["score"] <= 10 for result in first)
+
+
+def test_error_injection_is_deterministic():
+    def failures(provider):
+        outcomes = provider.generate_batch([f"prompt {i}" for i in range(50)], max_workers=8)
+        return [isinstance(outcome, Exception) for outcome in outcomes]
+
+    first = failures(OfflineProvider(error_rate=0.3, seed=1))
+    assert first == failures(OfflineProvider(error_rate=0.3, seed=1))
+    assert 0 < sum(first) < 50
+
+
+def test_async_call_matches_sync():
+    provider = OfflineProvider()
+    prompt = "Maximum Points: 10\nStudent Submission:\nprint(1)\n\nJSON Output:"
+    sync_text = provider.generate(prompt).text
+    async_text = asyncio.run(provider.generate_async(prompt)).text
+    assert sync_text == async_text
+
+
+if __name__ == '__main__':
+    test_grades_are_reproducible()
+    test_error_injection_is_deterministic()
+    test_async_call_matches_sync()
+    print("✓ Offline provider is deterministic")
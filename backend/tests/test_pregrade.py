@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Checks the static pre-grading gate: each kind of unusable file gets its
+category and the policy's action, without reading oversized files whole
+(no API calls)
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pregrade import (BAD_ENCODING, BINARY, EMPTY, SYNTAX_ERROR, TOO_LARGE, UNREADABLE,
+                      parse_policy, pregrade_file)
+
+
+def _file(folder, name, content):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_files_are_categorized():
+    folder = tempfile.mkdtemp()
+    cases = {
+        b"print(int(input()) * 2)\n": (None, 'llm'),
+        b"# TODO\n\n'''nothing yet'''\n": (EMPTY, 'zero'),
+        b"\x7fELF\x00\x01\x02": (BINARY, 'zero'),
+        b"def broken(:\n    pass\n": (SYNTAX_ERROR, 'reduced'),
+        "print('café')\n".encode('latin-1'): (BAD_ENCODING, 'llm'),
+        b"x = 1\n" * 100: (TOO_LARGE, 'error')
+    }
+    for i, (content, (category, action)) in enumerate(cases.items()):
+        decision = pregrade_file(_file(folder, f"s{i}.py", content), max_bytes=500)
+        assert (decision.category, decision.action) == (category, action), content[:20]
+    assert pregrade_file(os.path.join(folder, "missing.py")).category == UNREADABLE
+
+    # Only the part within the limit is kept for oversized files
+    decision = pregrade_file(_file(folder, "big.py", b"x = 1\n" * 100000), max_bytes=1000)
+    assert decision.category == TOO_LARGE and len(decision.code) <= 1000
+    assert "600000 bytes" in decision.feedback
+
+
+def test_policy_overrides():
+    policy = parse_policy("syntax_error=zero, too_large=llm")
+    assert policy[SYNTAX_ERROR] == 'zero' and policy[TOO_LARGE] == 'llm' and policy[EMPTY] == 'zero'
+    for spec in ("nonsense=zero", "empty=ignore"):
+        try:
+            parse_policy(spec)
+            assert False, f"expected ValueError for {spec}"
+        except ValueError:
+            pass
+
+
+if __name__ == '__main__':
+    test_files_are_categorized()
+    test_policy_overrides()
+    print("✓ Pre-grading gate categorizes submissions")
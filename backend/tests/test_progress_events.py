@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Checks grading progress events: replay starts at the latest run or after a
+client's last id, and the broker delivers new events only to subscribers
+of their assignment (temporary SQLite database, no API calls)
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'events.db'))
+os.environ.setdefault('GEMINI_API_KEY', '')
+
+from app import app
+from models import db, Professor, Subject, Assignment
+import progress_events
+
+
+def _assignments(count):
+    db.create_all()
+    professor = Professor(name='Events Test', email=f'events{datetime.utcnow().timestamp()}@example.com')
+    db.session.add(professor)
+    db.session.commit()
+    subject = Subject(name='Events', code=f'E{professor.id}', professor_id=professor.id)
+    db.session.add(subject)
+    db.session.commit()
+    assignments = [Assignment(title=f'Events {i}', professor_id=professor.id, subject_id=subject.id)
+                   for i in range(count)]
+    db.session.add_all(assignments)
+    db.session.commit()
+    return [assignment.id for assignment in assignments]
+
+
+def _publish(assignment_id, event, data):
+    progress_events.publish(assignment_id, event, data)
+    db.session.commit()
+    progress_events.notify()
+
+
+def test_replay_starts_at_latest_run():
+    with app.app_context():
+        (assignment_id,) = _assignments(1)
+        _publish(assignment_id, 'started', {"run": 1})
+        _publish(assignment_id, 'finished', {"run": 1})
+        _publish(assignment_id, 'started', {"run": 2})
+        _publish(assignment_id, 'submission', {"run": 2})
+
+        events = progress_events.replay(assignment_id)
+        assert [(e['event'], e['data']['run']) for e in events] == [('started', 2), ('submission', 2)]
+        assert progress_events.replay(assignment_id, after_id=events[0]['id']) == events[1:]
+        assert progress_events.latest_id() == events[-1]['id']
+        assert progress_events.replay(assignment_id, after_id=progress_events.latest_id()) == []
+
+
+def test_broker_delivers_by_assignment():
+    broker = progress_events.ProgressBroker(poll_seconds=0.05)
+    with app.app_context():
+        watched, other = _assignments(2)
+        _publish(watched, 'started', {"before": True})
+        subscription = broker.subscribe(app, watched)
+        unrelated = broker.subscribe(app, other)
+        _publish(watched, 'submission', {"student": "alice"})
+        _publish(watched, 'finished', {"graded": 1})
+
+    delivered = [subscription.get(timeout=5), subscription.get(timeout=5)]
+    # Events stored before subscribing are left to replay()
+    assert [e['event'] for e in delivered] == ['submission', 'finished']
+    assert delivered[0]['data'] == {"student": "alice"}
+    assert subscription.get(timeout=0.2) is None
+    assert unrelated.get(timeout=0.2) is None
+    broker.unsubscribe(subscription)
+    broker.unsubscribe(unrelated)
+
+
+if __name__ == '__main__':
+    test_replay_starts_at_latest_run()
+    test_broker_delivers_by_assignment()
+    print("✓ Progress events replay and broadcast correctly")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Checks that a grading run uploads its static prompt prefix exactly once,
+using a local stand-in for the Gemini context cache client (no API calls)
+"""
+
+import os
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('GRADE_CACHE_ENABLED', 'false')
+os.environ.setdefault('GEMINI_API_KEY', '')  # offline: keep .env's key out of this process
+
+import ai_service
+from config import Config
+
+
+class _Part:
+    def __init__(self, text):
+        self.text = text
+
+
+class _Response:
+    def __init__(self, text):
+        content = type('Content', (), {'parts': [_Part(text)]})()
+        self.candidates = [type('Candidate', (), {'content': content})()]
+        self.usage_metadata = None
+
+
+class StandInModel:
+    def __init__(self, client, handle):
+        self.client = client
+        self.handle = handle
+
+    def generate_content(self, prompt, **kwargs):
+        self.client.prompts.append((self.handle, prompt))
+        return _Response(json.dumps({"score": 7, "feedback": "Looks fine"}))
+
+
+class StandInContextCacheClient:
+    """Records prefix uploads and the prompts sent against them"""
+
+    def __init__(self):
+        self.uploads = []
+        self.deleted = []
+        self.prompts = []
+
+    def create(self, model_name, prefix, ttl_seconds):
+        self.uploads.append(prefix)
+        return f"cache-{len(self.uploads)}"
+
+    def model(self, model_name, handle=None):
+        return StandInModel(self, handle)
+
+    def delete(self, handle):
+        self.deleted.append(handle)
+
+
+def _run(client, submissions):
+    reference_solution = "print('reference')\n" * 600  # large enough to be worth caching
+    context = ai_service.create_grading_context(
+        "Compute shipping cost", "Correctness", reference_solution, 10, client=client
+    )
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            return list(executor.map(
+                lambda code: ai_service.grade_submission(
+                    code, "Compute shipping cost", "Correctness", reference_solution, 10, context=context
+                ),
+                submissions
+            ))
+    finally:
+        context.close()
+
+
+def test_prefix_uploaded_once_per_run():
+    client = StandInContextCacheClient()
+    submissions = [f"print({i})" for i in range(20)]
+
+    results = _run(client, submissions)
+
+    assert all(result["status"] == "graded" for result in results)
+    assert len(client.uploads) == 1
+    assert "Reference Solution" in client.uploads[0]
+    assert client.deleted == ["cache-1"]
+    # Every call references the cached prefix and sends only the student's part
+    assert len(client.prompts) == len(submissions)
+    assert all(handle == "cache-1" for handle, _ in client.prompts)
+    assert all("Reference Solution" not in prompt for _, prompt in client.prompts)
+
+    # A second run registers its own prefix
+    _run(client, submissions)
+    assert len(client.uploads) == 2
+
+
+if __name__ == '__main__':
+    if Config.PROMPT_CACHE_MIN_TOKENS > 5000:
+        print("✗ PROMPT_CACHE_MIN_TOKENS is too high for this check")
+        sys.exit(1)
+    test_prefix_uploaded_once_per_run()
+    print("✓ Prompt prefix uploaded exactly once per grading run")
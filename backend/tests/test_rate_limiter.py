@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Checks the rate governor: throttles cut the concurrency limit once per
+burst, successes grow it back, the limit is enforced, and a stopped run's
+waiters give up their place (no API calls)
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rate_limiter import RateGovernor, RunStopped, stop_on
+
+
+def _governor(concurrency):
+    # No RPM/TPM budgets and no cool-down, so only the concurrency limit applies
+    return RateGovernor(0, 0, initial_concurrency=concurrency, max_concurrency=8, cooldown_seconds=0)
+
+
+def test_aimd_concurrency_limit():
+    governor = _governor(4)
+    burst = [governor.acquire(), governor.acquire()]
+    for reservation in burst:
+        governor.release(reservation, throttled=True)
+    # One cut for the whole burst, not one per throttled request
+    assert governor.concurrency_limit == 2.0
+    assert governor.stats['throttled'] == 2
+
+    governor.release(governor.acquire())
+    assert governor.concurrency_limit == 2.5
+
+
+def test_limit_is_enforced_and_stopped_waiters_leave():
+    governor = _governor(1)
+    held = governor.acquire()
+    stop = threading.Event()
+    outcome = []
+
+    def wait_for_slot():
+        with stop_on(stop):
+            try:
+                governor.acquire()
+                outcome.append("acquired")
+            except RunStopped:
+                outcome.append("stopped")
+
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    time.sleep(0.2)
+    assert outcome == []  # the only slot is taken
+
+    stop.set()
+    governor.wake()
+    waiter.join(timeout=2)
+    assert outcome == ["stopped"] and governor.stats['stopped_waits'] == 1
+    governor.release(held)
+    assert governor.snapshot()['in_flight'] == 0
+
+
+if __name__ == '__main__':
+    test_aimd_concurrency_limit()
+    test_limit_is_enforced_and_stopped_waiters_leave()
+    print("✓ Rate governor adapts and enforces its limits")
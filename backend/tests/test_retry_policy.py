@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Checks LLM error classification: status codes decide, and numbers that
+merely appear in a message do not (no API calls)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from llm_providers import InjectedServerError, InjectedThrottle, InjectedTimeout
+from retry_policy import FATAL, RETRYABLE, THROTTLED, classify_error
+
+
+class _ApiError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+def test_status_codes_decide():
+    assert classify_error(InjectedThrottle()) == THROTTLED
+    assert classify_error(InjectedServerError()) == RETRYABLE
+    assert classify_error(InjectedTimeout("Request timed out")) == RETRYABLE
+    assert classify_error(_ApiError("API key not valid", 403)) == FATAL
+    # The code wins over a misleading message
+    assert classify_error(_ApiError("prompt mentions 503 and quota", 400)) == FATAL
+
+
+def test_numbers_in_messages_are_not_statuses():
+    assert classify_error(ValueError("Score 500 exceeds maximum 100")) == FATAL
+    assert classify_error(ValueError("Expected 429 tokens, got 12")) == FATAL
+    assert classify_error(RuntimeError("503 Service Unavailable")) == RETRYABLE
+    assert classify_error(RuntimeError("upstream returned status code: 502")) == RETRYABLE
+    assert classify_error(RuntimeError("429 Too Many Requests")) == THROTTLED
+
+
+if __name__ == '__main__':
+    test_status_codes_decide()
+    test_numbers_in_messages_are_not_statuses()
+    print("✓ LLM errors are classified by status code")
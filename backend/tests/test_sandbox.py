@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Checks the submission sandbox: outputs are compared per test case, and
+runaway, memory-hungry or networked programs fail their case instead of
+hanging the grader, and submissions cannot see the server's files or
+processes (no API calls; needs user namespaces)
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sandbox import SandboxLimits, run_case, run_submissions
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+LIMITS = SandboxLimits(cpu_seconds=1, wall_seconds=2, memory_mb=256)
+
+CASES = [
+    {"name": "small", "stdin": "2\n", "expected_stdout": "4", "points": 1},
+    {"name": "large", "stdin": "50\n", "expected_stdout": "100", "points": 2}
+]
+
+
+def test_outputs_are_compared_per_case():
+    results = run_submissions(
+        [("right", "print(int(input()) * 2)\n"), ("wrong", "print(4)\n")],
+        CASES, LIMITS, workers=2
+    )
+    assert results["right"]["passed"] == 2 and results["right"]["points"] == 3
+    assert results["wrong"]["passed"] == 1 and results["wrong"]["points"] == 1
+    assert results["wrong"]["cases"][1]["stdout"].strip() == "4"
+
+
+def test_runaway_programs_are_stopped():
+    assert run_case("while True: pass\n", limits=LIMITS)["passed"] is False
+    slept = run_case("import time\ntime.sleep(30)\n", limits=LIMITS)
+    assert slept["timed_out"] and slept["duration_seconds"] < 10
+    assert "MemoryError" in run_case("data = [0] * 10 ** 9\n", limits=LIMITS)["stderr"]
+
+
+def test_network_is_blocked():
+    # The low-level module too: there is simply no network in the namespace
+    result = run_case("import _socket\n_socket.socket().connect(('1.1.1.1', 80))\n", limits=LIMITS)
+    assert result["passed"] is False
+    assert "unreachable" in result["stderr"]
+
+
+def test_server_files_are_out_of_reach():
+    config_path = os.path.abspath(os.path.join(BACKEND, 'config.py'))
+    result = run_case(f"print(open({config_path!r}).read())\n", limits=LIMITS)
+    assert result["passed"] is False and "FileNotFoundError" in result["stderr"]
+    # The standard library is visible but read-only
+    result = run_case("import os\nopen(os.__file__, 'a')\n", limits=LIMITS)
+    assert result["passed"] is False and "Read-only file system" in result["stderr"]
+
+
+def test_host_processes_are_out_of_reach():
+    host = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    try:
+        result = run_case(f"import os, signal\nos.kill({host.pid}, signal.SIGKILL)\n", limits=LIMITS)
+        assert "ProcessLookupError" in result["stderr"]
+        run_case("import os\nos.kill(-1, 9)\n", limits=LIMITS)
+        assert host.poll() is None
+    finally:
+        host.kill()
+        host.wait()
+
+    # A child that leaves the process group still dies with the submission
+    code = ("import os, time\n"
+            "if os.fork() == 0:\n"
+            "    os.setsid()\n"
+            "    while True:\n"
+            "        print('alive', flush=True)\n"
+            "        time.sleep(0.1)\n"
+            "time.sleep(30)\n")
+    result = run_case(code, limits=LIMITS)
+    assert result["timed_out"] and "alive" in result["stdout"]
+    time.sleep(0.5)
+    leftover = subprocess.run(['pgrep', '-f', '/work/submission.py'], capture_output=True, text=True).stdout
+    assert leftover.strip() == ""
+
+
+if __name__ == '__main__':
+    test_outputs_are_compared_per_case()
+    test_runaway_programs_are_stopped()
+    test_network_is_blocked()
+    test_server_files_are_out_of_reach()
+    test_host_processes_are_out_of_reach()
+    print("✓ Sandbox isolates submissions")
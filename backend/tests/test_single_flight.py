@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Checks single-flight coalescing: concurrent identical requests run the
+work once and share its result or its exception, and cross-process lock
+files are cleaned up and never waited on forever (no API calls)
+"""
+
+import os
+import fcntl
+import hashlib
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def work():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "graded"
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        leader = executor.submit(flight.do, "same", work)
+        started.wait()
+        followers = [executor.submit(flight.do, "same", work) for _ in range(4)]
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert len(calls) == 1
+    assert results[0] == ("graded", False)
+    assert all(result == ("graded", True) for result in results[1:])
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_errors_are_shared_and_not_remembered():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise TimeoutError("provider timed out")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, "key", fail)
+        started.wait()
+        follower = executor.submit(flight.do, "key", fail)
+        for future in (leader, follower):
+            try:
+                future.result()
+                assert False, "expected TimeoutError"
+            except TimeoutError:
+                pass
+
+    # A later call runs again instead of replaying the failure
+    assert flight.do("key", lambda: "ok") == ("ok", False)
+
+
+
+def test_lock_files_are_removed_and_waits_are_bounded():
+    lock_dir = tempfile.mkdtemp()
+    flight = SingleFlight(lock_dir, lock_timeout=0.3)
+    assert flight.do("a", lambda: 1, recheck=lambda: None) == (1, False)
+    assert flight.do("b", lambda: 2, recheck=lambda: None) == (2, False)
+    assert os.listdir(lock_dir) == []
+
+    # Another "process" holds the key's lock and never lets go
+    path = os.path.join(lock_dir, hashlib.sha256(b"stuck").hexdigest() + '.lock')
+    with open(path, 'a') as holder:
+        fcntl.flock(holder, fcntl.LOCK_EX)
+        started = time.monotonic()
+        assert flight.do("stuck", lambda: "done anyway", recheck=lambda: None) == ("done anyway", False)
+        assert time.monotonic() - started < 2
+    assert flight.stats()["lock_timeouts"] == 1
+
+
+if __name__ == '__main__':
+    test_concurrent_calls_share_one_result()
+    test_errors_are_shared_and_not_remembered()
+    test_lock_files_are_removed_and_waits_are_bounded()
+    print("✓ Single-flight coalesces concurrent requests")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Checks streamed reference-solution generation: concurrent requests for the
+same solution share one generation (streamed or not), and the model call is
+reported to call_metrics (offline provider, temporary SQLite database, no
+API calls)
+"""
+
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stream.db'))
+os.environ.setdefault('GEMINI_API_KEY', '')
+
+from app import app
+from models import db, Professor, Subject, Assignment, ReferenceSolution
+import ai_service
+import call_metrics
+from llm_providers import OfflineProvider
+
+
+def _assignment():
+    db.create_all()
+    professor = Professor(name='Stream Test', email=f'stream{datetime.utcnow().timestamp()}@example.com')
+    db.session.add(professor)
+    db.session.commit()
+    subject = Subject(name='Stream', code=f'S{professor.id}', professor_id=professor.id)
+    db.session.add(subject)
+    db.session.commit()
+    assignment = Assignment(title='Double', description='Print twice the input', professor_id=professor.id,
+                            subject_id=subject.id, max_points=10)
+    db.session.add(assignment)
+    db.session.commit()
+    return assignment.id
+
+
+def _with_provider(provider):
+    def decorate(test):
+        def run():
+            saved = ai_service.llm_provider
+            ai_service.llm_provider = provider
+            try:
+                with app.app_context():
+                    test()
+            finally:
+                ai_service.llm_provider = saved
+        run.__name__ = test.__name__
+        return run
+    return decorate
+
+
+def _solution_request(assignment_id, streamed, results):
+    with app.app_context(), call_metrics.collect() as calls:
+        assignment = db.session.get(Assignment, assignment_id)
+        if streamed:
+            events = list(ai_service.stream_reference_solution(assignment, 'Correctness', 10))
+            deltas = [data for event, data in events if event == 'delta']
+            results.append(("stream", events[-1][1]["solution"], events[-1][1]["reused"], len(deltas), calls))
+        else:
+            solution, _, shared = ai_service.get_reference_solution(assignment, 'Correctness', 10)
+            results.append(("plain", solution, shared, None, calls))
+
+
+@_with_provider(OfflineProvider(latency_seconds=0.5))
+def test_concurrent_requests_share_one_generation():
+    assignment_id = _assignment()
+    results = []
+    requests = [threading.Thread(target=_solution_request, args=(assignment_id, streamed, results))
+                for streamed in (True, True, False)]
+    for request in requests:
+        request.start()
+    for request in requests:
+        request.join()
+
+    assert len({solution for _, solution, _, _, _ in results}) == 1
+    assert sum(1 for _, _, shared, _, _ in results if not shared) == 1
+    assert ReferenceSolution.query.filter_by(assignment_id=assignment_id).count() == 1
+    # One model call in all, the others are reported as coalesced
+    records = [record for *_, calls in results for record in calls]
+    assert [record["status"] for record in records].count("ok") == 1
+    assert [record["status"] for record in records].count("coalesced") == 2
+    assert all(record["purpose"] == "solution" for record in records)
+    # A stream that waited on another request gets the solution in one piece
+    for kind, _, shared, deltas, _ in results:
+        if kind == "stream" and shared:
+            assert deltas == 1
+
+
+@_with_provider(OfflineProvider(error_rate=1.0, error_kind="throttle"))
+def test_failed_stream_is_recorded():
+    assignment_id = _assignment()
+    assignment = db.session.get(Assignment, assignment_id)
+    with call_metrics.collect() as calls:
+        try:
+            list(ai_service.stream_reference_solution(assignment, 'Correctness', 10))
+            assert False, "expected the injected error"
+        except Exception as e:
+            assert type(e).__name__ == "InjectedThrottle"
+    assert len(calls) == 1 and calls[0]["status"] == "error" and calls[0]["purpose"] == "solution"
+    assert ReferenceSolution.query.filter_by(assignment_id=assignment_id).count() == 0
+
+
+if __name__ == '__main__':
+    test_concurrent_requests_share_one_generation()
+    test_failed_stream_is_recorded()
+    print("✓ Streamed solutions are coalesced and instrumented")
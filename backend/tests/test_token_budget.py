@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Checks token budgeting: trimming removes only what cannot affect the
+grade, and oversized submissions are split along top-level definitions
+into chunks that fit the budget (no API calls)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rate_limiter import estimate_tokens
+from token_budget import MAX_COMMENT_BLOCK_LINES, plan_submission, trim_source
+
+
+def test_trimming_keeps_the_code():
+    code = "\n".join(
+        ["# license line"] * 40 + ["", "", "", "", "DATA = '" + "x" * 5000 + "'", "print(len(DATA))"]
+    )
+    trimmed = trim_source(code)
+    assert "print(len(DATA))" in trimmed
+    assert trimmed.count("# license line") == MAX_COMMENT_BLOCK_LINES - 1
+    assert "comment lines trimmed" in trimmed and "characters of data trimmed" in trimmed
+    assert "\n\n\n" not in trimmed
+    assert trim_source(trimmed) == trimmed
+    assert trim_source("ok\x00\x00binary").startswith("# [binary content removed")
+
+
+def test_large_submissions_are_chunked_by_function():
+    functions = [f"def f{i}():\n" + "".join(f"    x{j} = {j} * {i}\n" for j in range(30)) for i in range(12)]
+    code = "\n".join(functions)
+
+    small = plan_submission(functions[0], max_tokens=2000, chunk_tokens=500)
+    assert not small.chunked and small.chunks == [small.text]
+
+    budget = plan_submission(code, max_tokens=500, chunk_tokens=400)
+    assert budget.chunked and budget.original_tokens == estimate_tokens(code)
+    assert all(estimate_tokens(chunk) <= 400 for chunk in budget.chunks)
+    # No function is cut in half, and nothing is lost
+    assert all(chunk.lstrip().startswith("def f") for chunk in budget.chunks)
+    assert "\n".join(budget.chunks) == budget.text
+
+
+if __name__ == '__main__':
+    test_trimming_keeps_the_code()
+    test_large_submissions_are_chunked_by_function()
+    print("✓ Token budget trims and chunks submissions")
@@ -0,0 +1,177 @@
+"""
+Token budgeting for grading prompts.
+
+Student files are sent to the model verbatim, so one oversized or
+pasted-binary submission could exceed the context window or dominate
+latency. plan_submission() first trims content that does not affect the
+grade (long comment blocks, runs of blank lines, very long data lines,
+binary blobs). If the file is still over budget it splits it into chunks
+along top-level definitions, which ai_service grades map-reduce style.
+"""
+
+import ast
+import re
+
+from rate_limiter import estimate_tokens
+
+MAX_COMMENT_BLOCK_LINES = 15
+MAX_LINE_CHARS = 1000
+KEPT_LINE_CHARS = 200
+
+_BLANK_RUN = re.compile(r'\n(?:[ \t]*\n){2,}')
+
+
+class SubmissionBudget:
+    """Trimmed text of one submission and the chunks to grade it in"""
+
+    def __init__(self, text, original_tokens, chunks):
+        self.text = text
+        self.original_tokens = original_tokens
+        self.tokens = estimate_tokens(text)
+        self.chunks = chunks
+
+    @property
+    def chunked(self):
+        return len(self.chunks) > 1
+
+    def to_dict(self):
+        return {
+            "original_tokens": self.original_tokens,
+            "tokens": self.tokens,
+            "chunks": len(self.chunks)
+        }
+
+
+def _looks_binary(text):
+    if '\x00' in text:
+        return True
+    sample = text[:4096]
+    unprintable = sum(1 for char in sample if ord(char) < 32 and char not in '\n\r\t\f')
+    return bool(sample) and unprintable / len(sample) > 0.05
+
+
+def _trim_comment_blocks(lines):
+    out = []
+    block = []
+
+    def flush():
+        if len(block) > MAX_COMMENT_BLOCK_LINES:
+            indent = block[0][:len(block[0]) - len(block[0].lstrip())]
+            kept = MAX_COMMENT_BLOCK_LINES - 1
+            out.extend(block[:kept])
+            out.append(f"{indent}# ... ({len(block) - kept} comment lines trimmed)")
+        else:
+            out.extend(block)
+        block.clear()
+
+    for line in lines:
+        if line.lstrip().startswith('#'):
+            block.append(line)
+        else:
+            flush()
+            out.append(line)
+    flush()
+    return out
+
+
+def _trim_long_line(line):
+    if len(line) <= MAX_LINE_CHARS:
+        return line
+    return f"{line[:KEPT_LINE_CHARS]} ... [{len(line) - KEPT_LINE_CHARS} characters of data trimmed]"
+
+
+def trim_source(code):
+    """
+    Remove content that does not affect grading.
+
+    Comment blocks longer than MAX_COMMENT_BLOCK_LINES keep their first
+    lines, runs of blank lines collapse to one, lines longer than
+    MAX_LINE_CHARS (embedded data) are cut short with a marker, and binary
+    content is replaced by a note. Trimming an already trimmed file
+    changes nothing.
+    """
+    if not code:
+        return ""
+    if _looks_binary(code):
+        return f"# [binary content removed: {len(code)} characters, not valid source code]"
+    lines = [_trim_long_line(line) for line in code.replace('\r\n', '\n').split('\n')]
+    text = '\n'.join(_trim_comment_blocks(lines))
+    return _BLANK_RUN.sub('\n\n', text)
+
+
+def _split_points(text):
+    """Line numbers (0-based) where top-level statements start"""
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+    points = []
+    for node in tree.body:
+        start = node.lineno - 1
+        decorators = getattr(node, 'decorator_list', None)
+        if decorators:
+            start = min(start, min(d.lineno for d in decorators) - 1)
+        points.append(start)
+    return points
+
+
+def split_into_chunks(text, chunk_tokens):
+    """
+    Split source into consecutive pieces of roughly chunk_tokens each.
+
+    Splits fall between top-level statements when the file parses, so
+    functions stay whole unless a single one is bigger than a chunk, and
+    between lines otherwise.
+    """
+    lines = text.split('\n')
+    points = _split_points(text)
+    if points:
+        bounds = sorted(set([0] + points)) + [len(lines)]
+        units = ['\n'.join(lines[start:end]) for start, end in zip(bounds, bounds[1:]) if start < end]
+    else:
+        units = lines
+
+    # Oversized units (a huge function or line-based input) are split by lines
+    pieces = []
+    for unit in units:
+        if estimate_tokens(unit) <= chunk_tokens:
+            pieces.append(unit)
+            continue
+        current = []
+        for line in unit.split('\n'):
+            if current and estimate_tokens('\n'.join(current + [line])) > chunk_tokens:
+                pieces.append('\n'.join(current))
+                current = []
+            current.append(line)
+        if current:
+            pieces.append('\n'.join(current))
+
+    chunks = []
+    current = []
+    for piece in pieces:
+        if current and estimate_tokens('\n'.join(current + [piece])) > chunk_tokens:
+            chunks.append('\n'.join(current))
+            current = []
+        current.append(piece)
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks or [text]
+
+
+def plan_submission(code, max_tokens, chunk_tokens):
+    """
+    Trim a submission and decide how to send it.
+
+    Args:
+        code (str): Student source code
+        max_tokens (int): Largest submission sent in one grading prompt
+        chunk_tokens (int): Chunk size for submissions over max_tokens
+
+    Returns:
+        SubmissionBudget: .text to send whole, or .chunks to grade map-reduce
+    """
+    original_tokens = estimate_tokens(code)
+    text = trim_source(code)
+    if estimate_tokens(text) <= max_tokens:
+        return SubmissionBudget(text, original_tokens, [text])
+    return SubmissionBudget(text, original_tokens, split_into_chunks(text, chunk_tokens))
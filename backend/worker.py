@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Background worker: claims jobs from the grading_jobs table and runs them.
+
+Run it next to the web server, on as many hosts as needed:
+
+    python worker.py                  # Config.WORKER_PROCESSES processes
+    python worker.py --processes 4
+    python worker.py --once           # drain the queue, then exit
+
+Each process polls the database, so workers share nothing but the
+database. SIGTERM / Ctrl+C lets the current job finish before exiting.
+"""
+
+import argparse
+import multiprocessing
+import signal
+import sys
+import os
+import threading
+import time
+import traceback
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+
+_stop = threading.Event()
+
+
+def _request_stop(signum, frame):
+    if not _stop.is_set():
+        print(f"🛑 Worker {os.getpid()} stopping after the current job...", flush=True)
+    _stop.set()
+
+
+def _keep_alive(app, job_id, worker_id, done, lost):
+    """Refresh the job's heartbeat until done is set; set lost if the job was taken away"""
+    import job_queue
+    while not done.wait(Config.JOB_HEARTBEAT_SECONDS):
+        try:
+            with app.app_context():
+                owned = job_queue.heartbeat(job_id, worker_id)
+        except Exception as e:
+            print(f"⚠️  Heartbeat for job {job_id} failed: {e}", flush=True)
+            continue
+        if not owned:
+            # Requeued as stale (or finished elsewhere): another worker may be running it now
+            print(f"🧟 {worker_id} lost job {job_id}; stopping it", flush=True)
+            lost.set()
+            return
+
+
+def run_job(app, job, worker_id):
+    """Run one claimed job and record the outcome"""
+    import job_queue
+    print(f"🏗️  {worker_id} running {job.kind} job {job.id} (attempt {job.attempts}/{job.max_attempts})", flush=True)
+    from rate_limiter import RunStopped
+    done = threading.Event()
+    lost = threading.Event()
+    keep_alive = threading.Thread(target=_keep_alive, args=(app, job.id, worker_id, done, lost), daemon=True)
+    keep_alive.start()
+    started = time.perf_counter()
+    try:
+        report_id = job_queue.HANDLERS[job.kind](job, lost)
+        if lost.is_set():
+            raise RunStopped()
+        job_queue.complete(job, report_id)
+        print(f"✅ Job {job.id} {job.status} in {time.perf_counter() - started:.1f}s", flush=True)
+    except RunStopped:
+        # The job is someone else's now; record nothing on it
+        from models import db
+        db.session.rollback()
+        print(f"↩️  Job {job.id} abandoned after {time.perf_counter() - started:.1f}s", flush=True)
+    except Exception as e:
+        traceback.print_exc()
+        from models import db
+        db.session.rollback()
+        job_queue.fail(job, e)
+        print(f"❌ Job {job.id} failed: {e} (now {job.status})", flush=True)
+        import progress_events
+        progress_events.publish(job.assignment_id, 'error', {
+            "job_id": job.id,
+            "report_id": job.report_id,
+            "error": job.error,
+            "will_retry": job.status == job_queue.QUEUED
+        }, report_id=job.report_id)
+        db.session.commit()
+    finally:
+        done.set()
+        keep_alive.join()
+
+
+def work(index=0, once=False):
+    """Worker loop of one process"""
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    from app import app
+    from models import db
+    import job_queue
+
+    worker_id = job_queue.worker_name(index)
+    with app.app_context():
+        db.create_all()
+    print(f"👷 Worker {worker_id} polling for jobs", flush=True)
+
+    while not _stop.is_set():
+        with app.app_context():
+            job_queue.requeue_stale()
+            job = job_queue.claim_next(worker_id)
+            if job is not None:
+                run_job(app, job, worker_id)
+                continue
+        if once:
+            break
+        _stop.wait(Config.JOB_POLL_SECONDS)
+    print(f"👋 Worker {worker_id} exited", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background grading workers")
+    parser.add_argument('--processes', type=int, default=Config.WORKER_PROCESSES,
+                        help="worker processes on this host")
+    parser.add_argument('--once', action='store_true', help="exit when the queue is empty")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        work(0, args.once)
+        return
+
+    # Spawned (not forked) so no database connection or model client is shared
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=work, args=(i, args.once)) for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: [p.terminate() for p in processes if p.is_alive()])
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Children got the same Ctrl+C and finish their current job
+        for process in processes:
+            process.join()
+
+
+if __name__ == '__main__':
+    main()
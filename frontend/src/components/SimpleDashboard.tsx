@@ -234,6 +234,7 @@ const SimpleDashboard: React.FC = () => {
   // Solution modal state
   const [showSolutionModal, setShowSolutionModal] = useState(false);
   const [currentSolution, setCurrentSolution] = useState('');
+  const [isStreamingSolution, setIsStreamingSolution] = useState(false);
   const [isUploading, setIsUploading] = useState(false);
   const [uploadProgress, setUploadProgress] = useState(0);
   const [solutionChangeCount, setSolutionChangeCount] = useState(0);
@@ -736,6 +737,36 @@ const SimpleDashboard: React.FC = () => {
     setChatMessages(prev => [...prev, botMessage]);
   };
 
+  // Streams the reference solution into the review modal as it is generated
+  const streamSolution = (assignmentId: number, regenerate = false) =>
+    new Promise<{ solution: string; solution_version: number | null; reused: boolean }>((resolve, reject) => {
+      const query = regenerate ? '?regenerate=true' : '';
+      const source = new EventSource(`http://localhost:5002/api/generate-solution/${assignmentId}/stream${query}`);
+      setCurrentSolution('');
+      setIsStreamingSolution(true);
+      setShowSolutionModal(true);
+
+      source.addEventListener('delta', (event) => {
+        const { text } = JSON.parse((event as MessageEvent).data);
+        setCurrentSolution(prev => prev + text);
+      });
+      source.addEventListener('done', (event) => {
+        const result = JSON.parse((event as MessageEvent).data);
+        source.close();
+        setCurrentSolution(result.solution);
+        setIsStreamingSolution(false);
+        resolve(result);
+      });
+      // Fired for server-sent 'error' events (with data) and for dropped connections (without)
+      source.addEventListener('error', (event) => {
+        source.close();
+        setIsStreamingSolution(false);
+        setShowSolutionModal(false);
+        const data = (event as MessageEvent).data;
+        reject(new Error(data ? JSON.parse(data).error : 'Solution stream was interrupted'));
+      });
+    });
+
   // New 6-step workflow functions
   const startNewWorkflow = () => {
     setWorkflowStep('name');
@@ -798,22 +829,11 @@ const SimpleDashboard: React.FC = () => {
         return;
       }
       
-      // Generate new solution using the assignment ID
-      const solutionResponse = await fetch(`http://localhost:5002/api/generate-solution/${workflowData.assignmentId}`, {
-        method: 'POST'
-      });
-
-      if (!solutionResponse.ok) {
-        const errorData = await solutionResponse.json().catch(() => ({}));
-        throw new Error(errorData.error || `Solution generation failed with status ${solutionResponse.status}`);
-      }
-
-      const solutionResult = await solutionResponse.json();
+      // Stream a new solution into the review modal
+      const solutionResult = await streamSolution(workflowData.assignmentId, true);
       console.log('🔍 DEBUG: New solution generated successfully:', solutionResult);
       
       setWorkflowData(prev => ({ ...prev, solution: solutionResult.solution }));
-      setCurrentSolution(solutionResult.solution);
-      setShowSolutionModal(true);
       addBotMessage(`✅ **New Solution Generated!**\n\n**Step 3/7: Review Solution**\n\nPlease review the new solution in the popup window and choose your action.`);
       
     } catch (error) {
@@ -994,7 +1014,7 @@ const SimpleDashboard: React.FC = () => {
       }
 
       setWorkflowStep('complete');
-      addBotMessage(`🎉 **Assignment Creation Complete!**\n\nYour assignment has been successfully created and graded.\n\n**Summary:**\n• Assignment: ${workflowData.assignmentName}\n• Students Graded: Completed\n• Status: Ready for review\n\n**Next Steps:**\n• View grades in the assignment card\n• Download CSV reports\n• Review individual submissions\n\nType 'create' to start a new assignment workflow!`);
+      addBotMessage(`🎉 **Assignment Creation Complete!**\n\nYour assignment has been created and the submissions are being graded in the background.\n\n**Summary:**\n• Assignment: ${workflowData.assignmentName}\n• Grading: Queued\n• Status: Grades appear on the assignment card when grading finishes\n\n**Next Steps:**\n• View grades in the assignment card\n• Download CSV reports\n• Review individual submissions\n\nType 'create' to start a new assignment workflow!`);
       
       // Refresh assignments list
       const updatedAssignments = await fetchAssignmentsSorted();
@@ -1053,22 +1073,11 @@ const SimpleDashboard: React.FC = () => {
       console.log('🔍 DEBUG: Storing assignment ID:', uploadResult.assignment_id);
       setWorkflowData(prev => ({ ...prev, assignmentId: uploadResult.assignment_id }));
       
-      // Step 2: Generate solution using the assignment ID
-      const solutionResponse = await fetch(`http://localhost:5002/api/generate-solution/${uploadResult.assignment_id}`, {
-        method: 'POST'
-      });
-
-      if (!solutionResponse.ok) {
-        const errorData = await solutionResponse.json().catch(() => ({}));
-        throw new Error(errorData.error || `Solution generation failed with status ${solutionResponse.status}`);
-      }
-
-      const solutionResult = await solutionResponse.json();
+      // Step 2: Stream the solution into the review modal as it is generated
+      const solutionResult = await streamSolution(uploadResult.assignment_id);
       console.log('🔍 DEBUG: Solution generated successfully:', solutionResult);
       
       setWorkflowData(prev => ({ ...prev, solution: solutionResult.solution }));
-      setCurrentSolution(solutionResult.solution);
-      setShowSolutionModal(true);
       addBotMessage(`✅ **Solution Generated Successfully!**\n\n**Step 3/6: Review Solution**\n\nPlease review the solution in the popup window and choose your action.`);
       
     } catch (error) {
@@ -1101,21 +1110,10 @@ const SimpleDashboard: React.FC = () => {
           return;
         }
         
-        const solutionResponse = await fetch(`http://localhost:5002/api/generate-solution/${workflowData.assignmentId}`, {
-          method: 'POST'
-        });
-        
-        if (!solutionResponse.ok) {
-          const errorData = await solutionResponse.json().catch(() => ({}));
-          throw new Error(errorData.error || `Solution generation failed with status ${solutionResponse.status}`);
-        }
-
-        const solutionResult = await solutionResponse.json();
+        const solutionResult = await streamSolution(workflowData.assignmentId);
         console.log('Solution result:', solutionResult);
         
         setWorkflowData(prev => ({ ...prev, solution: solutionResult.solution }));
-        setCurrentSolution(solutionResult.solution);
-        setShowSolutionModal(true);
         addBotMessage(`✅ **Solution Generated Successfully!**\n\n**Step 3/6: Review Solution**\n\nPlease review the solution in the popup window and choose your action.`);
         
         setIsGeneratingSolution(false);
@@ -1267,57 +1265,56 @@ const SimpleDashboard: React.FC = () => {
       const startResult = await response.json();
       addBotMessage(`🚀 **Grading Started!**\n\n⏳ Processing ${startResult.total_submissions || 'multiple'} submissions...\n\nThis may take 2-4 minutes. I'll notify you when it's complete!`);
 
-      // Poll for grading status
-      const pollStatus = async () => {
-        try {
-          const statusResponse = await fetch(`http://localhost:5002/api/assignments/${assignmentId}/grading-status`);
-          if (statusResponse.ok) {
-            const status = await statusResponse.json();
-            
-            if (status.status === 'completed') {
-              // Grading complete!
-              setGradingProgress(100);
-              addBotMessage(`🎉 **Grading Complete!**\n\n✅ ${status.total_submissions} submissions graded\n📊 Average score: ${status.average_score?.toFixed(2)}%\n\nCheck the analytics dashboard for detailed insights!`);
-        
+      // Follow per-submission progress pushed by the server (no polling)
+      const source = new EventSource(`http://localhost:5002${startResult.events_url}`);
+      const finish = () => {
+        source.close();
+        setIsGrading(false);
+        setCurrentStep(0);
+      };
+
+      source.addEventListener('submission', (event) => {
+        const progress = JSON.parse((event as MessageEvent).data);
+        setGradingProgress(Math.min((progress.done / progress.total) * 100, 99));
+      });
+      source.addEventListener('finished', async (event) => {
+        const status = JSON.parse((event as MessageEvent).data);
+        if (status.status === 'paused' || status.status === 'cancelled') {
+          addBotMessage(`⏹️ **Grading ${status.status}.**\n\n${status.graded} of ${status.total} submissions were graded before it stopped.`);
+          finish();
+          return;
+        }
+        setGradingProgress(100);
+        addBotMessage(`🎉 **Grading Complete!**\n\n✅ ${status.graded} of ${status.total} submissions graded\n📊 Average score: ${status.average_score?.toFixed(2)}%\n\nCheck the analytics dashboard for detailed insights!`);
+
         // Show notification
         if ('Notification' in window && Notification.permission === 'granted') {
           new Notification('Grading Complete!', {
-                  body: `Graded ${status.total_submissions} submissions with average score of ${status.average_score?.toFixed(2)}%`,
+            body: `Graded ${status.graded} submissions with average score of ${status.average_score?.toFixed(2)}%`,
             icon: '/logo192.png'
           });
         }
-              
-              // Refresh assignments list, class average and assignment averages after grading completion
-              const updatedAssignments = await fetchAssignmentsSorted();
-              fetchClassAverage();
-              fetchAssignmentAverages(updatedAssignments);
-              
-              setIsGrading(false);
-              setCurrentStep(0);
-              return;
-            } else if (status.status === 'processing') {
-              // Update progress
-              const progress = Math.min(status.progress_percentage || 0, 95);
-              setGradingProgress(progress);
-              
-              // Continue polling
-              setTimeout(pollStatus, 2000); // Poll every 2 seconds
-      } else {
-              throw new Error('Unexpected grading status: ' + status.status);
-            }
-          } else {
-            throw new Error('Failed to check grading status');
-      }
-    } catch (error) {
-          console.error('Status polling error:', error);
-          addBotMessage(`❌ **Status check failed:** ${error instanceof Error ? error.message : 'Unknown error'}\n\nGrading may still be in progress. Please refresh the page to check.`);
-          setIsGrading(false);
-          setCurrentStep(0);
-        }
-      };
+        finish();
 
-      // Start polling after a short delay
-      setTimeout(pollStatus, 1000);
+        // Refresh assignments list, class average and assignment averages after grading completion
+        const updatedAssignments = await fetchAssignmentsSorted();
+        fetchClassAverage();
+        fetchAssignmentAverages(updatedAssignments);
+      });
+      // Server-sent 'error' events carry data; without data the browser reconnects on its own
+      source.addEventListener('error', (event) => {
+        const data = (event as MessageEvent).data;
+        if (!data) {
+          return;
+        }
+        const failure = JSON.parse(data);
+        if (failure.will_retry) {
+          addBotMessage(`⚠️ **Grading hit a problem and will retry:** ${failure.error}`);
+          return;
+        }
+        addBotMessage(`❌ **Grading failed:** ${failure.error}\n\nPlease try again.`);
+        finish();
+      });
 
     } catch (error) {
       console.error('Grading error:', error);
@@ -2252,7 +2249,9 @@ const SimpleDashboard: React.FC = () => {
                 🤖 AI Generated Solution
                 </h3>
               <p className="text-gray-600 dark:text-gray-400 mt-1">
-                Review the solution and approve or request changes
+                {isStreamingSolution
+                  ? 'Generating the solution...'
+                  : 'Review the solution and approve or request changes'}
               </p>
               </div>
             
@@ -2260,6 +2259,7 @@ const SimpleDashboard: React.FC = () => {
               <div className="bg-gray-50 dark:bg-gray-900 rounded-lg p-4">
                 <pre className="text-sm text-gray-800 dark:text-gray-200 whitespace-pre-wrap">
                   {currentSolution}
+                  {isStreamingSolution && <span className="animate-pulse">▍</span>}
                 </pre>
               </div>
             </div>
@@ -2267,13 +2267,15 @@ const SimpleDashboard: React.FC = () => {
             <div className="p-6 border-t border-gray-200 dark:border-gray-700 flex space-x-3">
               <button
                 onClick={approveSolution}
-                className="flex-1 bg-green-500 hover:bg-green-600 text-white px-3 py-1.5 rounded-md font-medium transition-colors"
+                disabled={isStreamingSolution}
+                className="flex-1 bg-green-500 hover:bg-green-600 disabled:opacity-50 disabled:cursor-not-allowed text-white px-3 py-1.5 rounded-md font-medium transition-colors"
               >
                 ✅ Accept
               </button>
               <button
                 onClick={requestSolutionChange}
-                className="flex-1 bg-orange-500 hover:bg-orange-600 text-white px-3 py-1.5 rounded-md font-medium transition-colors"
+                disabled={isStreamingSolution}
+                className="flex-1 bg-orange-500 hover:bg-orange-600 disabled:opacity-50 disabled:cursor-not-allowed text-white px-3 py-1.5 rounded-md font-medium transition-colors"
               >
                 🔄 Reject & Regenerate
               </button>
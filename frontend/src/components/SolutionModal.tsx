@@ -6,6 +6,7 @@ interface SolutionModalProps {
   isOpen: boolean;
   onClose: () => void;
   solution: string;
+  isStreaming?: boolean;
   onApprove: () => void;
   onRequestChange: () => void;
 }
@@ -14,6 +15,7 @@ const SolutionModal: React.FC<SolutionModalProps> = ({
   isOpen,
   onClose,
   solution,
+  isStreaming = false,
   onApprove,
   onRequestChange
 }) => {
@@ -36,7 +38,7 @@ const SolutionModal: React.FC<SolutionModalProps> = ({
         {/* Header */}
         <div className="flex items-center justify-between p-6 border-b border-gray-200 dark:border-gray-700">
           <h2 className="text-2xl font-bold text-gray-900 dark:text-white">
-            Review Generated Solution
+            {isStreaming ? 'Generating Solution...' : 'Review Generated Solution'}
           </h2>
           <button
             onClick={onClose}
@@ -51,6 +53,7 @@ const SolutionModal: React.FC<SolutionModalProps> = ({
           <div className="bg-gray-50 dark:bg-gray-900 rounded-lg p-4">
             <pre className="whitespace-pre-wrap text-sm text-gray-800 dark:text-gray-200 font-mono">
               {solution}
+              {isStreaming && <span className="animate-pulse">▍</span>}
             </pre>
           </div>
         </div>
@@ -59,14 +62,16 @@ const SolutionModal: React.FC<SolutionModalProps> = ({
         <div className="flex justify-end space-x-3 p-6 border-t border-gray-200 dark:border-gray-700">
           <button
             onClick={onRequestChange}
-            className="flex items-center space-x-2 px-4 py-2 text-gray-600 dark:text-gray-300 hover:text-gray-800 dark:hover:text-white transition-colors"
+            disabled={isStreaming}
+            className="flex items-center space-x-2 px-4 py-2 disabled:opacity-50 text-gray-600 dark:text-gray-300 hover:text-gray-800 dark:hover:text-white transition-colors"
           >
             <RefreshCw className="w-4 h-4" />
             <span>Request Changes</span>
           </button>
           <button
             onClick={onApprove}
-            className="flex items-center space-x-2 px-6 py-2 bg-green-500 hover:bg-green-600 text-white rounded-lg transition-colors"
+            disabled={isStreaming}
+            className="flex items-center space-x-2 px-6 py-2 disabled:opacity-50 bg-green-500 hover:bg-green-600 text-white rounded-lg transition-colors"
           >
             <Check className="w-4 h-4" />
             <span>Approve Solution</span>